@@ -16,7 +16,9 @@ class CustomUserAdmin(UserAdmin):
         (None, {'fields': ('user_id', 'username', 'password')}),
         ('Персональная информация', {'fields': ('first_name', 'last_name', 'middle_name',
                                                 'email', 'phone', 'country', 'passport_number')}),
-        ('Реферальная информация', {'fields': ('referral_code', 'referral_link', 'referrer')}),
+        ('Реферальная информация', {'fields': ('referral_code', 'referral_link', 'referrer',
+                                                'referral_path', 'referral_depth', 'referral_downline_count',
+                                                'referral_tree_changed_at')}),
         ('Верификация', {'fields': ('is_email_verified', 'email_verification_code',
                                     'email_verification_sent_at', 'is_terms_accepted')}),
         ('Статистика', {'fields': ('personal_volume', 'group_volume', 'earnings',
@@ -29,7 +31,9 @@ class CustomUserAdmin(UserAdmin):
 
     # Поля только для чтения
     readonly_fields = ('user_id', 'referral_code', 'referral_link', 'date_joined',
-                       'registration_date', 'email_verification_sent_at')
+                       'registration_date', 'email_verification_sent_at',
+                       'referral_path', 'referral_depth', 'referral_downline_count',
+                       'referral_tree_changed_at')
 
     # Поля при создании пользователя
     add_fieldsets = (
@@ -0,0 +1,87 @@
+from collections import Counter, defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = 'Перестроение материализованных путей структуры рефералов (referral_path) и размеров структур'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Размер пачки для bulk_update (по умолчанию: 1000)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать количество расхождений, ничего не сохранять'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+
+        rows = list(CustomUser.objects.values_list(
+            'pk', 'referrer_id', 'referral_path', 'referral_depth', 'referral_downline_count'
+        ))
+        self.stdout.write(f'Пользователей: {len(rows)}')
+
+        known = {pk for pk, *_ in rows}
+        children = defaultdict(list)
+        roots = []
+        for pk, referrer_id, *_ in rows:
+            if referrer_id in known:
+                children[referrer_id].append(pk)
+            else:
+                roots.append(pk)
+
+        # Обход от корней; узлы, попавшие в цикл referrer, недостижимы
+        expected = {}
+        stack = [(pk, '/', 0) for pk in roots]
+        while stack:
+            pk, path, depth = stack.pop()
+            expected[pk] = (path, depth)
+            for child in children[pk]:
+                stack.append((child, f"{path}{pk}/", depth + 1))
+
+        cyclic = known - expected.keys()
+        if cyclic:
+            self.stdout.write(self.style.WARNING(
+                f'Обнаружен цикл в цепочке пригласивших: {sorted(cyclic)} — пути не изменены'
+            ))
+
+        downline = Counter()
+        for path, _depth in expected.values():
+            downline.update(int(pk) for pk in path.strip('/').split('/') if pk)
+
+        stale = [
+            CustomUser(
+                pk=pk,
+                referral_path=expected[pk][0],
+                referral_depth=expected[pk][1],
+                referral_downline_count=downline[pk],
+            )
+            for pk, _referrer_id, path, depth, count in rows
+            if pk in expected and (*expected[pk], downline[pk]) != (path, depth, count)
+        ]
+        self.stdout.write(f'Устаревших записей: {len(stale)}')
+
+        if dry_run or not stale:
+            return
+
+        with transaction.atomic():
+            CustomUser.objects.bulk_update(
+                stale,
+                ['referral_path', 'referral_depth', 'referral_downline_count'],
+                batch_size=batch_size,
+            )
+            # Структуры поменялись — сохранённые версии деревьев недействительны
+            CustomUser.objects.update(referral_tree_changed_at=timezone.now())
+
+        self.stdout.write(self.style.SUCCESS(f'Обновлено записей: {len(stale)}'))
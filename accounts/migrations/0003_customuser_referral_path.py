@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:48
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def fill_referral_paths(apps, schema_editor):
+    CustomUser = apps.get_model('accounts', 'CustomUser')
+
+    rows = list(CustomUser.objects.values_list('pk', 'referrer_id'))
+    known = {pk for pk, _ in rows}
+    children = defaultdict(list)
+    roots = []
+    for pk, referrer_id in rows:
+        if referrer_id in known:
+            children[referrer_id].append(pk)
+        else:
+            roots.append(pk)
+
+    paths = {}
+    queue = [(pk, '/', 0) for pk in roots]
+    while queue:
+        pk, path, depth = queue.pop()
+        paths[pk] = (path, depth)
+        for child in children[pk]:
+            queue.append((child, f"{path}{pk}/", depth + 1))
+
+    for pk, (path, depth) in paths.items():
+        CustomUser.objects.filter(pk=pk).update(referral_path=path, referral_depth=depth)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_customuser_user_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='referral_depth',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Глубина в структуре'),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='referral_path',
+            field=models.CharField(db_index=True, default='/', editable=False, max_length=2048, verbose_name='Путь в структуре'),
+        ),
+        migrations.RunPython(fill_referral_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:08
+
+from collections import Counter
+
+from django.db import migrations, models
+
+
+def fill_downline_counts(apps, schema_editor):
+    CustomUser = apps.get_model('accounts', 'CustomUser')
+
+    counts = Counter()
+    for path in CustomUser.objects.values_list('referral_path', flat=True).iterator():
+        counts.update(int(pk) for pk in path.strip('/').split('/') if pk)
+
+    users = [CustomUser(pk=pk, referral_downline_count=count) for pk, count in counts.items()]
+    CustomUser.objects.bulk_update(users, ['referral_downline_count'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_customuser_referral_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='referral_downline_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Участников в структуре'),
+        ),
+        migrations.RunPython(fill_downline_counts, migrations.RunPython.noop),
+    ]
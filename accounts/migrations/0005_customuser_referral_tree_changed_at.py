@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_customuser_referral_downline_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='referral_tree_changed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Изменение структуры'),
+        ),
+    ]
@@ -1,10 +1,19 @@
 from django.db import models
+from django.db.models import DEFERRED, Count, F, Value
+from django.db.models.functions import Concat, Substr
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
 from django.contrib.auth.models import AbstractUser
+from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
 import uuid
 from django.utils import timezone
 
 
+# Денормализованные поля структуры, которые ведёт сама модель
+REFERRAL_TREE_FIELDS = {'referral_path', 'referral_depth', 'referral_downline_count', 'referral_tree_changed_at'}
+
+
 class CustomUser(AbstractUser):
     # Основные поля
     user_id = models.CharField(
@@ -78,6 +87,36 @@ class CustomUser(AbstractUser):
         verbose_name='Реферальная ссылка'
     )
 
+    # Материализованный путь по цепочке пригласивших: "/1/5/23/" — pk всех
+    # предков от корня. Поддерево X — все, чей путь начинается с "{X.path}{X.pk}/"
+    referral_path = models.CharField(
+        max_length=2048,
+        default='/',
+        db_index=True,
+        editable=False,
+        verbose_name='Путь в структуре'
+    )
+    referral_depth = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Глубина в структуре'
+    )
+    # Размер всей структуры под пользователем; поддерживается при save/delete
+    # через список вышестоящих из referral_path
+    referral_downline_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Участников в структуре'
+    )
+    # Когда в структуре последний раз кто-то добавился, ушёл или переехал —
+    # версия дерева для обновлений графа (cabinet.services.tree_version)
+    referral_tree_changed_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Изменение структуры'
+    )
+
     # Статистические поля
     personal_volume = models.DecimalField(
         max_digits=10,
@@ -138,6 +177,12 @@ class CustomUser(AbstractUser):
         verbose_name='Тип пользователя'
     )
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Запоминаем исходного реферера, чтобы заметить перенос в другую ветку.
+        # Через __dict__ — чтобы не подгружать отложенное поле (тогда DEFERRED)
+        self._loaded_referrer_id = self.__dict__.get('referrer_id', DEFERRED)
+
     @property
     def is_store(self):
         """Проверяет, является ли пользователь магазином/продавцом"""
@@ -170,8 +215,117 @@ class CustomUser(AbstractUser):
         if not self.username:
             self.username = self.user_id
 
+        update_fields = kwargs.get('update_fields')
+        # Пригласивший не входит в явный update_fields — в базе он не меняется,
+        # значит и переноса нет (пока его не сохранят)
+        saves_referrer = update_fields is None or {'referrer', 'referrer_id'} & set(update_fields)
+        referrer_changed = bool(saves_referrer) and self._referrer_changed()
+        if referrer_changed:
+            old_prefix = self.referral_descendants_prefix
+            old_depth = self.referral_depth
+            old_ancestor_ids = self.get_referral_ancestor_ids()
+
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            # Путь и размер структуры меняются UPDATE-ами по чужим строкам, поэтому
+            # значения в памяти могут устареть — обычный save их не перезаписывает
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in REFERRAL_TREE_FIELDS
+                and field.attname not in deferred
+            ]
+
+        if self._state.adding or referrer_changed:
+            self._set_referral_path()
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'referral_path', 'referral_depth'}
+
+        adding = self._state.adding
         super().save(*args, **kwargs)
 
+        if adding:
+            _shift_downline_counts(self.get_referral_ancestor_ids(), 1)
+
+        if referrer_changed:
+            # Переносим всё поддерево одним UPDATE
+            new_prefix = self.referral_descendants_prefix
+            CustomUser.objects.filter(referral_path__startswith=old_prefix).update(
+                referral_path=Concat(Value(new_prefix), Substr('referral_path', len(old_prefix) + 1)),
+                referral_depth=F('referral_depth') + (self.referral_depth - old_depth),
+            )
+
+            # Ветка целиком уходит от старых вышестоящих к новым
+            moved = 1 + CustomUser.objects.filter(pk=self.pk).values_list(
+                'referral_downline_count', flat=True
+            ).get()
+            old_ids, new_ids = set(old_ancestor_ids), set(self.get_referral_ancestor_ids())
+            _shift_downline_counts(old_ids - new_ids, -moved)
+            _shift_downline_counts(new_ids - old_ids, moved)
+            # У общих вышестоящих размер тот же, но форма структуры изменилась
+            _shift_downline_counts(old_ids & new_ids, 0)
+
+        if saves_referrer:
+            self._loaded_referrer_id = self.__dict__.get('referrer_id', DEFERRED)
+
+    def _referrer_changed(self):
+        """Сменился ли пригласивший с момента загрузки из базы"""
+        if self._state.adding or 'referrer_id' in self.get_deferred_fields():
+            # Отложенное поле не загружали и не меняли
+            return False
+        loaded = self._loaded_referrer_id
+        if loaded is DEFERRED:
+            # Загружен без referrer_id, а затем поле прочитали или задали —
+            # исходное значение есть только в базе
+            loaded = CustomUser.objects.filter(pk=self.pk).values_list('referrer_id', flat=True).first()
+        return self.referrer_id != loaded
+
+    def _set_referral_path(self):
+        """Вычисление пути от корня структуры по пригласившему"""
+        if not self.referrer_id:
+            self.referral_path = '/'
+            self.referral_depth = 0
+            return
+
+        referrer = self.referrer
+        if self.pk and (referrer.pk == self.pk or referrer.is_referral_descendant_of(self)):
+            raise ValidationError('Нельзя назначить пригласившим участника собственной структуры')
+
+        self.referral_path = referrer.referral_descendants_prefix
+        self.referral_depth = referrer.referral_depth + 1
+
+    @property
+    def referral_descendants_prefix(self):
+        """Префикс пути, общий для всех участников структуры пользователя"""
+        return f"{self.referral_path}{self.pk}/"
+
+    def get_referral_ancestor_ids(self):
+        """pk всех вышестоящих от корня до непосредственного пригласившего"""
+        return [int(pk) for pk in self.referral_path.strip('/').split('/') if pk]
+
+    def get_referral_descendants(self):
+        """Вся структура пользователя (без него самого) — один индексный запрос"""
+        return CustomUser.objects.filter(referral_path__startswith=self.referral_descendants_prefix)
+
+    def is_referral_descendant_of(self, user):
+        """Находится ли пользователь в структуре user (без запросов в БД)"""
+        return self.referral_path.startswith(user.referral_descendants_prefix)
+
+    def get_referral_team_size(self):
+        """Количество участников во всей структуре"""
+        return self.get_referral_descendants().count()
+
+    def get_referral_level_counts(self):
+        """Количество партнёров по уровням структуры: {1: 10, 2: 35, ...}"""
+        rows = (
+            self.get_referral_descendants()
+            .values('referral_depth')
+            .annotate(count=Count('pk'))
+            .order_by('referral_depth')
+        )
+        return {row['referral_depth'] - self.referral_depth: row['count'] for row in rows}
+
     def get_full_referral_url(self, request=None):
         """Получение полной реферальной ссылки"""
         if request:
@@ -199,4 +353,44 @@ class CustomUser(AbstractUser):
 
     class Meta:
         verbose_name = 'Пользователь'
-        verbose_name_plural = 'Пользователи'
\ No newline at end of file
+        verbose_name_plural = 'Пользователи'
+
+
+def _shift_downline_counts(user_ids, delta):
+    """
+    Сдвигает referral_downline_count у вышестоящих одним UPDATE и отмечает
+    изменение их структуры (delta=0 — только отметка)
+    """
+    if not user_ids:
+        return
+    changes = {'referral_tree_changed_at': timezone.now()}
+    if delta:
+        changes['referral_downline_count'] = F('referral_downline_count') + delta
+    CustomUser.objects.filter(pk__in=list(user_ids)).update(**changes)
+
+
+@receiver(pre_delete, sender=CustomUser)
+def detach_referral_subtree(sender, instance, **kwargs):
+    """
+    При удалении пользователя его рефералы становятся корнями (referrer
+    обнуляется через SET_NULL) — поднимаем их поддеревья в корень.
+    Вышестоящие теряют и удалённого, и всю его ветку.
+
+    Путь и размер читаются из базы, а не из экземпляра: при удалении
+    queryset-ом (например, «удалить выбранные» в админке) предыдущий
+    удалённый мог уже поднять эту ветку в корень.
+    """
+    row = CustomUser.objects.filter(pk=instance.pk).values(
+        'referral_path', 'referral_depth', 'referral_downline_count'
+    ).first()
+    if row is None:
+        return
+    instance.referral_path = row['referral_path']
+    instance.referral_depth = row['referral_depth']
+    _shift_downline_counts(instance.get_referral_ancestor_ids(), -(row['referral_downline_count'] + 1))
+
+    prefix = instance.referral_descendants_prefix
+    CustomUser.objects.filter(referral_path__startswith=prefix).update(
+        referral_path=Concat(Value('/'), Substr('referral_path', len(prefix) + 1)),
+        referral_depth=F('referral_depth') - (instance.referral_depth + 1),
+    )
@@ -0,0 +1,182 @@
+import pytest
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+
+from accounts.models import CustomUser
+
+
+@pytest.fixture
+def network(network, create_partner):
+    """root → (a → (c → d), b)"""
+    network['d'] = create_partner(referrer=network['c'])
+    return network
+
+
+@pytest.mark.django_db
+def test_path_on_registration(network):
+    """Путь и глубина вычисляются при регистрации"""
+    root, a, d = network['root'], network['a'], network['d']
+
+    assert root.referral_path == '/'
+    assert root.referral_depth == 0
+    assert a.referral_path == f'/{root.pk}/'
+    assert d.referral_depth == 3
+    assert d.get_referral_ancestor_ids() == [root.pk, a.pk, network['c'].pk]
+
+
+@pytest.mark.django_db
+def test_subtree_queries(network, django_assert_num_queries):
+    """Членство, размер команды и уровни — без обхода дерева"""
+    root, a, b, d = network['root'], network['a'], network['b'], network['d']
+
+    with django_assert_num_queries(0):
+        assert d.is_referral_descendant_of(root)
+        assert d.is_referral_descendant_of(a)
+        assert not d.is_referral_descendant_of(b)
+        assert not root.is_referral_descendant_of(root)
+
+    with django_assert_num_queries(1):
+        assert root.get_referral_team_size() == 4
+
+    with django_assert_num_queries(1):
+        assert root.get_referral_level_counts() == {1: 2, 2: 1, 3: 1}
+
+
+@pytest.mark.django_db
+def test_referrer_change_moves_subtree(network, reload):
+    """Смена пригласившего переносит всё поддерево"""
+    root, b, c, d = network['root'], network['b'], network['c'], network['d']
+
+    c.referrer = b
+    c.save()
+
+    d = reload(d)
+    assert reload(c).referral_path == f'/{root.pk}/{b.pk}/'
+    assert d.referral_path == f'/{root.pk}/{b.pk}/{c.pk}/'
+    assert d.referral_depth == 3
+    assert d.is_referral_descendant_of(reload(b))
+    assert not d.is_referral_descendant_of(reload(network['a']))
+
+
+@pytest.mark.django_db
+def test_referrer_cycle_rejected(network):
+    """Нельзя назначить пригласившим участника своей структуры"""
+    a = network['a']
+    a.referrer = network['d']
+
+    with pytest.raises(ValidationError):
+        a.save()
+
+
+@pytest.mark.django_db
+def test_delete_detaches_subtree(network, reload):
+    """После удаления пригласившего его структура становится отдельным деревом"""
+    a, c, d = network['a'], network['c'], network['d']
+
+    a.delete()
+
+    assert reload(c).referral_path == '/'
+    assert reload(d).referral_path == f'/{c.pk}/'
+    assert reload(d).referral_depth == 1
+
+
+def downline_counts(network):
+    counts = dict(CustomUser.objects.values_list('pk', 'referral_downline_count'))
+    return {name: counts[user.pk] for name, user in network.items()}
+
+
+@pytest.mark.django_db
+def test_downline_count_maintained(network):
+    """Размер структуры обновляется при регистрации, переносе и удалении"""
+    assert downline_counts(network) == {'root': 4, 'a': 2, 'b': 0, 'c': 1, 'd': 0}
+
+    c = network['c']
+    c.referrer = network['b']
+    c.save()
+    assert downline_counts(network) == {'root': 4, 'a': 0, 'b': 2, 'c': 1, 'd': 0}
+
+    network.pop('b').delete()
+    assert downline_counts(network) == {'root': 1, 'a': 0, 'c': 1, 'd': 0}
+
+
+@pytest.mark.django_db
+def test_stale_instance_save_keeps_tree_fields(network, reload):
+    """save() устаревшего экземпляра не затирает путь и размер структуры"""
+    stale_d = reload(network['d'])
+    stale_a = reload(network['a'])
+
+    c = network['c']
+    c.referrer = network['b']
+    c.save()
+
+    stale_d.first_name = 'Dilshod'
+    stale_d.save()
+    stale_a.save()
+
+    assert reload(stale_d).referral_path == f"/{network['root'].pk}/{network['b'].pk}/{c.pk}/"
+    assert reload(stale_a).referral_downline_count == 0
+
+
+@pytest.mark.django_db
+def test_deferred_referrer_is_not_a_move(network, reload):
+    """Экземпляр без referrer_id (.only/.defer) сохраняется без переноса структуры"""
+    changed_at = reload(network['a']).referral_tree_changed_at
+    c = CustomUser.objects.only('pk', 'first_name').get(pk=network['c'].pk)
+    c.first_name = 'Sardor'
+    c.save()
+
+    assert reload(c).first_name == 'Sardor'
+    # Перенос отметил бы изменение структуры у вышестоящих
+    assert reload(network['a']).referral_tree_changed_at == changed_at
+    assert reload(network['d']).referral_path == f"/{network['root'].pk}/{network['a'].pk}/{c.pk}/"
+
+    # Задан после загрузки без поля — перенос по значению из базы
+    c = CustomUser.objects.defer('referrer').get(pk=c.pk)
+    c.referrer = network['b']
+    c.save()
+
+    assert reload(network['d']).referral_path == f"/{network['root'].pk}/{network['b'].pk}/{c.pk}/"
+    assert reload(network['a']).referral_downline_count == 0
+
+
+@pytest.mark.django_db
+def test_referrer_outside_update_fields_is_not_moved(network, reload):
+    """Пригласивший не попал в update_fields — путь остаётся по пригласившему в базе"""
+    root, a, b, c = network['root'], network['a'], network['b'], network['c']
+    c.referrer = b
+    c.first_name = 'Sardor'
+    c.save(update_fields=['first_name'])
+
+    saved = reload(c)
+    assert saved.referrer_id == a.pk
+    assert saved.referral_path == f'/{root.pk}/{a.pk}/'
+    assert reload(a).referral_downline_count == 2
+
+    # Полное сохранение всё же переносит
+    c.save()
+    assert reload(c).referral_path == f'/{root.pk}/{b.pk}/'
+    assert reload(network['d']).referral_path == f'/{root.pk}/{b.pk}/{c.pk}/'
+
+
+@pytest.mark.django_db
+def test_queryset_delete_of_ancestor_and_descendant(network, reload):
+    """Удаление пачкой: вышестоящие теряют каждого удалённого один раз"""
+    root, a, b, c, d = (network[name] for name in ('root', 'a', 'b', 'c', 'd'))
+    CustomUser.objects.filter(pk__in=[a.pk, c.pk]).delete()
+
+    assert reload(root).referral_downline_count == 1
+    assert reload(b).referral_path == f'/{root.pk}/'
+    assert (reload(d).referral_path, reload(d).referral_depth) == ('/', 0)
+
+
+@pytest.mark.django_db
+def test_rebuild_command(network, reload):
+    """Команда восстанавливает испорченные пути и размеры структур"""
+    CustomUser.objects.update(referral_path='/', referral_depth=0, referral_downline_count=0)
+
+    call_command('rebuild_referral_paths')
+
+    d = reload(network['d'])
+    assert d.referral_path == f"/{network['root'].pk}/{network['a'].pk}/{network['c'].pk}/"
+    assert d.referral_depth == 3
+    assert downline_counts(network) == {'root': 4, 'a': 2, 'b': 0, 'c': 1, 'd': 0}
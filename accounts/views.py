@@ -15,6 +15,7 @@ from django.conf import settings
 from django.utils import timezone
 from django.http import Http404
 
+from cabinet.services import activity_feed
 from cabinet.services.fastapi_service import FastAPIService
 from .models import CustomUser
 from .forms import ReferralRegistrationForm, EmailVerificationForm, LoginForm, ForgotPasswordForm
@@ -85,6 +86,8 @@ def referral_register_view(request, referral_link):
                 user.is_email_verified = True
                 user.save()
 
+                activity_feed.publish(user.username, activity_feed.JOIN)
+
                 # Регистрируем в FastAPI
                 service = FastAPIService()
                 referrer_id = user.referrer.username if user.referrer else None
@@ -138,6 +141,8 @@ def verify_email_view(request):
             user.email_verification_sent_at = None
             user.save()
 
+            activity_feed.publish(user.username, activity_feed.JOIN)
+
             service = FastAPIService()
             referrer_id = user.referrer.username if user.referrer else None
             data = service.add_user(user_id=user.username, referrer_id=referrer_id)
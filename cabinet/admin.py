@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import MonthlyReport, News, Purchase
+from .models import BestExtraBonus, MonthlyReport, MonthlyReportJob, MonthlyTreeSnapshot, News, Purchase
 
 
 @admin.register(Purchase)
@@ -44,6 +44,30 @@ class MonthlyReportAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(BestExtraBonus)
+class BestExtraBonusAdmin(admin.ModelAdmin):
+    list_display = ('user', 'extra_bonus', 'rank', 'year', 'month', 'prior_rank', 'updated_at')
+    search_fields = ('user__username',)
+    readonly_fields = ('updated_at',)
+
+
+@admin.register(MonthlyReportJob)
+class MonthlyReportJobAdmin(admin.ModelAdmin):
+    list_display = ('owner', 'year', 'month', 'status', 'total', 'created_at', 'finished_at')
+    list_filter = ('status', 'year', 'month')
+    search_fields = ('owner__username',)
+    readonly_fields = ('created_at', 'updated_at', 'finished_at')
+
+
+@admin.register(MonthlyTreeSnapshot)
+class MonthlyTreeSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('owner', 'year', 'month', 'size', 'updated_at')
+    list_filter = ('year', 'month')
+    search_fields = ('owner__username',)
+    exclude = ('data',)
+    readonly_fields = ('size', 'created_at', 'updated_at')
+
+
 @admin.register(News)
 class NewsAdmin(admin.ModelAdmin):
     list_display = ('title', 'date', 'is_published')
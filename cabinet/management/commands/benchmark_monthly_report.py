@@ -0,0 +1,56 @@
+import time
+import uuid
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import CustomUser
+from cabinet.services import monthly_report
+
+
+class Command(BaseCommand):
+    # На SQLite upsert дробится по лимиту параметров запроса (~40 строк),
+    # на PostgreSQL — пачками по 500 строк
+    help = 'Количество SQL-запросов при сохранении месячных отчётов для структур разного размера'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[10, 100, 1000],
+            help='Размеры структуры (по умолчанию: 10 100 1000)'
+        )
+
+    def handle(self, *args, **options):
+        today = date.today()
+
+        for size in options['sizes']:
+            # Всё внутри транзакции с откатом — база не меняется
+            with transaction.atomic():
+                users = self._create_users(size)
+                statuses = {user.username: {'lo': 100, 'go': 500, 'qualification': 'Hamkor'} for user in users}
+
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    monthly_report.write_reports(users, statuses, today.year, today.month)
+                    elapsed = time.perf_counter() - started
+
+                transaction.set_rollback(True)
+
+            self.stdout.write(
+                f'{size:>6} пользователей: {len(queries)} запросов, {elapsed:.3f}с'
+            )
+
+    def _create_users(self, size):
+        users = []
+        for _ in range(size):
+            users.append(CustomUser.objects.create(
+                username=f'bench-{uuid.uuid4().hex[:12]}',
+                phone='+998900000000',
+                country='Узбекистан',
+                referrer=users[len(users) // 2] if users else None,
+            ))
+        return users
@@ -0,0 +1,44 @@
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from cabinet.services.fastapi_service import BATCH_UNSUPPORTED_KEY, FastAPIService
+from cabinet.services.fastapi_stub import FastAPIStub
+
+
+class Command(BaseCommand):
+    help = 'Сравнение пакетного и поштучного получения статусов на локальной заглушке FastAPI'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=2000,
+            help='Количество пользователей (по умолчанию: 2000)'
+        )
+        parser.add_argument(
+            '--latency',
+            type=float,
+            default=0.01,
+            help='Задержка ответа заглушки в секундах (по умолчанию: 0.01)'
+        )
+
+    def handle(self, *args, **options):
+        user_ids = [str(i).zfill(8) for i in range(1, options['users'] + 1)]
+
+        for batch in (True, False):
+            cache.delete(BATCH_UNSUPPORTED_KEY)
+
+            with FastAPIStub(batch=batch, latency=options['latency']) as stub:
+                started = time.perf_counter()
+                statuses = FastAPIService(base_url=stub.url).get_users_status_bulk(user_ids)
+                elapsed = time.perf_counter() - started
+
+            mode = 'batch' if batch else 'single'
+            self.stdout.write(
+                f'{mode:>6}: {len(statuses)} статусов за {elapsed:.2f}с, '
+                f'HTTP-запросов: {sum(stub.requests.values())}'
+            )
+
+        cache.delete(BATCH_UNSUPPORTED_KEY)
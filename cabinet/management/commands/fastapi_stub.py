@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+
+from cabinet.services.fastapi_stub import FastAPIStub
+
+
+class Command(BaseCommand):
+    help = 'Запуск локальной заглушки FastAPI-сервиса (для разработки и бенчмарков)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--host',
+            default='127.0.0.1',
+            help='Адрес (по умолчанию: 127.0.0.1)'
+        )
+        parser.add_argument(
+            '--port',
+            type=int,
+            default=8001,
+            help='Порт (по умолчанию: 8001)'
+        )
+        parser.add_argument(
+            '--no-batch',
+            action='store_true',
+            help='Не поддерживать пакетный маршрут /user/users/status/batch'
+        )
+        parser.add_argument(
+            '--latency',
+            type=float,
+            default=0.0,
+            help='Задержка ответа в секундах (по умолчанию: 0)'
+        )
+
+    def handle(self, *args, **options):
+        stub = FastAPIStub(
+            batch=not options['no_batch'],
+            latency=options['latency'],
+            host=options['host'],
+            port=options['port'],
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Заглушка FastAPI слушает {stub.url} '
+            f'(batch: {"нет" if options["no_batch"] else "да"}, задержка: {options["latency"]}с)'
+        ))
+        self.stdout.write(f'Запустите Django с FASTAPI_URL={stub.url}')
+
+        try:
+            stub.serve_forever()
+        except KeyboardInterrupt:
+            self.stdout.write('Остановка...')
+        finally:
+            stub.stop()
@@ -0,0 +1,88 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from cabinet.services import network_volume, status_cache
+
+
+class Command(BaseCommand):
+    help = (
+        'Локальный расчёт ГО, объёма боковых веток и структуры по уровням для всех партнёров '
+        'по ЛО из кеша статусов; --reconcile сверяет ГО с данными FastAPI'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--levels',
+            type=int,
+            default=5,
+            help='Сколько уровней структуры считать (по умолчанию: 5)'
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=10,
+            help='Сколько партнёров показать (по умолчанию: 10)'
+        )
+        parser.add_argument(
+            '--reconcile',
+            action='store_true',
+            help='Сравнить рассчитанный ГО с ГО из кеша статусов FastAPI'
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.01,
+            help='Допустимое расхождение ГО при сверке (по умолчанию: 0.01)'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        forest = network_volume.ReferralForest.load()
+        loaded = time.perf_counter()
+
+        statuses = status_cache.cached_statuses(forest.user_ids)
+        personal = forest.vector({user_id: st.get('lo') for user_id, st in statuses.items()})
+
+        volumes = network_volume.compute(forest, personal, levels=options['levels'])
+        computed = time.perf_counter()
+
+        self.stdout.write(
+            f'Партнёров: {len(forest)}, уровней: {len(forest.levels)}, статусов в кеше: {len(statuses)}; '
+            f'загрузка {loaded - started:.2f}с, расчёт {computed - loaded:.3f}с'
+        )
+
+        top = np.argsort(-volumes.group_volume, kind='stable')[:options['top']]
+        for i in top.tolist():
+            self.stdout.write(
+                f'  {forest.user_ids[i]}: ГО {volumes.group_volume[i]:.2f}, '
+                f'боковой объём {volumes.side_volume[i]:.2f}, структура {volumes.team_size[i]}, '
+                f'по уровням {volumes.level_counts[i].tolist()}'
+            )
+
+        if options['reconcile']:
+            self.reconcile(forest, volumes, statuses, options['tolerance'])
+
+    def reconcile(self, forest, volumes, statuses, tolerance):
+        known = [
+            (i, float(statuses[user_id].get('go', 0) or 0))
+            for i, user_id in enumerate(forest.user_ids)
+            if statuses.get(user_id)
+        ]
+        mismatched = [
+            (forest.user_ids[i], upstream, float(volumes.group_volume[i]))
+            for i, upstream in known
+            if abs(volumes.group_volume[i] - upstream) > tolerance
+        ]
+
+        if not mismatched:
+            self.stdout.write(self.style.SUCCESS(f'ГО совпадает с FastAPI у всех {len(known)} партнёров'))
+            return
+
+        self.stdout.write(self.style.WARNING(
+            f'ГО расходится с FastAPI у {len(mismatched)} из {len(known)} партнёров'
+        ))
+        mismatched.sort(key=lambda row: abs(row[2] - row[1]), reverse=True)
+        for user_id, upstream, local in mismatched[:20]:
+            self.stdout.write(f'  {user_id}: FastAPI {upstream:.2f}, локально {local:.2f}')
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from cabinet.services import extra_bonus
+
+
+class Command(BaseCommand):
+    help = 'Заполнение таблицы лучших доп. бонусов (BestExtraBonus) по истории месячных отчётов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Размер пачки чтения и записи (по умолчанию: 1000)'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            written = extra_bonus.rebuild(batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(f'Записано лучших доп. бонусов: {written}'))
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cabinet.services import structure_merkle
+from cabinet.services.fastapi_service import FastAPIService, HashesNotSupported
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверка структуры рефералов с FastAPI по хешам поддеревьев: спуск только '
+        'в расходящиеся ветки, список исправлений; --repair регистрирует недостающих'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repair',
+            action='store_true',
+            help='Зарегистрировать в FastAPI пользователей, которых там нет'
+        )
+        parser.add_argument(
+            '--show',
+            type=int,
+            default=20,
+            help='Сколько исправлений каждого вида показать (по умолчанию: 20)'
+        )
+
+    def handle(self, *args, **options):
+        service = FastAPIService()
+        try:
+            result = structure_merkle.reconcile(service)
+        except HashesNotSupported:
+            raise CommandError('FastAPI не поддерживает /user/users/structure/hashes — сверка по хешам невозможна')
+
+        summary = result.summary()
+        self.stdout.write(
+            f"Запросов к FastAPI: {summary['calls']}, сверено узлов: {summary['compared']}"
+        )
+        if result.in_sync:
+            self.stdout.write(self.style.SUCCESS('Структуры совпадают'))
+            return
+
+        sections = (
+            ('Нет в FastAPI', result.missing, lambda e: f"{e['user_id']} (пригласивший {e['referrer_id'] or '-'})"),
+            ('Другой пригласивший в FastAPI', result.wrong_referrer,
+             lambda e: f"{e['user_id']}: у нас {e['referrer_id'] or '-'}, в FastAPI {e['remote_referrer']}"),
+            ('Лишние в FastAPI', result.unexpected, lambda e: f"{e['user_id']} (пригласивший {e['remote_referrer']})"),
+        )
+        for title, entries, describe in sections:
+            if not entries:
+                continue
+            self.stdout.write(self.style.WARNING(f'{title}: {len(entries)}'))
+            for entry in entries[:options['show']]:
+                self.stdout.write(f'  {describe(entry)}')
+
+        if options['repair'] and result.missing:
+            fixed, failed = structure_merkle.repair(service, result)
+            self.stdout.write(self.style.SUCCESS(f'Зарегистрировано в FastAPI: {fixed}, ошибок: {failed}'))
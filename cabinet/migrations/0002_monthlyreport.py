@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cabinet', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyReport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField(verbose_name='Год')),
+                ('month', models.PositiveSmallIntegerField(verbose_name='Месяц')),
+                ('personal_volume', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Личный объём (LO)')),
+                ('group_volume', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Групповой объём (GO)')),
+                ('side_volume', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Боковой объём')),
+                ('points', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Баллы')),
+                ('veron', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Вероны')),
+                ('personal_bonus', models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Личный бонус')),
+                ('structure_bonus', models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Структурный бонус')),
+                ('mentor_bonus', models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Менторский бонус')),
+                ('extra_bonus', models.CharField(blank=True, default='', max_length=100, verbose_name='Доп. бонус')),
+                ('bonus_total', models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Суммарный бонус')),
+                ('personal_money', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Личный доход')),
+                ('group_money', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Групповой доход')),
+                ('leader_money', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Лидерский доход')),
+                ('side_vol_money', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Доход с бокового объёма')),
+                ('total_money', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Итого доход')),
+                ('total_income', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Общий доход')),
+                ('new_referrals', models.PositiveIntegerField(default=0, verbose_name='Новые рефералы')),
+                ('active_referrals_count', models.PositiveIntegerField(default=0, verbose_name='Активные рефералы')),
+                ('purchases_count', models.PositiveIntegerField(default=0, verbose_name='Количество заказов')),
+                ('purchases_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Сумма заказов')),
+                ('partner_level', models.CharField(blank=True, max_length=100, verbose_name='Уровень партнёра')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_reports', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Месячный отчёт',
+                'verbose_name_plural': 'Месячные отчёты',
+                'ordering': ['-year', '-month'],
+                'unique_together': {('user', 'year', 'month')},
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_customuser_referral_path'),
+        ('cabinet', '0003_monthlyreportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BestExtraBonus',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='best_extra_bonus', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('rank', models.PositiveSmallIntegerField(default=0, verbose_name='Лучший ранг')),
+                ('extra_bonus', models.CharField(blank=True, default='', max_length=100, verbose_name='Доп. бонус')),
+                ('year', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Год')),
+                ('month', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Месяц')),
+                ('prior_rank', models.PositiveSmallIntegerField(default=0, verbose_name='Лучший ранг до этого периода')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Лучший доп. бонус',
+                'verbose_name_plural': 'Лучшие доп. бонусы',
+            },
+        ),
+    ]
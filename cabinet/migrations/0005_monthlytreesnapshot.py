@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cabinet', '0004_bestextrabonus'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyTreeSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField(verbose_name='Год')),
+                ('month', models.PositiveSmallIntegerField(verbose_name='Месяц')),
+                ('size', models.PositiveIntegerField(default=0, verbose_name='Участников')),
+                ('data', models.BinaryField(verbose_name='Снимок (zlib)')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_tree_snapshots', to=settings.AUTH_USER_MODEL, verbose_name='Владелец структуры')),
+            ],
+            options={
+                'verbose_name': 'Снимок структуры за месяц',
+                'verbose_name_plural': 'Снимки структуры за месяц',
+                'ordering': ['-year', '-month'],
+                'unique_together': {('owner', 'year', 'month')},
+            },
+        ),
+    ]
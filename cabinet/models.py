@@ -73,6 +73,98 @@ class MonthlyReport(models.Model):
         unique_together = ('user', 'year', 'month')
 
 
+class BestExtraBonus(models.Model):
+    """
+    Лучший extra_bonus пользователя за историю отчётов — вместо сканирования
+    всех MonthlyReport. prior_rank — лучший ранг до периода year/month,
+    чтобы при пересохранении того же месяца сравнивать только с прошлыми.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='best_extra_bonus', verbose_name='Пользователь')
+    rank = models.PositiveSmallIntegerField(default=0, verbose_name='Лучший ранг')
+    extra_bonus = models.CharField(max_length=100, blank=True, default='', verbose_name='Доп. бонус')
+    year = models.PositiveSmallIntegerField(null=True, blank=True, verbose_name='Год')
+    month = models.PositiveSmallIntegerField(null=True, blank=True, verbose_name='Месяц')
+    prior_rank = models.PositiveSmallIntegerField(default=0, verbose_name='Лучший ранг до этого периода')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Обновлено')
+
+    class Meta:
+        verbose_name = 'Лучший доп. бонус'
+        verbose_name_plural = 'Лучшие доп. бонусы'
+
+    def __str__(self):
+        return f"{self.user} — {self.extra_bonus or '-'}"
+
+
+class MonthlyReportJob(models.Model):
+    """Фоновое сохранение месячных отчётов структуры с последующим сбросом FastAPI"""
+    STATUS_CHOICES = [
+        ('pending', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('done', 'Завершено'),
+        ('failed', 'Ошибка'),
+    ]
+
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='monthly_report_jobs', verbose_name='Инициатор')
+    year = models.PositiveSmallIntegerField(verbose_name='Год')
+    month = models.PositiveSmallIntegerField(verbose_name='Месяц')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name='Статус')
+    total = models.PositiveIntegerField(default=0, verbose_name='Пользователей в структуре')
+    error_message = models.TextField(blank=True, verbose_name='Ошибка')
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Последний прогресс')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='Дата завершения')
+
+    class Meta:
+        verbose_name = 'Задача месячного отчёта'
+        verbose_name_plural = 'Задачи месячных отчётов'
+        ordering = ['-created_at']
+        unique_together = ('owner', 'year', 'month')
+
+    def __str__(self):
+        return f"{self.owner} {self.month}/{self.year} ({self.get_status_display()})"
+
+
+class MonthlyReportJobItem(models.Model):
+    """Контрольная точка по пользователю: отчёт сохранён, данные FastAPI сброшены"""
+    job = models.ForeignKey(MonthlyReportJob, on_delete=models.CASCADE, related_name='items', verbose_name='Задача')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+', verbose_name='Пользователь')
+    saved_at = models.DateTimeField(null=True, blank=True, verbose_name='Отчёт сохранён')
+    reset_at = models.DateTimeField(null=True, blank=True, verbose_name='FastAPI сброшен')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Неудачных попыток')
+    last_error = models.CharField(max_length=255, blank=True, verbose_name='Последняя ошибка')
+
+    class Meta:
+        verbose_name = 'Пользователь задачи отчёта'
+        verbose_name_plural = 'Пользователи задачи отчёта'
+        unique_together = ('job', 'user')
+
+
+class MonthlyTreeSnapshot(models.Model):
+    """
+    Структура инициатора месячного отчёта на момент его завершения одним
+    блобом (services/tree_history.py): историческое дерево и сравнение
+    месяцев читаются без перебора строк MonthlyReport
+    """
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='monthly_tree_snapshots', verbose_name='Владелец структуры')
+    year = models.PositiveSmallIntegerField(verbose_name='Год')
+    month = models.PositiveSmallIntegerField(verbose_name='Месяц')
+    size = models.PositiveIntegerField(default=0, verbose_name='Участников')
+    data = models.BinaryField(verbose_name='Снимок (zlib)')
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Обновлено')
+
+    class Meta:
+        verbose_name = 'Снимок структуры за месяц'
+        verbose_name_plural = 'Снимки структуры за месяц'
+        ordering = ['-year', '-month']
+        unique_together = ('owner', 'year', 'month')
+
+    def __str__(self):
+        return f"{self.owner} {self.month}/{self.year} ({self.size})"
+
+
 class News(models.Model):
     title = models.CharField(max_length=200, verbose_name='Заголовок')
     content = models.TextField(verbose_name='Содержание')
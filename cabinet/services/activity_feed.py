@@ -0,0 +1,123 @@
+"""
+Лента событий структуры партнёра («последнее в вашей команде»).
+
+Fan-out при записи: событие (регистрация, изменение ЛО) задача Celery
+кладёт в ограниченный список Redis каждого вышестоящего — не дальше
+ACTIVITY_FEED_MAX_UPLINE уровней. Запись стоит O(глубина), чтение ленты —
+один LRANGE без обхода структуры.
+
+Событие — компактный JSON: тип, user_id, короткое имя, абсолютная глубина
+(уровень относительно читателя считается при чтении), значение и время.
+Если кеш не Redis (тесты, локальный запуск), списки хранятся обычными
+значениями кеша — без атомарности, но с тем же интерфейсом.
+"""
+import json
+import logging
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .cache_batch import redis_client
+from .tree_payload import get_short_name
+
+logger = logging.getLogger(__name__)
+
+JOIN = 'join'
+LO = 'lo'
+
+
+def feed_key(user_pk):
+    return f"feed:team:{user_pk}"
+
+
+def make_event(kind, user, value=None):
+    event = {
+        't':  kind,
+        'u':  user.user_id,
+        'n':  get_short_name(user),
+        'd':  user.referral_depth,
+        'ts': int(time.time()),
+    }
+    if value is not None:
+        event['v'] = value
+    return event
+
+
+def upline(user):
+    """pk вышестоящих от пригласившего вверх, не больше ACTIVITY_FEED_MAX_UPLINE"""
+    return list(reversed(user.get_referral_ancestor_ids()))[:settings.ACTIVITY_FEED_MAX_UPLINE]
+
+
+def push(ancestor_pks, event):
+    """Добавляет событие в начало лент и обрезает их до ACTIVITY_FEED_SIZE"""
+    if not ancestor_pks:
+        return 0
+
+    data = json.dumps(event, ensure_ascii=False, separators=(',', ':'))
+    size = settings.ACTIVITY_FEED_SIZE
+    ttl = settings.ACTIVITY_FEED_TTL
+
+    client = redis_client()
+    if client is not None:
+        pipe = client.pipeline(transaction=False)
+        for pk in ancestor_pks:
+            key = cache.make_key(feed_key(pk))
+            pipe.lpush(key, data)
+            pipe.ltrim(key, 0, size - 1)
+            pipe.expire(key, ttl)
+        pipe.execute()
+        return len(ancestor_pks)
+
+    keys = [feed_key(pk) for pk in ancestor_pks]
+    feeds = cache.get_many(keys)
+    cache.set_many({key: [data, *feeds.get(key, [])][:size] for key in keys}, timeout=ttl)
+    return len(ancestor_pks)
+
+
+def recent(user, limit=None):
+    """Последние события структуры user, новые первыми; level — уровень от user"""
+    limit = min(limit or settings.ACTIVITY_FEED_SIZE, settings.ACTIVITY_FEED_SIZE)
+
+    try:
+        client = redis_client()
+        if client is not None:
+            raw = client.lrange(cache.make_key(feed_key(user.pk)), 0, limit - 1)
+        else:
+            raw = (cache.get(feed_key(user.pk)) or [])[:limit]
+    except Exception as e:
+        logger.warning(f"Лента структуры {user.username} недоступна: {e}")
+        return []
+
+    events = []
+    for item in raw:
+        event = json.loads(item)
+        events.append({
+            'type':    event['t'],
+            'user_id': event['u'],
+            'name':    event['n'],
+            'level':   event['d'] - user.referral_depth,
+            'value':   event.get('v'),
+            'time':    datetime.fromtimestamp(event['ts'], tz=timezone.utc),
+        })
+    return events
+
+
+def publish(username, kind, value=None):
+    """
+    Ставит fan-out события в очередь Celery после коммита транзакции —
+    задача не прочитает ещё не сохранённого пользователя; ошибки брокера
+    не ломают запрос. username — идентификатор партнёра в FastAPI.
+    """
+    transaction.on_commit(lambda: _enqueue(username, kind, value))
+
+
+def _enqueue(username, kind, value):
+    from cabinet.tasks import fan_out_team_event
+
+    try:
+        fan_out_team_event.delay(username, kind, value)
+    except Exception as e:
+        logger.warning(f"Событие {kind} для {username} не поставлено в очередь: {e}")
@@ -0,0 +1,33 @@
+"""
+Пакетные операции с общим кешем, которых нет в API кеша Django.
+
+На Redis (django-redis) пачка ключей уходит одним pipeline — один round
+trip вместо одного на ключ. На других бэкендах кеша (тесты, локальный
+запуск) те же операции выполняются поштучно через cache.
+"""
+from django.core.cache import cache
+
+
+def redis_client():
+    """Клиент Redis из django-redis или None для других бэкендов кеша"""
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+    except (ImportError, NotImplementedError):
+        return None
+
+
+def add_many(values, timeout):
+    """
+    cache.add для каждого ключа {key: value} (SET NX): возвращает ключи,
+    которые были записаны, — то есть которых в кеше ещё не было
+    """
+    keys = list(values)
+    client = redis_client()
+    if client is None:
+        return [key for key in keys if cache.add(key, values[key], timeout=timeout)]
+
+    pipe = client.pipeline(transaction=False)
+    for key in keys:
+        cache.client.set(key, values[key], timeout=timeout, nx=True, client=pipe)
+    return [key for key, added in zip(keys, pipe.execute()) if added]
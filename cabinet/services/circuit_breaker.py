@@ -0,0 +1,153 @@
+"""
+Circuit breaker для upstream-сервисов с состоянием в общем кеше (Redis),
+чтобы все gunicorn-воркеры и Celery-процессы видели одно и то же состояние.
+
+closed    — запросы идут; ошибки считаются в окне failure_window
+open      — после failure_threshold ошибок запросы сразу отклоняются
+half-open — через recovery_timeout пропускается один пробный запрос:
+            успех закрывает цепь, ошибка снова её открывает
+"""
+import logging
+import time
+
+import httpx
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitOpenError(requests.RequestException):
+    """Upstream помечен недоступным — запрос не отправлялся"""
+
+
+class AsyncCircuitOpenError(httpx.TransportError):
+    """То же для httpx-клиента"""
+
+
+class CircuitBreaker:
+
+    def __init__(self, name, failure_threshold, failure_window, recovery_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.failure_window = failure_window
+        self.recovery_timeout = recovery_timeout
+
+    @property
+    def _failures_key(self):
+        return f"circuit:{self.name}:failures"
+
+    @property
+    def _opened_at_key(self):
+        return f"circuit:{self.name}:opened_at"
+
+    @property
+    def _probe_key(self):
+        return f"circuit:{self.name}:probe"
+
+    def _state_for(self, opened_at):
+        if opened_at is None:
+            return CLOSED
+        if time.time() - opened_at < self.recovery_timeout:
+            return OPEN
+        return HALF_OPEN
+
+    # ── sync ──
+
+    def state(self):
+        try:
+            return self._state_for(cache.get(self._opened_at_key))
+        except Exception as e:
+            logger.warning(f"Circuit {self.name}: кеш недоступен ({e}), считаем цепь закрытой")
+            return CLOSED
+
+    def is_open(self):
+        """Для вызывающих: True — лучше сразу взять данные из кеша"""
+        return self.state() == OPEN
+
+    def allow_request(self):
+        state = self.state()
+        if state == CLOSED:
+            return True
+        if state == OPEN:
+            return False
+        # half-open: пропускаем ровно один пробный запрос
+        try:
+            return cache.add(self._probe_key, 1, timeout=self.recovery_timeout)
+        except Exception:
+            return True
+
+    def record_success(self):
+        try:
+            if self.state() != CLOSED:
+                logger.info(f"Circuit {self.name}: upstream восстановлен, цепь закрыта")
+            cache.delete_many([self._failures_key, self._opened_at_key, self._probe_key])
+        except Exception as e:
+            logger.warning(f"Circuit {self.name}: не удалось записать успех ({e})")
+
+    def record_failure(self):
+        try:
+            cache.add(self._failures_key, 0, timeout=self.failure_window)
+            failures = cache.incr(self._failures_key)
+            if self.state() == HALF_OPEN or failures >= self.failure_threshold:
+                self._open()
+        except Exception as e:
+            logger.warning(f"Circuit {self.name}: не удалось записать ошибку ({e})")
+
+    def _open(self):
+        logger.warning(f"Circuit {self.name}: upstream недоступен, цепь открыта на {self.recovery_timeout}с")
+        cache.set(self._opened_at_key, time.time(), timeout=None)
+        cache.delete_many([self._failures_key, self._probe_key])
+
+    # ── async ──
+
+    async def astate(self):
+        try:
+            return self._state_for(await cache.aget(self._opened_at_key))
+        except Exception as e:
+            logger.warning(f"Circuit {self.name}: кеш недоступен ({e}), считаем цепь закрытой")
+            return CLOSED
+
+    async def aallow_request(self):
+        state = await self.astate()
+        if state == CLOSED:
+            return True
+        if state == OPEN:
+            return False
+        try:
+            return await cache.aadd(self._probe_key, 1, timeout=self.recovery_timeout)
+        except Exception:
+            return True
+
+    async def arecord_success(self):
+        try:
+            if await self.astate() != CLOSED:
+                logger.info(f"Circuit {self.name}: upstream восстановлен, цепь закрыта")
+            await cache.adelete_many([self._failures_key, self._opened_at_key, self._probe_key])
+        except Exception as e:
+            logger.warning(f"Circuit {self.name}: не удалось записать успех ({e})")
+
+    async def arecord_failure(self):
+        try:
+            await cache.aadd(self._failures_key, 0, timeout=self.failure_window)
+            failures = await cache.aincr(self._failures_key)
+            if await self.astate() == HALF_OPEN or failures >= self.failure_threshold:
+                logger.warning(f"Circuit {self.name}: upstream недоступен, цепь открыта на {self.recovery_timeout}с")
+                await cache.aset(self._opened_at_key, time.time(), timeout=None)
+                await cache.adelete_many([self._failures_key, self._probe_key])
+        except Exception as e:
+            logger.warning(f"Circuit {self.name}: не удалось записать ошибку ({e})")
+
+
+def get_fastapi_breaker():
+    return CircuitBreaker(
+        'fastapi',
+        failure_threshold=settings.FASTAPI_CIRCUIT_FAILURE_THRESHOLD,
+        failure_window=settings.FASTAPI_CIRCUIT_FAILURE_WINDOW,
+        recovery_timeout=settings.FASTAPI_CIRCUIT_RECOVERY_TIMEOUT,
+    )
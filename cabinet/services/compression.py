@@ -0,0 +1,68 @@
+"""
+Сжатие больших JSON-ответов по Accept-Encoding.
+
+brotli (зависимость проекта) предпочтительнее gzip; без установленного
+пакета brotli отдаётся gzip. Маленькие ответы не сжимаются.
+"""
+import re
+
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIN_SIZE = 1024
+BROTLI_QUALITY = 5
+
+
+def _quality(params):
+    """q из параметров кодировки; без q — 1, неразборчивое значение — 0"""
+    match = re.search(r'q\s*=\s*([^;\s]*)', params)
+    if not match:
+        return 1.0
+    try:
+        return float(match.group(1))
+    except ValueError:
+        return 0.0
+
+
+def accepted_encodings(request):
+    """Кодировки из Accept-Encoding, кроме запрещённых q=0 и с неразборчивым q"""
+    accepted = set()
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        name, _sep, params = part.strip().partition(';')
+        # not > 0 отсекает и nan
+        if not _quality(params) > 0:
+            continue
+        if name:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def compress_response(request, response):
+    patch_vary_headers(response, ('Accept-Encoding',))
+
+    if response.streaming or response.has_header('Content-Encoding') or len(response.content) < MIN_SIZE:
+        return response
+
+    accepted = accepted_encodings(request)
+    if brotli is not None and ('br' in accepted or '*' in accepted):
+        content, encoding = brotli.compress(response.content, quality=BROTLI_QUALITY), 'br'
+    elif 'gzip' in accepted or '*' in accepted:
+        content, encoding = compress_string(response.content), 'gzip'
+    else:
+        return response
+
+    if len(content) >= len(response.content):
+        return response
+
+    response.content = content
+    response['Content-Length'] = str(len(content))
+    response['Content-Encoding'] = encoding
+    if response.has_header('ETag'):
+        # Сжатое тело уже не побайтно то же самое
+        response['ETag'] = re.sub(r'^"', 'W/"', response['ETag'])
+    return response
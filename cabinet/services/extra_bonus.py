@@ -0,0 +1,127 @@
+"""
+Лучший extra_bonus пользователя (таблица BestExtraBonus).
+
+Таблица обновляется при сохранении месячных отчётов и заполняется по
+истории командой rebuild_best_extra_bonus. Читающий код запрашивает
+только нужных пользователей, а не всю историю MonthlyReport.
+
+Предполагается, что отчёты пишутся по порядку: пересохраняется только
+последний период, более ранние не меняются.
+"""
+import logging
+
+from django.db.models import F
+
+from cabinet.models import BestExtraBonus, MonthlyReport
+
+logger = logging.getLogger(__name__)
+
+EXTRA_BONUS_RANK = {
+    "-":                     0,
+    "Par dazmol":            1,
+    "Changyutgich":          2,
+    "Televizor smart-32":    3,
+    "Gaz plita":             4,
+    "Konditsioner":          5,
+    "Kir yuvadigan mashina": 6,
+    "Chet el sayohati":      7,
+    "Onix avtomobili":       8,
+    "Chery Tigo 7 Pro Max":  9,
+}
+
+
+def rank_of(extra_bonus):
+    return EXTRA_BONUS_RANK.get(extra_bonus or '', 0)
+
+
+def load_best(users):
+    """{user.pk: BestExtraBonus} одним запросом"""
+    pks = [getattr(user, 'pk', user) for user in users]
+    return BestExtraBonus.objects.in_bulk(pks)
+
+
+def best_rank(row, exclude_period=None):
+    """Лучший ранг; exclude_period=(year, month) — без учёта этого периода"""
+    if row is None:
+        return 0
+    if exclude_period and (row.year, row.month) == tuple(exclude_period):
+        return row.prior_rank
+    return row.rank
+
+
+def best_ranks(users, exclude_period=None):
+    """{user.pk: лучший ранг} для переданных пользователей"""
+    return {
+        pk: best_rank(row, exclude_period)
+        for pk, row in load_best(users).items()
+    }
+
+
+def record(rows, saved, year, month):
+    """
+    Обновляет таблицу после сохранения отчётов за year/month.
+
+    rows  — результат load_best до сохранения
+    saved — {user.pk: extra_bonus, записанный в отчёт}
+    """
+    changed = []
+    reverted = []
+
+    for pk, extra_bonus in saved.items():
+        row = rows.get(pk)
+        previous = best_rank(row, exclude_period=(year, month))
+        rank = rank_of(extra_bonus)
+
+        if rank > previous:
+            changed.append(BestExtraBonus(
+                user_id=pk, rank=rank, extra_bonus=extra_bonus,
+                year=year, month=month, prior_rank=previous,
+            ))
+        elif row is not None and (row.year, row.month) == (year, month):
+            # Месяц пересохранён без бонуса — откатываемся к прошлому лучшему
+            reverted.append(pk)
+
+    if changed:
+        BestExtraBonus.objects.bulk_create(
+            changed,
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=['rank', 'extra_bonus', 'year', 'month', 'prior_rank', 'updated_at'],
+        )
+    if reverted:
+        BestExtraBonus.objects.filter(user_id__in=reverted).update(
+            rank=F('prior_rank'), extra_bonus='', year=None, month=None,
+        )
+
+    return len(changed) + len(reverted)
+
+
+def rebuild(batch_size=1000):
+    """
+    Пересчитывает таблицу по всей истории MonthlyReport.
+    Возвращает количество записанных строк.
+    """
+    reports = MonthlyReport.objects.exclude(
+        extra_bonus__in=('', '-'),
+    ).order_by('user_id', 'year', 'month').values_list('user_id', 'year', 'month', 'extra_bonus')
+
+    rows = {}
+    for user_pk, year, month, extra_bonus in reports.iterator(chunk_size=batch_size):
+        row = rows.get(user_pk)
+        rank = rank_of(extra_bonus)
+        if rank > (row.rank if row else 0):
+            rows[user_pk] = BestExtraBonus(
+                user_id=user_pk, rank=rank, extra_bonus=extra_bonus,
+                year=year, month=month, prior_rank=row.rank if row else 0,
+            )
+
+    BestExtraBonus.objects.exclude(user_id__in=list(rows)).delete()
+    BestExtraBonus.objects.bulk_create(
+        rows.values(),
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=['rank', 'extra_bonus', 'year', 'month', 'prior_rank', 'updated_at'],
+    )
+    return len(rows)
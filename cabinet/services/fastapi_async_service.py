@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import weakref
+
+import httpx
+from django.conf import settings
+
+from .circuit_breaker import AsyncCircuitOpenError, get_fastapi_breaker
+
+logger = logging.getLogger(__name__)
+
+# Один AsyncClient на event loop: под ASGI это один клиент на воркер,
+# а в тестах/runserver (свой loop на запрос) клиенты не пересекаются
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=settings.FASTAPI_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=settings.FASTAPI_ASYNC_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.FASTAPI_ASYNC_MAX_KEEPALIVE,
+            ),
+        )
+        _clients[loop] = client
+    return client
+
+
+class AsyncFastAPIService:
+    """
+    Асинхронный клиент FastAPI для прокси-views кабинета.
+
+    Методы возвращают ответ FastAPI как есть (views проксируют его клиенту),
+    ошибки сети и HTTP-статусы >= 400 поднимаются как httpx.HTTPError;
+    при открытом circuit breaker — AsyncCircuitOpenError без запроса.
+    """
+
+    def __init__(self, base_url=None):
+        self.base_url = (base_url or settings.FASTAPI_SERVICE_URL).rstrip("/")
+        self.client = get_async_client()
+        self.breaker = get_fastapi_breaker()
+
+    async def _request(self, method: str, path: str, **kwargs) -> dict:
+        url = f"{self.base_url}{path}"
+
+        if not await self.breaker.aallow_request():
+            raise AsyncCircuitOpenError(f"FastAPI недоступен, запрос {url} не отправлен")
+
+        logger.info(f"Request FastAPI {method} {url}")
+
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.TransportError:
+            await self.breaker.arecord_failure()
+            raise
+
+        if response.status_code >= 500:
+            await self.breaker.arecord_failure()
+        else:
+            await self.breaker.arecord_success()
+        response.raise_for_status()
+
+        return response.json()
+
+    async def get_user_status(self, user_id: str) -> dict:
+        return await self._request("GET", f"/user/users/{user_id}/status")
+
+    async def get_user_structure(self, user_id: str, timeout=None) -> dict:
+        kwargs = {"timeout": timeout} if timeout else {}
+        return await self._request("GET", f"/user/users/{user_id}/structure", **kwargs)
+
+    async def add_user_lo(self, user_id: str, lo: float) -> dict:
+        return await self._request("POST", f"/user/users/{user_id}/lo/add", json={"lo": lo})
+
+    async def sub_user_lo(self, user_id: str, lo: float) -> dict:
+        return await self._request("POST", f"/user/users/{user_id}/lo/subtract", json={"lo": lo})
@@ -1,45 +1,84 @@
 import requests
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
+from django.core.cache import cache
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
-from core.settings import FASTAPI_SERVICE_URL
+from . import single_flight
+from .circuit_breaker import CircuitOpenError, get_fastapi_breaker
 
 logger = logging.getLogger(__name__)
 
 
 class FastAPIService:
-    def __init__(self):
-        self.base_url = FASTAPI_SERVICE_URL.rstrip("/")
+    def __init__(self, base_url=None):
+        self.base_url = (base_url or settings.FASTAPI_SERVICE_URL).rstrip("/")
         self.session = self._create_session()
+        self.breaker = get_fastapi_breaker()
 
     def _create_session(self):
         session = requests.Session()
 
         retry_strategy = Retry(
-            total=3,
-            backoff_factor=1,
+            total=settings.FASTAPI_RETRIES,
+            backoff_factor=settings.FASTAPI_RETRY_BACKOFF,
             status_forcelist=[500, 502, 503, 504],
             allowed_methods=["GET"],
         )
 
-        adapter = HTTPAdapter(max_retries=retry_strategy)
+        adapter = HTTPAdapter(
+            max_retries=retry_strategy,
+            pool_maxsize=settings.FASTAPI_STATUS_CONCURRENCY,
+        )
         session.mount("http://", adapter)
         session.mount("https://", adapter)
 
         return session
 
+    def _send(self, method: str, url: str, timeout=None, **kwargs):
+        """
+        Запрос через circuit breaker: при открытой цепи сразу CircuitOpenError,
+        сетевые ошибки и 5xx считаются отказом upstream.
+        """
+        if not self.breaker.allow_request():
+            raise CircuitOpenError(f"FastAPI недоступен, запрос {url} не отправлен")
+
+        read_timeout = timeout or settings.FASTAPI_TIMEOUT
+        try:
+            response = self.session.request(
+                method, url,
+                timeout=(settings.FASTAPI_CONNECT_TIMEOUT, read_timeout),
+                **kwargs,
+            )
+        except requests.RequestException:
+            self.breaker.record_failure()
+            raise
+
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
     def get_user_stats(self, user_id: str) -> dict:
         """
-        ЧИСТО: только запрос → только данные
+        ЧИСТО: только запрос → только данные.
+        Одновременные запросы одного user_id делят один запрос к upstream
         """
+        return single_flight.do(
+            status_flight_key(user_id),
+            lambda: self._fetch_user_stats(user_id),
+        )
+
+    def _fetch_user_stats(self, user_id: str) -> dict:
         url = f"{self.base_url}/user/users/{user_id}/status"
 
         logger.info(f"Request FastAPI stats for user {user_id}")
         logger.info(f"Request FastAPI url {url}")
 
-        response = self.session.get(url, timeout=5)
+        response = self._send("GET", url)
         response.raise_for_status()
 
         payload = response.json()
@@ -49,6 +88,118 @@ class FastAPIService:
 
         return payload["data"]
 
+    def get_users_status_bulk(self, user_ids) -> dict:
+        """
+        Статусы многих пользователей: {user_id: data}.
+
+        Если upstream умеет POST /user/users/status/batch — шлём пачками по
+        FASTAPI_STATUS_BATCH_SIZE, иначе — параллельные одиночные /status
+        не более FASTAPI_STATUS_CONCURRENCY одновременно. Для пользователей,
+        по которым данных получить не удалось, возвращается пустой dict.
+
+        Статусы, которые прямо сейчас запрашивает другой процесс, не
+        запрашиваются повторно — берётся результат его запроса.
+        """
+        user_ids = list(dict.fromkeys(str(user_id) for user_id in user_ids))
+        shared = single_flight.do_many(
+            [status_flight_key(user_id) for user_id in user_ids],
+            lambda keys: {
+                status_flight_key(user_id): data
+                for user_id, data in self._fetch_statuses([user_id_from_flight_key(key) for key in keys]).items()
+            },
+        )
+        return {user_id: shared.get(status_flight_key(user_id)) or {} for user_id in user_ids}
+
+    def _fetch_statuses(self, user_ids) -> dict:
+        statuses = {}
+
+        if self.breaker.is_open():
+            logger.warning(f"FastAPI недоступен (circuit open), статусы {len(user_ids)} шт. не запрашиваются")
+            return {user_id: {} for user_id in user_ids}
+
+        batch_supported = not batch_unsupported()
+        if batch_supported:
+            batch_size = settings.FASTAPI_STATUS_BATCH_SIZE
+            for start in range(0, len(user_ids), batch_size):
+                chunk = user_ids[start:start + batch_size]
+                try:
+                    statuses.update(self._get_status_batch(chunk))
+                except BatchNotSupported:
+                    logger.info("FastAPI не поддерживает /status/batch — одиночные запросы")
+                    remember_batch_unsupported()
+                    batch_supported = False
+                    break
+                except CircuitOpenError as e:
+                    logger.warning(str(e))
+                    break
+                except (requests.RequestException, RuntimeError, ValueError) as e:
+                    logger.warning(f"Ошибка пакетного запроса статусов ({len(chunk)} шт.): {e}")
+
+        remaining = [user_id for user_id in user_ids if user_id not in statuses]
+        if remaining and not batch_supported:
+            statuses.update(self._get_status_concurrently(remaining))
+
+        return {user_id: statuses.get(user_id, {}) for user_id in user_ids}
+
+    def _get_status_batch(self, user_ids) -> dict:
+        url = f"{self.base_url}/user/users/status/batch"
+
+        logger.info(f"Request FastAPI batch stats for {len(user_ids)} users")
+
+        response = self._send("POST", url, json={"user_ids": user_ids}, timeout=10)
+        if response.status_code in (404, 405):
+            raise BatchNotSupported(url)
+        response.raise_for_status()
+
+        payload = response.json()
+
+        if payload.get("error"):
+            raise RuntimeError(payload.get("error_msg", "FastAPI error"))
+
+        data = payload["data"]
+        if isinstance(data, list):
+            data = {str(item.get("user_id")): item for item in data}
+        return {str(user_id): status or {} for user_id, status in data.items()}
+
+    def _get_status_concurrently(self, user_ids) -> dict:
+        def fetch(user_id):
+            try:
+                return user_id, self._fetch_user_stats(user_id)
+            except Exception as e:
+                logger.warning(f"Не удалось получить статус для {user_id}: {e}")
+                return user_id, {}
+
+        with ThreadPoolExecutor(max_workers=settings.FASTAPI_STATUS_CONCURRENCY) as executor:
+            return dict(executor.map(fetch, user_ids))
+
+    def get_structure_hashes(self, user_ids) -> dict:
+        """
+        Хеши поддеревьев структуры в FastAPI (structure_merkle) пачками по
+        FASTAPI_STATUS_BATCH_SIZE: {user_id: {"hash": ..., "children": {user_id: hash}}}.
+        Узлов, которых нет в upstream, в ответе нет.
+        """
+        url = f"{self.base_url}/user/users/structure/hashes"
+        user_ids = list(user_ids)
+        hashes = {}
+
+        batch_size = settings.FASTAPI_STATUS_BATCH_SIZE
+        for start in range(0, len(user_ids), batch_size):
+            chunk = user_ids[start:start + batch_size]
+            logger.info(f"Request FastAPI structure hashes for {len(chunk)} users")
+
+            response = self._send("POST", url, json={"user_ids": chunk}, timeout=10)
+            if response.status_code in (404, 405):
+                raise HashesNotSupported(url)
+            response.raise_for_status()
+
+            payload = response.json()
+
+            if payload.get("error"):
+                raise RuntimeError(payload.get("error_msg", "FastAPI error"))
+
+            hashes.update({str(user_id): node for user_id, node in (payload["data"] or {}).items() if node})
+        return hashes
+
     def add_user(self, user_id: str, referrer_id: str) -> dict:
         """
         отправка данных о новом пользователе
@@ -63,7 +214,7 @@ class FastAPIService:
         logger.info(f"Request FastAPI add new user {user_id} with referrer {referrer_id}")
         logger.info(f"Request FastAPI url {url} | payload: {payload}")
 
-        response = self.session.post(url, json=payload, timeout=5)
+        response = self._send("POST", url, json=payload)
         response.raise_for_status()
 
         data = response.json()
@@ -73,3 +224,57 @@ class FastAPIService:
 
         return data["data"]
 
+    def reset_user(self, user_id: str) -> dict:
+        """
+        Сброс накопленных за месяц данных пользователя после сохранения отчёта
+        """
+        url = f"{self.base_url}/user/users/{user_id}/reset"
+
+        logger.info(f"Request FastAPI reset for user {user_id}")
+
+        response = self._send("POST", url)
+        response.raise_for_status()
+
+        data = response.json()
+
+        if data.get("error"):
+            raise RuntimeError(data.get("error_msg", "FastAPI error"))
+
+        return data.get("data") or {}
+
+
+def status_flight_key(user_id):
+    return f"fastapi:status:{user_id}"
+
+
+def user_id_from_flight_key(key):
+    return key.removeprefix("fastapi:status:")
+
+
+# Upstream ответил 404/405 на /status/batch: запоминается в общем кеше на
+# FASTAPI_BATCH_SUPPORT_TTL, чтобы не пробовать маршрут на каждом запросе,
+# но заметить, когда его добавят
+BATCH_UNSUPPORTED_KEY = "fastapi:status_batch_unsupported"
+
+
+def batch_unsupported():
+    try:
+        return bool(cache.get(BATCH_UNSUPPORTED_KEY))
+    except Exception as e:
+        logger.warning(f"Кеш недоступен, пакетный маршрут статусов не проверен: {e}")
+        return False
+
+
+def remember_batch_unsupported():
+    try:
+        cache.set(BATCH_UNSUPPORTED_KEY, True, timeout=settings.FASTAPI_BATCH_SUPPORT_TTL)
+    except Exception as e:
+        logger.warning(f"Кеш недоступен, отказ пакетного маршрута статусов не сохранён: {e}")
+
+
+class BatchNotSupported(Exception):
+    """Upstream не знает пакетного маршрута статусов"""
+
+
+class HashesNotSupported(Exception):
+    """Upstream не знает маршрута хешей структуры"""
@@ -0,0 +1,220 @@
+"""
+Локальная заглушка FastAPI-сервиса пользователей для тестов и бенчмарков.
+
+Отвечает на те же маршруты, что и настоящий upstream, и считает запросы:
+
+    with FastAPIStub(statuses={'00000001': {'lo': 10}}) as stub:
+        FastAPIService(base_url=stub.url).get_users_status_bulk(['00000001'])
+        stub.requests['status']  # → 0, если пакетный маршрут включён
+"""
+import json
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STATUS_RE = re.compile(r'^/user/users/(?P<user_id>[^/]+)/status$')
+RESET_RE = re.compile(r'^/user/users/(?P<user_id>[^/]+)/reset$')
+STRUCTURE_RE = re.compile(r'^/user/users/(?P<user_id>[^/]+)/structure$')
+LO_RE = re.compile(r'^/user/users/(?P<user_id>[^/]+)/lo/(?P<operation>add|subtract)$')
+BATCH_PATH = '/user/users/status/batch'
+HASHES_PATH = '/user/users/structure/hashes'
+ADD_PATH = '/user/users/'
+
+
+def default_status(user_id):
+    return {
+        'user_id': user_id,
+        'lo': 0,
+        'go': 0,
+        'side_volume': 0,
+        'points': 0,
+        'qualification': 'Hamkor',
+    }
+
+
+def structure_hashes(structure):
+    """{user_id: {'hash': ..., 'children': {user_id: hash}}} по {user_id: пригласивший}"""
+    from .structure_merkle import node_hash
+
+    children = {user_id: [] for user_id in structure}
+    for user_id, referrer_id in structure.items():
+        if referrer_id in children:
+            children[referrer_id].append(user_id)
+
+    hashes = {}
+    for user_id in structure:
+        stack = [user_id]
+        while stack:
+            node = stack[-1]
+            pending = [c for c in children[node] if c not in hashes]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            hashes[node] = node_hash(node, [(c, hashes[c]) for c in children[node]])
+
+    return {
+        user_id: {'hash': hashes[user_id], 'children': {c: hashes[c] for c in children[user_id]}}
+        for user_id in structure
+    }
+
+
+class FastAPIStub:
+    """
+    HTTP-сервер в фоновом потоке.
+
+    statuses — {user_id: data}; для неизвестных id отдаётся default_status.
+    teams    — {user_id: [член команды, ...]} для /structure.
+    structure — {user_id: user_id пригласившего или None} для хешей
+                структуры (structure_merkle); пополняется add_user.
+    batch    — поддерживать ли POST /user/users/status/batch.
+    latency  — искусственная задержка на каждый запрос (секунды).
+    fail     — отвечать 503 на все запросы (имитация падения upstream).
+    broken   — user_id, по которым upstream отвечает 500.
+    """
+
+    def __init__(self, statuses=None, teams=None, structure=None, batch=True, latency=0.0, host='127.0.0.1', port=0):
+        self.statuses = dict(statuses or {})
+        self.teams = dict(teams or {})
+        self.structure = dict(structure or {})
+        self.batch = batch
+        self.latency = latency
+        self.fail = False
+        self.broken = set()
+        self.requests = Counter()
+        # сколько раз запрошен статус каждого id (одиночно и пачками)
+        self.status_ids = Counter()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def status_for(self, user_id):
+        return self.statuses.get(user_id) or default_status(user_id)
+
+    def structure_hashes(self):
+        return structure_hashes(self.structure)
+
+    def count(self, kind):
+        with self._lock:
+            self.requests[kind] += 1
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _read_json(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                return json.loads(self.rfile.read(length) or b'{}')
+
+            def do_GET(self):
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if stub.fail:
+                    stub.count('failed')
+                    return self._send(503, {'detail': 'Service Unavailable'})
+
+                match = STATUS_RE.match(self.path)
+                if match:
+                    stub.count('status')
+                    user_id = match.group('user_id')
+                    with stub._lock:
+                        stub.status_ids[user_id] += 1
+                    return self._send(200, {'error': False, 'data': stub.status_for(user_id)})
+
+                match = STRUCTURE_RE.match(self.path)
+                if match:
+                    stub.count('structure')
+                    user_id = match.group('user_id')
+                    if user_id in stub.broken:
+                        return self._send(500, {'detail': 'Internal Server Error'})
+                    data = {'user_id': user_id, 'team': stub.teams.get(user_id, [])}
+                    return self._send(200, {'error': False, 'data': data})
+
+                self._send(404, {'detail': 'Not Found'})
+
+            def do_POST(self):
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if stub.fail:
+                    stub.count('failed')
+                    return self._send(503, {'detail': 'Service Unavailable'})
+
+                if self.path == BATCH_PATH:
+                    if not stub.batch:
+                        return self._send(405, {'detail': 'Method Not Allowed'})
+                    stub.count('batch')
+                    user_ids = self._read_json().get('user_ids', [])
+                    with stub._lock:
+                        stub.status_ids.update(user_ids)
+                    data = {user_id: stub.status_for(user_id) for user_id in user_ids}
+                    return self._send(200, {'error': False, 'data': data})
+
+                if self.path == HASHES_PATH:
+                    stub.count('hashes')
+                    user_ids = self._read_json().get('user_ids', [])
+                    hashes = stub.structure_hashes()
+                    data = {user_id: hashes[user_id] for user_id in user_ids if user_id in hashes}
+                    return self._send(200, {'error': False, 'data': data})
+
+                if self.path == ADD_PATH:
+                    stub.count('add')
+                    payload = self._read_json()
+                    stub.structure[payload['user_id']] = payload.get('referrer_id')
+                    return self._send(200, {'error': False, 'data': {'user_id': payload['user_id']}})
+
+                match = RESET_RE.match(self.path)
+                if match:
+                    stub.count('reset')
+                    return self._send(200, {'error': False, 'data': {}})
+
+                match = LO_RE.match(self.path)
+                if match:
+                    stub.count('lo')
+                    user_id, operation = match.group('user_id', 'operation')
+                    status = dict(stub.status_for(user_id))
+                    delta = self._read_json().get('lo', 0)
+                    status['lo'] = status.get('lo', 0) + (delta if operation == 'add' else -delta)
+                    stub.statuses[user_id] = status
+                    return self._send(200, {'error': False, 'data': status})
+
+                self._send(404, {'detail': 'Not Found'})
+
+        return Handler
@@ -0,0 +1,299 @@
+"""
+Общий снимок леса структуры в файле, отображаемом в память (mmap).
+
+Задача Celery раз в REFERRAL_FOREST_SNAPSHOT_INTERVAL строит снимок из
+ReferralForest и атомарно подменяет файл (запись во временный рядом и
+os.replace). Воркеры gunicorn и Celery открывают файл только на чтение:
+страницы общие для всех процессов через page cache, своей копии дерева
+в памяти процесса нет.
+
+Узлы в файле лежат в порядке обхода в глубину, поэтому структура партнёра —
+непрерывный диапазон [index, end[index]):
+    pk, user_id  — узлы по порядку обхода
+    username     — логин в UTF-8 (идентификатор узла в FastAPI)
+    parent       — индекс пригласившего в снимке или -1
+    depth        — referral_depth
+    end          — конец диапазона поддерева (не включая)
+    position     — pk → индекс (-1 — нет в снимке)
+    user_id_sorted, user_id_index — поиск по user_id
+
+В заголовке — отметка состояния базы на момент сборки (database_stamp):
+число пользователей, последний pk и последний referral_tree_changed_at.
+Добавление, удаление и перенос в структуре меняют её, поэтому
+ReferralForest.load() берёт лес из снимка, только пока отметка совпадает
+с базой, а иначе читает базу. Нет файла — get_snapshot() вернёт None.
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from accounts.models import CustomUser
+from .network_volume import ReferralForest
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'RFSNAP01'
+HEADER = struct.Struct('<8sQ')  # сигнатура, длина JSON-заголовка
+ALIGN = 64
+
+
+def _aligned(offset):
+    return -(-offset // ALIGN) * ALIGN
+
+
+class ForestSnapshot:
+    """Снимок, открытый только на чтение; массивы — представления над mmap"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.path = path
+        self.identity = (stat.st_ino, stat.st_mtime_ns)
+
+        magic, header_size = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: не снимок леса структуры")
+        meta = json.loads(self._mmap[HEADER.size:HEADER.size + header_size])
+        data_start = _aligned(HEADER.size + header_size)
+
+        self.built_at = meta['built_at']
+        self.stamp = meta.get('stamp')
+        arrays = {
+            name: np.frombuffer(self._mmap, dtype=dtype, count=count, offset=data_start + offset)
+            for name, (dtype, offset, count) in meta['arrays'].items()
+        }
+        self.pks = arrays['pk']
+        self.user_ids = arrays['user_id']
+        self.usernames = arrays['username']
+        self.parent = arrays['parent']
+        self.depth = arrays['depth']
+        self.end = arrays['end']
+        self._position = arrays['position']
+        self._user_id_sorted = arrays['user_id_sorted']
+        self._user_id_index = arrays['user_id_index']
+
+    def __len__(self):
+        return len(self.pks)
+
+    def index_of(self, pk):
+        if 0 <= pk < len(self._position):
+            index = int(self._position[pk])
+            return index if index >= 0 else None
+        return None
+
+    def index_of_user_id(self, user_id):
+        key = np.bytes_(user_id)
+        i = int(np.searchsorted(self._user_id_sorted, key))
+        if i < len(self._user_id_sorted) and self._user_id_sorted[i] == key:
+            return int(self._user_id_index[i])
+        return None
+
+    def subtree_range(self, pk):
+        """[start, end) узла и его структуры или None"""
+        index = self.index_of(pk)
+        return None if index is None else (index, int(self.end[index]))
+
+    def descendant_pks(self, pk):
+        """pk всей структуры без самого узла — срез без копирования"""
+        bounds = self.subtree_range(pk)
+        if bounds is None:
+            return self.pks[:0]
+        return self.pks[bounds[0] + 1:bounds[1]]
+
+    def team_size(self, pk):
+        bounds = self.subtree_range(pk)
+        return None if bounds is None else bounds[1] - bounds[0] - 1
+
+    def is_descendant(self, pk, ancestor_pk):
+        """Входит ли pk в структуру ancestor_pk — O(1)"""
+        index, bounds = self.index_of(pk), self.subtree_range(ancestor_pk)
+        if index is None or bounds is None:
+            return False
+        return bounds[0] < index < bounds[1]
+
+    def ancestor_pks(self, pk):
+        """Вышестоящие от пригласившего до корня"""
+        index = self.index_of(pk)
+        if index is None:
+            return []
+        chain = []
+        index = int(self.parent[index])
+        while index >= 0:
+            chain.append(int(self.pks[index]))
+            index = int(self.parent[index])
+        return chain
+
+    def forest(self, id_field='user_id'):
+        """
+        ReferralForest в том же порядке, что и ReferralForest.load() из базы:
+        по уровням, дети одного пригласившего подряд по pk
+        """
+        order = np.lexsort((self.parent, self.depth))
+        new_index = np.empty(len(order), dtype=np.int64)
+        new_index[order] = np.arange(len(order))
+        parent = self.parent[order]
+        parent = np.where(parent >= 0, new_index[np.maximum(parent, 0)], -1)
+
+        ids = self.user_ids if id_field == 'user_id' else self.usernames
+        return ReferralForest(
+            [value.decode() for value in ids[order].tolist()],
+            parent,
+            self.depth[order].astype(np.int64),
+            pks=self.pks[order],
+        )
+
+
+def build_arrays(forest, usernames=None):
+    """
+    Массивы снимка из леса, загруженного ReferralForest.load();
+    usernames — {pk: username}, по умолчанию логин совпадает с user_id
+    """
+    n = len(forest)
+    sizes = forest.subtree_sizes()
+    pos = forest.preorder(sizes)
+
+    order = np.empty(n, dtype=np.int64)
+    order[pos] = np.arange(n)
+    parent = forest.parent[order]
+
+    pks = forest.pks[order]
+    position = np.full(int(pks.max()) + 1 if n else 0, -1, dtype=np.int64)
+    position[pks] = np.arange(n)
+
+    user_ids = np.array(forest.user_ids, dtype=np.bytes_)[order]
+    by_user_id = np.argsort(user_ids, kind='stable')
+    if usernames is None:
+        names = user_ids
+    else:
+        names = np.array([usernames.get(pk, '').encode() for pk in pks.tolist()], dtype=np.bytes_)
+
+    return {
+        'pk': pks,
+        'user_id': user_ids,
+        'username': names,
+        'parent': np.where(parent >= 0, pos[np.maximum(parent, 0)], -1),
+        'depth': forest.depth[order].astype(np.int32),
+        'end': np.arange(n, dtype=np.int64) + sizes[order],
+        'position': position,
+        'user_id_sorted': user_ids[by_user_id],
+        'user_id_index': by_user_id.astype(np.int64),
+    }
+
+
+def write_snapshot(path, arrays, stamp=None):
+    """Запись во временный файл в том же каталоге и атомарная подмена"""
+    layout, offset = {}, 0
+    for name, array in arrays.items():
+        layout[name] = (array.dtype.str, offset, len(array))
+        offset = _aligned(offset + array.nbytes)
+    header = json.dumps({
+        'built_at': timezone.now().isoformat(),
+        'stamp': stamp,
+        'arrays': layout,
+    }).encode()
+    data_start = _aligned(HEADER.size + len(header))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.forest-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, len(header)))
+            f.write(header)
+            for name, array in arrays.items():
+                f.seek(data_start + layout[name][1])
+                f.write(np.ascontiguousarray(array).tobytes())
+            f.truncate(data_start + offset)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def database_stamp():
+    """Отметка состояния структуры в базе — одним агрегатным запросом"""
+    stats = CustomUser.objects.aggregate(
+        count=Count('pk'), last_pk=Max('pk'), changed_at=Max('referral_tree_changed_at'),
+    )
+    changed_at = stats['changed_at']
+    return [stats['count'], stats['last_pk'], changed_at.isoformat() if changed_at else None]
+
+
+def publish(path=None):
+    """
+    Строит снимок по базе и подменяет файл; возвращает число узлов.
+    Снимок, который совпадает с базой, не пересобирается.
+    """
+    path = path or settings.REFERRAL_FOREST_SNAPSHOT_PATH
+    # Отметка — до чтения леса: изменение посреди сборки сделает снимок
+    # устаревшим, а не «свежим» с неполными данными
+    stamp = database_stamp()
+    current = get_snapshot(path)
+    if current is not None and current.stamp == stamp:
+        return len(current)
+
+    forest = ReferralForest.load_from_db()
+    usernames = dict(CustomUser.objects.values_list('pk', 'username').iterator(chunk_size=10000))
+    write_snapshot(path, build_arrays(forest, usernames), stamp)
+    return len(forest)
+
+
+def load_forest(id_field='user_id', path=None):
+    """Лес всех пользователей из снимка или None, если снимка нет или он отстал от базы"""
+    if id_field not in ('user_id', 'username'):
+        return None
+    snapshot = get_snapshot(path)
+    if snapshot is None or snapshot.stamp != database_stamp():
+        return None
+    return snapshot.forest(id_field)
+
+
+_current = None
+_checked_at = 0.0
+
+
+def get_snapshot(path=None):
+    """
+    Снимок текущего процесса. Файл перепроверяется не чаще раза в
+    REFERRAL_FOREST_SNAPSHOT_CHECK секунд; после подмены открывается новый,
+    старое отображение освобождается, когда на него не останется ссылок.
+    """
+    global _current, _checked_at
+
+    path = path or settings.REFERRAL_FOREST_SNAPSHOT_PATH
+    now = time.monotonic()
+    if (
+        _current is not None and _current.path == path
+        and now - _checked_at < settings.REFERRAL_FOREST_SNAPSHOT_CHECK
+    ):
+        return _current
+    _checked_at = now
+
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        _current = None
+        return None
+
+    if _current is None or _current.path != path or _current.identity != (stat.st_ino, stat.st_mtime_ns):
+        try:
+            _current = ForestSnapshot(path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Снимок леса структуры {path} не открыт: {e}")
+            if _current is not None and _current.path != path:
+                _current = None
+    return _current
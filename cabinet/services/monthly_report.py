@@ -0,0 +1,311 @@
+"""
+Сохранение месячных отчётов структуры фоновыми задачами Celery.
+
+Задача (MonthlyReportJob) идёт пачками по MONTHLY_REPORT_CHUNK_SIZE.
+По каждому пользователю в MonthlyReportJobItem отмечаются обе фазы:
+сначала сохраняется отчёт, и только после этого в FastAPI сбрасываются
+его данные. Поэтому перезапуск продолжает с места остановки и не
+сбрасывает тех, чей отчёт не сохранён.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from accounts.models import CustomUser
+from cabinet.models import MonthlyReport, MonthlyReportJob, MonthlyReportJobItem, Purchase
+
+from . import extra_bonus, tree_history
+from .fastapi_service import FastAPIService
+from .referral_tree import load_referral_tree
+
+logger = logging.getLogger(__name__)
+
+MONEY_FIELDS = {
+    'personal_volume': 'lo',
+    'group_volume':    'go',
+    'side_volume':     'side_volume',
+    'points':          'points',
+    'veron':           'veron',
+    'personal_bonus':  'personal_bonus',
+    'structure_bonus': 'structure_bonus',
+    'mentor_bonus':    'mentor_bonus',
+    'personal_money':  'personal_money',
+    'group_money':     'group_money',
+    'leader_money':    'leader_money',
+    'side_vol_money':  'side_vol_money',
+    'total_money':     'total_money',
+    'total_income':    'total_income',
+}
+
+
+def unfinished_items(job):
+    """Пользователи, у которых не пройдена хотя бы одна фаза и не исчерпаны попытки"""
+    return job.items.filter(
+        Q(saved_at__isnull=True) | Q(reset_at__isnull=True),
+        attempts__lt=settings.MONTHLY_REPORT_MAX_ATTEMPTS,
+    )
+
+
+def start_job(owner, today=None):
+    """
+    Создаёт задачу за текущий месяц или возобновляет прерванную.
+    Возвращает (job, dispatched): dispatched=False — задача уже идёт или завершена.
+    """
+    today = today or date.today()
+
+    with transaction.atomic():
+        job, _created = MonthlyReportJob.objects.select_for_update().get_or_create(
+            owner=owner, year=today.year, month=today.month,
+        )
+
+        stale_after = timezone.now() - timedelta(seconds=settings.MONTHLY_REPORT_JOB_STALE)
+        if job.status == 'running' and job.updated_at > stale_after:
+            return job, False
+
+        if job.status == 'done':
+            # Повторный запуск — только чтобы добрать пользователей с ошибками
+            retry = job.items.filter(Q(saved_at__isnull=True) | Q(reset_at__isnull=True))
+            if not retry.update(attempts=0):
+                return job, False
+
+        job.status = 'running'
+        job.error_message = ''
+        job.finished_at = None
+        job.save(update_fields=['status', 'error_message', 'finished_at', 'updated_at'])
+
+        from cabinet.tasks import run_monthly_report_job
+        transaction.on_commit(lambda: run_monthly_report_job.delay(job.pk))
+
+    return job, True
+
+
+def collect_users(job):
+    """Фиксирует состав структуры на момент запуска (один раз на задачу)"""
+    if job.items.exists():
+        return job.total
+
+    users = load_referral_tree(job.owner).users
+    MonthlyReportJobItem.objects.bulk_create(
+        [MonthlyReportJobItem(job=job, user=user) for user in users],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+    job.total = len(users)
+    job.save(update_fields=['total', 'updated_at'])
+    return job.total
+
+
+def process_chunk(job):
+    """Обрабатывает следующую пачку; 0 — обрабатывать больше нечего"""
+    items = list(
+        unfinished_items(job).select_related('user').order_by('attempts', 'pk')[:settings.MONTHLY_REPORT_CHUNK_SIZE]
+    )
+    if not items:
+        return 0
+
+    service = FastAPIService()
+
+    # Контрольная точка сохранения пишется до сброса: если задача упадёт
+    # посреди сброса, перезапуск не перезапишет отчёты уже обнулёнными данными
+    _save_reports(job, [item for item in items if item.saved_at is None], service)
+    MonthlyReportJobItem.objects.bulk_update(items, ['saved_at', 'attempts', 'last_error'])
+
+    _reset_upstream([item for item in items if item.saved_at and item.reset_at is None], service)
+    MonthlyReportJobItem.objects.bulk_update(items, ['reset_at', 'attempts', 'last_error'])
+    job.save(update_fields=['updated_at'])
+    return len(items)
+
+
+def _save_reports(job, items, service):
+    if not items:
+        return
+
+    statuses = service.get_users_status_bulk([item.user.username for item in items])
+
+    with_data = []
+    for item in items:
+        if statuses.get(item.user.username):
+            with_data.append(item)
+        else:
+            # Без данных FastAPI отчёт не сохраняем — иначе после сброса они потеряются
+            _fail(item, 'Нет данных FastAPI')
+
+    try:
+        write_reports([item.user for item in with_data], statuses, job.year, job.month)
+    except Exception as e:
+        logger.error(f"Ошибка сохранения отчётов ({len(with_data)} шт.): {e}")
+        for item in with_data:
+            _fail(item, str(e))
+        return
+
+    saved_at = timezone.now()
+    for item in with_data:
+        item.saved_at = saved_at
+
+
+def write_reports(users, statuses, year, month):
+    """
+    Сохраняет MonthlyReport пачки пользователей за постоянное число запросов:
+    покупки и новые рефералы — двумя групповыми запросами, запись — одним
+    bulk upsert по (user, year, month). statuses — {username: статус FastAPI}.
+    """
+    if not users:
+        return 0
+
+    best_rows = extra_bonus.load_best(users)
+
+    purchases = {
+        row['user_id']: row
+        for row in Purchase.objects.filter(
+            user__in=users, date__year=year, date__month=month,
+        ).values('user_id').annotate(
+            count=Count('id'),
+            amount=Sum('amount'),
+        )
+    }
+
+    new_referrals = dict(
+        CustomUser.objects.filter(
+            referrer__in=users,
+            date_joined__year=year,
+            date_joined__month=month,
+        ).values('referrer_id').annotate(
+            count=Count('pk'),
+        ).values_list('referrer_id', 'count')
+    )
+
+    reports = [
+        MonthlyReport(
+            user=user,
+            year=year,
+            month=month,
+            **build_report_values(
+                user,
+                statuses.get(user.username) or {},
+                best_rank=extra_bonus.best_rank(best_rows.get(user.pk), exclude_period=(year, month)),
+                purchases=purchases.get(user.pk, {}),
+                new_referrals=new_referrals.get(user.pk, 0),
+            ),
+        )
+        for user in users
+    ]
+
+    MonthlyReport.objects.bulk_create(
+        reports,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['user', 'year', 'month'],
+        update_fields=REPORT_VALUE_FIELDS,
+    )
+    extra_bonus.record(
+        best_rows,
+        {report.user.pk: report.extra_bonus for report in reports},
+        year,
+        month,
+    )
+    return len(reports)
+
+
+def _reset_upstream(items, service):
+    if not items:
+        return
+
+    def reset(item):
+        try:
+            service.reset_user(item.user.username)
+            return item, None
+        except Exception as e:
+            logger.warning(f"Не удалось сбросить данные для {item.user.username}: {e}")
+            return item, e
+
+    with ThreadPoolExecutor(max_workers=settings.FASTAPI_STATUS_CONCURRENCY) as executor:
+        for item, error in executor.map(reset, items):
+            if error is None:
+                item.reset_at = timezone.now()
+            else:
+                _fail(item, str(error))
+
+
+def _fail(item, message):
+    item.attempts += 1
+    item.last_error = message[:255]
+
+
+def build_report_values(user, status, best_rank, purchases, new_referrals):
+    """Поля MonthlyReport из статуса FastAPI и заранее посчитанных агрегатов"""
+    current_extra = status.get('extra_bonus', '') or ''
+    current_rank = extra_bonus.rank_of(current_extra)
+
+    values = {field: status.get(key, 0) or 0 for field, key in MONEY_FIELDS.items()}
+    values.update({
+        'extra_bonus':            current_extra if current_rank > best_rank else '',
+        'bonus_total':            sum(float(status.get(k, 0) or 0) for k in ('personal_bonus', 'structure_bonus', 'mentor_bonus')),
+        'partner_level':          status.get('qualification', '') or '',
+        'new_referrals':          new_referrals,
+        'active_referrals_count': user.active_referrals,
+        'purchases_count':        purchases.get('count') or 0,
+        'purchases_amount':       purchases.get('amount') or 0,
+    })
+    return values
+
+
+REPORT_VALUE_FIELDS = [
+    *MONEY_FIELDS,
+    'extra_bonus', 'bonus_total', 'partner_level', 'new_referrals',
+    'active_referrals_count', 'purchases_count', 'purchases_amount',
+]
+
+
+def finish_job(job):
+    job.status = 'done'
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'finished_at', 'updated_at'])
+
+    # Снимок структуры месяца для исторического дерева; без него отчёт всё равно готов
+    try:
+        tree_history.save_month(job.owner, job.year, job.month)
+    except Exception:
+        logger.exception(f"MonthlyReport {job.month}/{job.year}: не удалось сохранить снимок структуры")
+
+    progress = job_progress(job)
+    logger.info(
+        f"MonthlyReport {job.month}/{job.year}: сохранено {progress['saved']}, "
+        f"ошибок {progress['errors']}, сброшено {progress['reset_ok']}, ошибок сброса {progress['reset_errors']}"
+    )
+    return progress
+
+
+def fail_job(job, error):
+    job.status = 'failed'
+    job.error_message = str(error)
+    job.save(update_fields=['status', 'error_message', 'updated_at'])
+
+
+def job_progress(job):
+    counts = job.items.aggregate(
+        saved=Count('pk', filter=Q(saved_at__isnull=False)),
+        reset=Count('pk', filter=Q(reset_at__isnull=False)),
+    )
+    total = job.total
+    saved, reset = counts['saved'], counts['reset']
+    done = job.status == 'done'
+
+    return {
+        'job_id':       job.pk,
+        'status':       job.status,
+        'month':        job.month,
+        'year':         job.year,
+        'total':        total,
+        'saved':        saved,
+        'reset_ok':     reset,
+        # Ошибки окончательные только после завершения задачи
+        'errors':       total - saved if done else 0,
+        'reset_errors': saved - reset if done else 0,
+        'percent':      round(100 * (saved + reset) / (2 * total)) if total else 0,
+        'error':        job.error_message,
+    }
@@ -0,0 +1,198 @@
+"""
+Локальный расчёт объёмов сети по структуре рефералов (NumPy).
+
+Лес структуры загружается одним запросом в массивы: узлы упорядочены
+по (глубина, индекс пригласившего), parent — индекс пригласившего или -1.
+Родитель всегда раньше ребёнка, а дети одного пригласившего идут подряд,
+поэтому суммы по поддеревьям считаются уровень за уровнем снизу вверх —
+одна векторная операция на уровень, без запросов к FastAPI по каждому.
+
+По вектору ЛО считаются для каждого партнёра:
+    group_volume — ЛО всей структуры вместе с собственным (ГО)
+    largest_leg  — ГО самой большой ветки
+    side_volume  — ГО без собственного ЛО и самой большой ветки
+    team_size    — участников в структуре
+    level_counts — участников по уровням структуры (1-й — прямые рефералы)
+"""
+import numpy as np
+
+from accounts.models import CustomUser
+
+
+class ReferralForest:
+
+    def __init__(self, user_ids, parent, depth, pks=None):
+        self.user_ids = user_ids
+        self.parent = parent
+        self.depth = depth
+        self.pks = pks
+        self._index = None
+
+        # Границы уровней: depth отсортирован по возрастанию
+        bounds = np.flatnonzero(np.diff(depth)) + 1
+        starts = np.r_[0, bounds] if len(depth) else np.array([], dtype=np.int64)
+        stops = np.r_[bounds, len(depth)] if len(depth) else np.array([], dtype=np.int64)
+        self.levels = list(zip(starts.tolist(), stops.tolist()))
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    @classmethod
+    def load(cls, queryset=None, id_field='user_id'):
+        """
+        Лес всех пользователей или переданного queryset (например, структуры
+        одного партнёра). Пригласившие вне выборки становятся корнями.
+        id_field — поле, которое попадает в user_ids.
+
+        Лес всех пользователей берётся из общего снимка (forest_snapshot),
+        если он совпадает с базой, иначе — из базы.
+        """
+        if queryset is None:
+            from .forest_snapshot import load_forest
+            forest = load_forest(id_field)
+            if forest is not None:
+                return forest
+        return cls.load_from_db(queryset, id_field)
+
+    @classmethod
+    def load_from_db(cls, queryset=None, id_field='user_id'):
+        """Лес одним запросом к базе, без снимка"""
+        queryset = CustomUser.objects.all() if queryset is None else queryset
+        rows = list(
+            queryset.order_by('referral_depth', 'pk')
+            .values_list('pk', id_field, 'referrer_id', 'referral_depth')
+            .iterator(chunk_size=10000)
+        )
+        n = len(rows)
+
+        pks = np.fromiter((row[0] for row in rows), dtype=np.int64, count=n)
+        referrers = np.fromiter((row[2] or 0 for row in rows), dtype=np.int64, count=n)
+        depth = np.fromiter((row[3] for row in rows), dtype=np.int64, count=n)
+
+        # pk пригласившего → индекс в выборке
+        by_pk = np.argsort(pks)
+        pos = np.clip(np.searchsorted(pks[by_pk], referrers), 0, max(n - 1, 0))
+        found = (referrers > 0) & (pks[by_pk][pos] == referrers)
+        parent = np.where(found, by_pk[pos], -1)
+
+        broken = (parent >= 0) & (depth[np.maximum(parent, 0)] + 1 != depth)
+        if broken.any():
+            raise ValueError(
+                f"referral_depth не согласован у {int(broken.sum())} пользователей — "
+                f"выполните rebuild_referral_paths"
+            )
+
+        # Внутри уровня — дети одного пригласившего подряд
+        order = np.lexsort((parent, depth))
+        new_index = np.empty(n, dtype=np.int64)
+        new_index[order] = np.arange(n)
+        parent = parent[order]
+        parent = np.where(parent >= 0, new_index[np.maximum(parent, 0)], -1)
+
+        user_ids = [rows[i][1] for i in order.tolist()]
+        return cls(user_ids, parent, depth[order], pks=pks[order])
+
+    def index_of(self, user_id):
+        if self._index is None:
+            self._index = {user_id: i for i, user_id in enumerate(self.user_ids)}
+        return self._index.get(user_id)
+
+    def level_groups(self, top_down=False):
+        """
+        По уровням (по умолчанию снизу вверх): (linked, groups, heads) —
+        индексы узлов уровня с пригласившим в лесу, начала групп детей
+        одного пригласившего среди linked и индексы этих пригласивших.
+        """
+        levels = self.levels[1:] if top_down else reversed(self.levels[1:])
+        for start, stop in levels:
+            linked = np.flatnonzero(self.parent[start:stop] >= 0) + start
+            if not len(linked):
+                continue
+            parents = self.parent[linked]
+            groups = np.flatnonzero(np.r_[True, parents[1:] != parents[:-1]])
+            yield linked, groups, parents[groups]
+
+    def subtree_sizes(self):
+        """Размер поддерева каждого узла вместе с ним самим"""
+        size = np.ones(len(self), dtype=np.int64)
+        for linked, groups, heads in self.level_groups():
+            size[heads] += np.add.reduceat(size[linked], groups)
+        return size
+
+    def preorder(self, sizes=None):
+        """
+        Позиция узла при обходе в глубину (родитель, затем поддеревья детей
+        по порядку): поддерево узла i занимает [pos[i], pos[i] + size[i]).
+        """
+        sizes = self.subtree_sizes() if sizes is None else sizes
+        pos = np.full(len(self), -1, dtype=np.int64)
+
+        roots = np.flatnonzero(self.parent < 0)
+        pos[roots] = np.cumsum(sizes[roots]) - sizes[roots]
+
+        for linked, groups, _heads in self.level_groups(top_down=True):
+            before = np.cumsum(sizes[linked]) - sizes[linked]
+            first = np.repeat(before[groups], np.diff(np.r_[groups, len(linked)]))
+            pos[linked] = pos[self.parent[linked]] + 1 + before - first
+        return pos
+
+    def vector(self, values, default=0.0):
+        """Вектор по узлам из {user_id: число}"""
+        return np.fromiter(
+            (float(values.get(user_id, default) or 0) for user_id in self.user_ids),
+            dtype=np.float64,
+            count=len(self),
+        )
+
+
+class NetworkVolumes:
+
+    def __init__(self, forest, personal_volume, group_volume, largest_leg, team_size, level_counts):
+        self.forest = forest
+        self.personal_volume = personal_volume
+        self.group_volume = group_volume
+        self.largest_leg = largest_leg
+        self.side_volume = group_volume - personal_volume - largest_leg
+        self.team_size = team_size
+        self.level_counts = level_counts
+
+    def for_user(self, user_id):
+        i = self.forest.index_of(user_id)
+        if i is None:
+            return None
+        return {
+            'personal_volume': float(self.personal_volume[i]),
+            'group_volume':    float(self.group_volume[i]),
+            'largest_leg':     float(self.largest_leg[i]),
+            'side_volume':     float(self.side_volume[i]),
+            'team_size':       int(self.team_size[i]),
+            'level_counts':    self.level_counts[i].tolist(),
+        }
+
+
+def compute(forest, personal_volume, levels=0):
+    """
+    Объёмы для всех узлов леса за один проход снизу вверх.
+    personal_volume — ЛО по узлам (forest.vector); levels — сколько
+    уровней считать в level_counts (0 — не считать).
+    """
+    n = len(forest)
+    personal = np.asarray(personal_volume, dtype=np.float64)
+    if personal.shape != (n,):
+        raise ValueError(f"Ожидался вектор ЛО длины {n}, получен {personal.shape}")
+
+    group = personal.copy()
+    largest = np.zeros(n, dtype=np.float64)
+    size = np.ones(n, dtype=np.int64)
+    counts = np.zeros((n, levels), dtype=np.int64)
+
+    for linked, groups, heads in forest.level_groups():
+        group[heads] += np.add.reduceat(group[linked], groups)
+        largest[heads] = np.maximum.reduceat(group[linked], groups)
+        size[heads] += np.add.reduceat(size[linked], groups)
+        if levels:
+            counts[heads, 0] += np.diff(np.r_[groups, len(linked)])
+            if levels > 1:
+                counts[heads, 1:] += np.add.reduceat(counts[linked, :-1], groups, axis=0)
+
+    return NetworkVolumes(forest, personal, group, largest, size - 1, counts)
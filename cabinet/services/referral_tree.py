@@ -0,0 +1,70 @@
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ReferralTree:
+    """
+    Поддерево рефералов, загруженное одним запросом.
+
+    users  — пользователи в порядке обхода в ширину (корень первый)
+    parent — {pk: pk пригласившего} для всех узлов, кроме корня
+    depth  — {pk: уровень относительно корня}
+    """
+
+    def __init__(self, root, users, parent, depth, truncated=False):
+        self.root = root
+        self.users = users
+        self.parent = parent
+        self.depth = depth
+        self.truncated = truncated
+        self._by_pk = {user.pk: user for user in users}
+
+    def __len__(self):
+        return len(self.users)
+
+    def __iter__(self):
+        return iter(self.users)
+
+    def get(self, pk):
+        return self._by_pk.get(pk)
+
+    def edges(self):
+        """Пары (пригласивший, приглашённый) в порядке обхода."""
+        for user in self.users:
+            parent_pk = self.parent.get(user.pk)
+            if parent_pk is not None:
+                yield self._by_pk[parent_pk], user
+
+
+def load_referral_tree(root, max_depth=None, max_nodes=None):
+    """
+    Загружает всё поддерево root одним индексным запросом по referral_path.
+
+    Глубина и количество узлов ограничены настройками
+    REFERRAL_TREE_MAX_DEPTH / REFERRAL_TREE_MAX_NODES.
+    """
+    if max_depth is None:
+        max_depth = settings.REFERRAL_TREE_MAX_DEPTH
+    if max_nodes is None:
+        max_nodes = settings.REFERRAL_TREE_MAX_NODES
+
+    descendants = root.get_referral_descendants().filter(
+        referral_depth__lte=root.referral_depth + max_depth
+    ).order_by('referral_depth', 'pk')
+
+    # +1 строка — чтобы понять, что дерево обрезано лимитом
+    users = [root, *descendants[:max_nodes]]
+    truncated = len(users) > max_nodes
+    if truncated:
+        users = users[:max_nodes]
+        logger.warning(
+            f"Дерево рефералов {root.username} обрезано до {max_nodes} узлов"
+        )
+
+    depth = {user.pk: user.referral_depth - root.referral_depth for user in users}
+    parent = {user.pk: user.referrer_id for user in users[1:]}
+
+    return ReferralTree(root, users, parent, depth, truncated=truncated)
@@ -0,0 +1,121 @@
+"""
+Single-flight поверх общего кеша (Redis): одновременные одинаковые запросы
+из любых gunicorn-воркеров и Celery-процессов ждут один запрос к upstream
+и получают его результат.
+
+Ведущий берёт короткую блокировку ключа (SET NX) со своим токеном,
+выполняет запрос и кладёт результат под ключ с этим токеном. Остальные
+читают токен из блокировки и ждут результат именно этого полёта — старый
+результат прошлого полёта им не достанется. Если ведущий упал или не
+успел за FASTAPI_SINGLE_FLIGHT_WAIT, ожидающие делают запрос сами.
+"""
+import logging
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache_batch import add_many
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 0.02
+
+
+def lock_key(key):
+    return f"singleflight:{key}:lock"
+
+
+def result_key(key, token):
+    return f"singleflight:{key}:result:{token}"
+
+
+def _acquire(keys, token):
+    """Ключи, по которым мы стали ведущими (все блокировки — одним pipeline)"""
+    locks = {lock_key(key): key for key in keys}
+    acquired = add_many(dict.fromkeys(locks, token), timeout=settings.FASTAPI_SINGLE_FLIGHT_LOCK)
+    return [locks[lock] for lock in acquired]
+
+
+def _publish(results, token):
+    cache.set_many(
+        {result_key(key, token): value for key, value in results.items()},
+        timeout=settings.FASTAPI_SINGLE_FLIGHT_RESULT_TTL,
+    )
+
+
+def _release(keys, token):
+    # Снимаем только свои блокировки: чужая могла появиться после истечения нашей
+    locks = cache.get_many([lock_key(key) for key in keys])
+    cache.delete_many([k for k, value in locks.items() if value == token])
+
+
+def _wait(keys):
+    """
+    Ждёт результаты чужих полётов: {key: value} для дождавшихся.
+    Ключи, чей ведущий закончил без результата, в ответ не попадают.
+    """
+    results = {}
+    tokens = {}
+    pending = set(keys)
+    deadline = time.monotonic() + settings.FASTAPI_SINGLE_FLIGHT_WAIT
+
+    while pending and time.monotonic() < deadline:
+        locks = cache.get_many([lock_key(key) for key in pending])
+        for key in pending:
+            tokens.setdefault(key, locks.get(lock_key(key)))
+
+        wanted = {result_key(key, tokens[key]): key for key in pending if tokens[key]}
+        for rkey, value in cache.get_many(list(wanted)).items():
+            results[wanted[rkey]] = value
+        pending -= results.keys()
+
+        # Ведущий публикует результат до снятия блокировки: блокировки
+        # уже нет, а результата нет — ждать нечего
+        pending = {key for key in pending if lock_key(key) in locks}
+
+        if pending:
+            time.sleep(POLL_INTERVAL)
+
+    return results
+
+
+def do(key, fn):
+    """Результат fn() — один вызов на все одновременные запросы с этим key"""
+    return do_many([key], lambda keys: {key: fn()})[key]
+
+
+def do_many(keys, fn_many):
+    """
+    Пакетный вариант: fn_many(keys) -> {key: value}.
+
+    По ключам, которые уже запрашиваются другим процессом, ждёт их результат;
+    остальные запрашивает одним вызовом fn_many.
+    """
+    keys = list(dict.fromkeys(keys))
+    token = uuid.uuid4().hex
+
+    try:
+        leading = _acquire(keys, token)
+    except Exception as e:
+        logger.warning(f"Single-flight недоступен ({e}), запрос без координации")
+        return fn_many(keys)
+
+    results = {}
+    try:
+        if leading:
+            results.update(fn_many(leading))
+            _publish({key: results[key] for key in leading if key in results}, token)
+    finally:
+        _release(leading, token)
+
+    waiting = [key for key in keys if key not in results and key not in leading]
+    if waiting:
+        results.update(_wait(waiting))
+        leftover = [key for key in waiting if key not in results]
+        if leftover:
+            logger.info(f"Single-flight: не дождались {len(leftover)} ключей, запрашиваем сами")
+            results.update(fn_many(leftover))
+
+    return results
@@ -0,0 +1,172 @@
+"""
+Кеш статусов пользователей из FastAPI (stale-while-revalidate).
+
+Запись живёт USER_STATUS_CACHE_TTL и считается свежей USER_STATUS_CACHE_SOFT_TTL.
+Устаревшая запись отдаётся сразу, а обновление уходит в Celery; при ошибке
+upstream запись не перезаписывается — остаётся последнее известное значение.
+Пока circuit breaker FastAPI открыт, upstream не опрашивается вовсе.
+
+В записи хранится и время, когда данные действительно изменились
+(changed_at): обновление тем же значением его не двигает. По нему версия
+дерева партнёра (tree_version) понимает, что метрики структуры изменились.
+"""
+import logging
+import time
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache_batch import add_many
+from .circuit_breaker import get_fastapi_breaker
+from .fastapi_async_service import AsyncFastAPIService
+from .fastapi_service import FastAPIService
+
+logger = logging.getLogger(__name__)
+
+
+def status_key(user_id):
+    return f"user:status:{user_id}"
+
+
+def refresh_lock_key(user_id):
+    return f"user:status:refresh:{user_id}"
+
+
+def _make_entry(data, changed_at=None):
+    now = time.time()
+    return {'data': data, 'fetched_at': now, 'changed_at': changed_at or now}
+
+
+def _is_stale(entry):
+    return time.time() - entry['fetched_at'] > settings.USER_STATUS_CACHE_SOFT_TTL
+
+
+def store_statuses(statuses):
+    """Сохраняет непустые статусы; пустые (ошибка upstream) пропускаются"""
+    statuses = {status_key(user_id): data for user_id, data in statuses.items() if data}
+    if not statuses:
+        return 0
+
+    previous = cache.get_many(list(statuses))
+    entries = {}
+    for key, data in statuses.items():
+        before = previous.get(key)
+        # Те же данные — время изменения остаётся прежним
+        unchanged = before is not None and before['data'] == data
+        entries[key] = _make_entry(data, before.get('changed_at', before['fetched_at']) if unchanged else None)
+    cache.set_many(entries, timeout=settings.USER_STATUS_CACHE_TTL)
+    return len(entries)
+
+
+def last_changed(user_ids, batch_size=1000):
+    """
+    Время последнего изменения статуса среди user_ids (мс, 0 — ничего нет
+    в кеше). Читает только кеш, без запросов к FastAPI.
+    """
+    user_ids = [str(user_id) for user_id in user_ids]
+    latest = 0.0
+    for i in range(0, len(user_ids), batch_size):
+        entries = cache.get_many([status_key(user_id) for user_id in user_ids[i:i + batch_size]])
+        for entry in entries.values():
+            latest = max(latest, entry.get('changed_at', entry['fetched_at']))
+    return int(latest * 1000)
+
+
+def schedule_refresh(user_ids):
+    """Ставит фоновое обновление; повторно не ставит, пока висит прошлое"""
+    from cabinet.tasks import refresh_user_statuses
+
+    if get_fastapi_breaker().is_open():
+        return []
+
+    locks = {refresh_lock_key(user_id): str(user_id) for user_id in user_ids}
+    acquired = add_many(dict.fromkeys(locks, 1), timeout=settings.USER_STATUS_CACHE_REFRESH_LOCK)
+    pending = [locks[key] for key in acquired]
+    if pending:
+        refresh_user_statuses.delay(pending)
+    return pending
+
+
+def get_status(user_id):
+    """
+    Статус из кеша или None, если его ещё нет (обновление уже запущено).
+    Не блокируется на upstream.
+    """
+    entry = cache.get(status_key(user_id))
+    if entry is None or _is_stale(entry):
+        schedule_refresh([user_id])
+    return entry['data'] if entry else None
+
+
+async def aget_status(user_id):
+    """
+    Асинхронное чтение для прокси-views: при промахе статус запрашивается
+    напрямую. None — если данных нет ни в кеше, ни в upstream.
+    """
+    entry = await cache.aget(status_key(user_id))
+    if entry is not None:
+        if _is_stale(entry):
+            await sync_to_async(schedule_refresh)([user_id])
+        return entry['data']
+
+    try:
+        payload = await AsyncFastAPIService().get_user_status(user_id)
+    except httpx.HTTPError as e:
+        logger.warning(f"Не удалось получить статус для {user_id}: {e}")
+        return None
+
+    if payload.get('error'):
+        return None
+
+    data = payload.get('data') or {}
+    await sync_to_async(store_statuses)({user_id: data})
+    return data
+
+
+def cached_statuses(user_ids, batch_size=1000):
+    """Только то, что уже лежит в кеше: {user_id: data}, без запросов к FastAPI"""
+    user_ids = [str(user_id) for user_id in user_ids]
+    statuses = {}
+    for i in range(0, len(user_ids), batch_size):
+        batch = user_ids[i:i + batch_size]
+        entries = cache.get_many([status_key(user_id) for user_id in batch])
+        for user_id in batch:
+            entry = entries.get(status_key(user_id))
+            if entry is not None:
+                statuses[user_id] = entry['data']
+    return statuses
+
+
+def get_statuses(user_ids):
+    """
+    Статусы многих пользователей: {user_id: data}.
+
+    Свежие и устаревшие берутся из кеша (устаревшие обновляются в фоне),
+    отсутствующие — одним bulk-запросом к FastAPI. Пустой dict — данных нет.
+    """
+    user_ids = [str(user_id) for user_id in user_ids]
+    entries = cache.get_many([status_key(user_id) for user_id in user_ids])
+
+    statuses = {}
+    missing = []
+    stale = []
+    for user_id in user_ids:
+        entry = entries.get(status_key(user_id))
+        if entry is None:
+            missing.append(user_id)
+            continue
+        statuses[user_id] = entry['data']
+        if _is_stale(entry):
+            stale.append(user_id)
+
+    if stale:
+        schedule_refresh(stale)
+
+    if missing and not get_fastapi_breaker().is_open():
+        fetched = FastAPIService().get_users_status_bulk(missing)
+        store_statuses(fetched)
+        statuses.update(fetched)
+
+    return {user_id: statuses.get(user_id, {}) for user_id in user_ids}
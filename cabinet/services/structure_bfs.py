@@ -0,0 +1,140 @@
+"""
+Обход структуры FastAPI в ширину для глубоких уровней get_referrals_json.
+
+Каждый уровень запрашивается параллельно (не больше
+REFERRALS_BFS_CONCURRENCY запросов /structure одновременно), строки
+пользователей подтягиваются одним запросом user_id__in на уровень.
+Обход останавливается по бюджету узлов и времени — это видно в ответе.
+"""
+import asyncio
+import logging
+import time
+
+import httpx
+from django.conf import settings
+
+from accounts.models import CustomUser
+
+logger = logging.getLogger(__name__)
+
+
+class WalkResult:
+
+    def __init__(self, max_nodes, time_budget):
+        self.members = []
+        self.max_nodes = max_nodes
+        self.time_budget = time_budget
+        self.failed = 0
+        self.truncated_by = None
+        self.started = time.monotonic()
+
+    def budget(self):
+        return {
+            'max_nodes':    self.max_nodes,
+            'time_budget':  self.time_budget,
+            'nodes':        len(self.members),
+            'elapsed':      round(time.monotonic() - self.started, 3),
+            'failed':       self.failed,
+            'truncated':    self.truncated_by is not None,
+            'truncated_by': self.truncated_by,
+        }
+
+
+async def walk_structure(service, members, start_level, max_level, max_nodes=None, time_budget=None):
+    """
+    members — команда, с которой начинается обход (уровень start_level).
+    Команды последнего уровня не запрашиваются — они не нужны в ответе.
+    """
+    max_nodes = max_nodes or settings.REFERRALS_BFS_MAX_NODES
+    time_budget = time_budget or settings.REFERRALS_BFS_TIME_BUDGET
+
+    result = WalkResult(max_nodes, time_budget)
+    deadline = result.started + time_budget
+    semaphore = asyncio.Semaphore(settings.REFERRALS_BFS_CONCURRENCY)
+    seen = set()
+
+    async def fetch_team(user_id):
+        async with semaphore:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise asyncio.TimeoutError
+            timeout = min(settings.REFERRALS_BFS_REQUEST_TIMEOUT, remaining)
+            payload = await service.get_user_structure(user_id, timeout=timeout)
+        if payload.get('error'):
+            raise RuntimeError(payload.get('error_msg', 'FastAPI error'))
+        return (payload.get('data') or {}).get('team') or []
+
+    frontier = members
+    level = start_level
+    while frontier and level <= max_level:
+        level_members = []
+        for member in frontier:
+            user_id = str(member.get('user_id'))
+            if user_id not in seen:
+                seen.add(user_id)
+                level_members.append((user_id, member))
+
+        room = max_nodes - len(result.members)
+        if len(level_members) > room:
+            level_members = level_members[:room]
+            result.truncated_by = 'nodes'
+
+        user_ids = [user_id for user_id, _member in level_members]
+        db_users = {
+            user.user_id: user
+            async for user in CustomUser.objects.filter(user_id__in=user_ids)
+        }
+
+        for user_id, member in level_members:
+            result.members.append(build_member(user_id, member, db_users.get(user_id), level))
+
+        if level == max_level or result.truncated_by:
+            break
+        if time.monotonic() >= deadline:
+            result.truncated_by = 'time'
+            break
+
+        teams = await asyncio.gather(
+            *(fetch_team(user_id) for user_id in user_ids),
+            return_exceptions=True,
+        )
+
+        out_of_time = time.monotonic() >= deadline
+        frontier = []
+        for user_id, team in zip(user_ids, teams):
+            if isinstance(team, asyncio.TimeoutError) or (out_of_time and isinstance(team, httpx.TimeoutException)):
+                result.truncated_by = 'time'
+            elif isinstance(team, (httpx.HTTPError, RuntimeError, ValueError)):
+                logger.warning(f"Не удалось получить команду {user_id}: {team}")
+                result.failed += 1
+            elif isinstance(team, BaseException):
+                raise team
+            else:
+                frontier.extend(team)
+
+        if result.truncated_by:
+            break
+        level += 1
+
+    return result
+
+
+def build_member(user_id, member, db_user, level):
+    member_info = {
+        'id': user_id,
+        'level': level,
+        'personal_volume': float(member.get('lo', 0) or 0),
+        'team_count': len(member.get('team', [])),
+    }
+
+    if db_user:
+        member_info.update({
+            'name': db_user.get_full_name() or db_user.username,
+            'email': db_user.email,
+            'phone': db_user.phone,
+            'registration_date': db_user.date_joined.strftime('%d.%m.%Y'),
+            'group_volume': float(db_user.group_volume),
+            'partner_level': db_user.partner_level,
+        })
+
+    return member_info
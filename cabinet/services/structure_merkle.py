@@ -0,0 +1,193 @@
+"""
+Сверка структуры Django со структурой FastAPI по хешам поддеревьев (дерево Меркла).
+
+Регистрация вызывает FastAPIService.add_user синхронно и только логирует
+ошибки, поэтому структуры могут разойтись. В FastAPI пользователь
+зарегистрирован под username (см. accounts.views), поэтому user_id ниже —
+это CustomUser.username, а не CustomUser.user_id. Полная сверка — запрос на
+каждого пользователя; вместо этого у каждого узла считается хеш его
+поддерева:
+
+    hash(узел) = blake2b-128(b"user_id:" + хеши детей по возрастанию их user_id)
+
+FastAPI считает хеши так же и отдаёт их вместе с хешами детей
+(POST /user/users/structure/hashes). Сверка идёт уровнями от корней и
+спускается только в поддеревья с несовпавшим хешем: расхождение в сети
+из 100 тыс. человек находится за число запросов порядка глубины дерева.
+
+Результат — список исправлений:
+    missing       — узла нет в FastAPI (нужен add_user, родители раньше детей)
+    unexpected    — в FastAPI у пригласившего есть реферал, которого нет у нас
+    wrong_referrer — узел есть в обеих структурах, но под разными пригласившими
+"""
+import hashlib
+import logging
+
+from .network_volume import ReferralForest
+
+logger = logging.getLogger(__name__)
+
+
+def node_hash(user_id, child_hashes):
+    """child_hashes — [(user_id ребёнка, его хеш)]"""
+    digest = hashlib.blake2b(f"{user_id}:".encode(), digest_size=16)
+    for _child_id, child_hash in sorted(child_hashes):
+        digest.update(bytes.fromhex(child_hash))
+    return digest.hexdigest()
+
+
+class LocalTree:
+    """Хеши поддеревьев локального леса"""
+
+    def __init__(self, forest):
+        n = len(forest)
+        self.user_ids = forest.user_ids
+        self.index = {user_id: i for i, user_id in enumerate(forest.user_ids)}
+        self.parent = forest.parent.tolist()
+        self.children = [[] for _ in range(n)]
+        for i, p in enumerate(self.parent):
+            if p >= 0:
+                self.children[p].append(i)
+
+        # Дети в лесу всегда после родителя: обратный порядок — снизу вверх
+        self.hashes = [None] * n
+        for i in reversed(range(n)):
+            self.hashes[i] = node_hash(
+                self.user_ids[i],
+                [(self.user_ids[c], self.hashes[c]) for c in self.children[i]],
+            )
+
+    @classmethod
+    def load(cls):
+        # Узлы — под тем же идентификатором, что и при регистрации в FastAPI
+        return cls(ReferralForest.load(id_field='username'))
+
+    def roots(self):
+        return [user_id for i, user_id in enumerate(self.user_ids) if self.parent[i] < 0]
+
+    def referrer_of(self, i):
+        p = self.parent[i]
+        return self.user_ids[p] if p >= 0 else None
+
+    def subtree(self, i):
+        """Узел и его структура в порядке обхода в ширину"""
+        order = [i]
+        for node in order:
+            order.extend(self.children[node])
+        return order
+
+
+class Reconciliation:
+
+    def __init__(self):
+        self.calls = 0
+        self.compared = 0
+        self.missing = []
+        self.unexpected = []
+        self.wrong_referrer = []
+
+    @property
+    def in_sync(self):
+        return not (self.missing or self.unexpected or self.wrong_referrer)
+
+    def summary(self):
+        return {
+            'calls':          self.calls,
+            'compared':       self.compared,
+            'missing':        len(self.missing),
+            'unexpected':     len(self.unexpected),
+            'wrong_referrer': len(self.wrong_referrer),
+        }
+
+
+def reconcile(service, local=None, roots=None):
+    """
+    Сверка с FastAPI уровень за уровнем. roots — user_id корней сверки
+    (по умолчанию все корни локального леса). Возвращает Reconciliation.
+    """
+    local = local or LocalTree.load()
+    result = Reconciliation()
+    missing = {}
+    unexpected = {}
+    moved = {}
+
+    def mark_missing(i):
+        for j in local.subtree(i):
+            missing[local.user_ids[j]] = local.referrer_of(j)
+
+    frontier = list(roots or local.roots())
+    while frontier:
+        remote = service.get_structure_hashes(frontier)
+        result.calls += 1
+        result.compared += len(frontier)
+
+        next_level = []
+        for user_id in frontier:
+            i = local.index.get(user_id)
+            node = remote.get(user_id)
+            if i is None:
+                continue
+            if node is None:
+                mark_missing(i)
+                continue
+            if node.get('hash') == local.hashes[i]:
+                continue
+
+            remote_children = node.get('children') or {}
+            for c in local.children[i]:
+                child_id = local.user_ids[c]
+                if child_id not in remote_children:
+                    mark_missing(c)
+                elif remote_children[child_id] != local.hashes[c]:
+                    next_level.append(child_id)
+
+            local_children = {local.user_ids[c] for c in local.children[i]}
+            for child_id, child_hash in remote_children.items():
+                if child_id not in local_children:
+                    unexpected[child_id] = (user_id, child_hash)
+
+        # Найден в FastAPI под другим пригласившим — это переезд, а не пропуск:
+        # его структура сверяется дальше как обычно
+        if not next_level:
+            for user_id in [user_id for user_id in unexpected if user_id in missing]:
+                i = local.index[user_id]
+                for j in local.subtree(i):
+                    missing.pop(local.user_ids[j], None)
+                remote_referrer, remote_hash = unexpected.pop(user_id)
+                moved[user_id] = remote_referrer
+                if remote_hash != local.hashes[i]:
+                    next_level.append(user_id)
+
+        frontier = next_level
+
+    result.wrong_referrer = [
+        {'user_id': user_id, 'referrer_id': local.referrer_of(local.index[user_id]), 'remote_referrer': referrer}
+        for user_id, referrer in moved.items()
+    ]
+    result.unexpected = [
+        {'user_id': user_id, 'remote_referrer': referrer}
+        for user_id, (referrer, _hash) in unexpected.items()
+    ]
+    result.missing = [
+        {'user_id': user_id, 'referrer_id': referrer_id}
+        for user_id, referrer_id in missing.items()
+    ]
+    logger.info(f"Сверка структуры с FastAPI: {result.summary()}")
+    return result
+
+
+def repair(service, result):
+    """
+    Регистрирует в FastAPI недостающих (родители раньше детей).
+    Переезды и лишние узлы FastAPI так не исправить — они остаются в отчёте.
+    Возвращает (исправлено, ошибок).
+    """
+    fixed = failed = 0
+    for entry in result.missing:
+        try:
+            service.add_user(user_id=entry['user_id'], referrer_id=entry['referrer_id'])
+            fixed += 1
+        except Exception as e:
+            logger.warning(f"Не удалось зарегистрировать {entry['user_id']} в FastAPI: {e}")
+            failed += 1
+    return fixed, failed
@@ -0,0 +1,155 @@
+"""
+Помесячные снимки структуры (MonthlyTreeSnapshot).
+
+При завершении месячного отчёта структура инициатора сохраняется одним
+блобом: компактный формат tree_payload (ids, parent, имена, колонки)
+с показателями из MonthlyReport за этот месяц, JSON сжат zlib.
+
+Структура партнёра за прошлый месяц — поддерево из снимка его собственного
+отчёта или ближайшего вышестоящего; сравнение месяцев — tree_version.diff
+по двум таким поддеревьям. Одно чтение блоба на месяц вместо повтора
+регистраций и тысяч строк MonthlyReport.
+"""
+import json
+import zlib
+
+from django.db.models import Q
+
+from cabinet.models import MonthlyReport, MonthlyTreeSnapshot
+
+from . import tree_version
+from .referral_tree import load_referral_tree
+from .tree_payload import (
+    DEFAULTS, NODE_FIELDS, get_full_name, get_short_name, pack_compact, unpack_compact,
+)
+
+# Показатели узла из MonthlyReport: поле узла → поле отчёта
+REPORT_FIELDS = {
+    'personal_volume': 'personal_volume',
+    'group_volume':    'group_volume',
+    'partner_level':   'partner_level',
+    'qualification':   'partner_level',
+    'side_volume':     'side_volume',
+    'points':          'points',
+    'personal_bonus':  'personal_bonus',
+    'structure_bonus': 'structure_bonus',
+    'mentor_bonus':    'mentor_bonus',
+    'extra_bonus':     'extra_bonus',
+    'personal_money':  'personal_money',
+    'group_money':     'group_money',
+    'leader_money':    'leader_money',
+    'side_vol_money':  'side_vol_money',
+    'total_money':     'total_money',
+    'veron':           'veron',
+    'total_income':    'total_income',
+}
+
+
+def report_rows(tree, reports):
+    """
+    Строки NODE_FIELDS в порядке tree.users по отчётам месяца;
+    reports — {pk пользователя: значения MonthlyReport}
+    """
+    children = {}
+    for referrer, _referral in tree.edges():
+        children[referrer.pk] = children.get(referrer.pk, 0) + 1
+
+    rows = []
+    for user in tree.users:
+        report = reports.get(user.pk) or {}
+        node = {
+            'id':              user.user_id,
+            'label':           get_short_name(user),
+            'title':           get_full_name(user),
+            'level':           tree.depth[user.pk],
+            'active':          user.is_active,
+            'user_type':       user.user_type,
+            'total_referrals': children.get(user.pk, 0),
+        }
+        for field, source in REPORT_FIELDS.items():
+            value = report.get(source)
+            node[field] = (value or '') if isinstance(DEFAULTS[field], str) else float(value or 0)
+        rows.append(tuple(node[field] for field in NODE_FIELDS))
+    return rows
+
+
+def save_month(owner, year, month):
+    """Снимок структуры owner с отчётами за year/month; возвращает MonthlyTreeSnapshot"""
+    tree = load_referral_tree(owner)
+    reports = {
+        row['user_id']: row
+        for row in MonthlyReport.objects.filter(
+            Q(user=owner) | Q(user__referral_path__startswith=owner.referral_descendants_prefix),
+            year=year, month=month,
+        ).values('user_id', *set(REPORT_FIELDS.values()))
+    }
+    payload = pack_compact(report_rows(tree, reports), _parents(tree), tree.truncated)
+    data = zlib.compress(json.dumps(payload, separators=(',', ':')).encode())
+
+    snapshot, _created = MonthlyTreeSnapshot.objects.update_or_create(
+        owner=owner, year=year, month=month,
+        defaults={'size': len(tree.users), 'data': data},
+    )
+    return snapshot
+
+
+def _parents(tree):
+    index = {user.pk: i for i, user in enumerate(tree.users)}
+    return [index.get(tree.parent.get(user.pk), -1) for user in tree.users]
+
+
+def load_month(user, year, month):
+    """
+    Структура user на конец месяца в компактном формате или None.
+    Берётся снимок самого user или ближайшего вышестоящего, в котором он есть.
+    """
+    candidates = [user.pk, *reversed(user.get_referral_ancestor_ids())]
+    owners = set(
+        MonthlyTreeSnapshot.objects.filter(owner_id__in=candidates, year=year, month=month)
+        .values_list('owner_id', flat=True)
+    )
+    for owner_id in candidates:
+        if owner_id not in owners:
+            continue
+        data = MonthlyTreeSnapshot.objects.filter(
+            owner_id=owner_id, year=year, month=month,
+        ).values_list('data', flat=True).first()
+        payload = subtree(json.loads(zlib.decompress(data)), user.user_id)
+        if payload is not None:
+            return payload
+    return None
+
+
+def subtree(payload, user_id):
+    """Поддерево узла user_id из компактного снимка (корень — user_id) или None"""
+    rows, parent = unpack_compact(payload)
+
+    index = {}
+    kept = []
+    kept_parent = []
+    for i, row in enumerate(rows):
+        if row[0] == user_id:
+            kept_parent.append(-1)
+        elif parent[i] in index:
+            kept_parent.append(index[parent[i]])
+        else:
+            continue
+        index[i] = len(kept)
+        kept.append(row)
+
+    if not kept:
+        return None
+    return pack_compact(kept, kept_parent, payload.get('truncated', False))
+
+
+def diff(old, new):
+    """Изменения между двумя месяцами в формате tree_version.diff"""
+    return tree_version.diff(_snapshot(old), _snapshot(new))
+
+
+def _snapshot(payload):
+    rows, parent = unpack_compact(payload)
+    return {
+        row[0]: (rows[p][0] if p >= 0 else None, *row[1:])
+        for row, p in zip(rows, parent)
+    }
@@ -0,0 +1,293 @@
+"""
+Раскладка дерева структуры на сервере (referral_tree_api?format=compact&layout=1).
+
+Координаты считаются алгоритмом tidy tree (Walker в линейной версии
+Buchheim, Jünger, Leipert) без рекурсии — глубина структуры не ограничена
+стеком. x — в шагах между соседними карточками, y — уровень; клиент только
+масштабирует и рисует.
+
+Узлы (кроме корня), у которых в структуре больше
+REFERRAL_TREE_CLUSTER_THRESHOLD участников, сворачиваются: вместо их
+поддерева рисуется один узел-кластер с количеством и суммарным ЛО.
+
+Раскладка зависит только от формы дерева, поэтому кешируется по отпечатку
+(pk, pk пригласившего) всех узлов — изменилась структура, изменился и ключ.
+"""
+import hashlib
+import logging
+from array import array
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+DISTANCE = 1
+
+
+class Layout:
+    """
+    visible  — индексы tree.users, которые рисуются (в порядке обхода)
+    x, y     — координаты видимых узлов
+    clusters — [(индекс свёрнутого узла, участников в кластере, x, y)]
+    """
+
+    def __init__(self, visible, x, y, clusters):
+        self.visible = visible
+        self.x = x
+        self.y = y
+        self.clusters = clusters
+
+    @property
+    def width(self):
+        return max([*self.x, *(c[2] for c in self.clusters)], default=0)
+
+    @property
+    def depth(self):
+        return max([*self.y, *(c[3] for c in self.clusters)], default=0)
+
+    def to_cache(self):
+        return (self.visible, self.x, self.y, self.clusters)
+
+
+def tree_digest(tree):
+    """Отпечаток формы дерева: порядок узлов и их родители"""
+    h = hashlib.blake2b(digest_size=16)
+    for user in tree.users:
+        h.update(f"{user.pk}:{tree.parent.get(user.pk, 0)};".encode())
+    return h.hexdigest()
+
+
+def layout_cache_key(tree, threshold):
+    return f"referral_layout:{tree.root.pk}:{threshold}:{tree_digest(tree)}"
+
+
+def get_layout(tree, threshold=None):
+    """Раскладка из кеша или расчёт с сохранением в кеш"""
+    if threshold is None:
+        threshold = settings.REFERRAL_TREE_CLUSTER_THRESHOLD
+
+    key = layout_cache_key(tree, threshold)
+    try:
+        cached = cache.get(key)
+    except Exception as e:
+        logger.warning(f"Кеш раскладки недоступен: {e}")
+        cached = None
+    if cached is not None:
+        return Layout(*cached)
+
+    layout = compute_layout(tree, threshold)
+    try:
+        cache.set(key, layout.to_cache(), timeout=settings.REFERRAL_LAYOUT_CACHE_TTL)
+    except Exception as e:
+        logger.warning(f"Не удалось сохранить раскладку: {e}")
+    return layout
+
+
+def layout_payload(tree, layout, statuses):
+    """
+    Блок layout для компактного формата: координаты видимых узлов
+    (в порядке ids) и кластеры со свёрнутой структурой.
+    statuses — {user_id: статус FastAPI} для всех узлов дерева.
+    """
+    index = {user.pk: i for i, user in enumerate(tree.users)}
+    position = {i: k for k, i in enumerate(layout.visible)}
+    collapsed = {c[0] for c in layout.clusters}
+
+    # Суммарный ЛО скрытых узлов — по ближайшему свёрнутому предку
+    cluster_of = {}
+    volume = dict.fromkeys(collapsed, 0.0)
+    for user in tree.users[1:]:
+        p = index.get(tree.parent.get(user.pk))
+        owner = p if p in collapsed else cluster_of.get(p)
+        if owner is None:
+            continue
+        cluster_of[index[user.pk]] = owner
+        st = statuses.get(user.user_id) or {}
+        volume[owner] += float(st.get('lo', 0) or 0)
+
+    return {
+        'x':     layout.x,
+        'y':     layout.y,
+        'width': layout.width,
+        'depth': layout.depth,
+        'clusters': {
+            'node':            [position[i] for i, *_rest in layout.clusters],
+            'count':           [count for _i, count, _x, _y in layout.clusters],
+            'personal_volume': [round(volume[i], 2) for i, *_rest in layout.clusters],
+            'x':               [x for _i, _count, x, _y in layout.clusters],
+            'y':               [y for _i, _count, _x, y in layout.clusters],
+        },
+    }
+
+
+def subtree_sizes(parents):
+    """Размер поддерева каждого узла (с ним самим); parents — индекс родителя, у корня -1"""
+    size = [1] * len(parents)
+    for i in range(len(parents) - 1, 0, -1):
+        size[parents[i]] += size[i]
+    return size
+
+
+def compute_layout(tree, threshold):
+    index = {user.pk: i for i, user in enumerate(tree.users)}
+    parents = [index.get(tree.parent.get(user.pk), -1) for user in tree.users]
+    sizes = subtree_sizes(parents)
+
+    # Видимое дерево: узлы-кластеры добавляются в конец как листья
+    visible = []
+    node_of = {}          # индекс в tree.users → узел раскладки
+    owner = []            # узел раскладки → индекс в tree.users (у кластера — свёрнутый узел)
+    layout_parent = []
+    collapsed = set()
+
+    for i, p in enumerate(parents):
+        if p >= 0 and (p not in node_of or p in collapsed):
+            continue
+        node_of[i] = len(owner)
+        owner.append(i)
+        layout_parent.append(node_of[p] if p >= 0 else -1)
+        visible.append(i)
+        if p >= 0 and sizes[i] - 1 > threshold:
+            collapsed.add(i)
+
+    cluster_nodes = []
+    for i in sorted(collapsed):
+        cluster_nodes.append((i, len(owner)))
+        owner.append(i)
+        layout_parent.append(node_of[i])
+
+    x, y = tidy_tree(layout_parent)
+
+    n = len(visible)
+    return Layout(
+        visible=visible,
+        x=x[:n],
+        y=y[:n],
+        clusters=[(i, sizes[i] - 1, x[node], y[node]) for i, node in cluster_nodes],
+    )
+
+
+def tidy_tree(parents):
+    """
+    Координаты tidy tree для дерева, заданного массивом родителей.
+    Родитель должен идти раньше детей (корень — индекс 0); порядок
+    детей — порядок в массиве. Возвращает (x, y), min(x) == 0.
+    """
+    n = len(parents)
+    if n == 0:
+        return [], []
+
+    children = [[] for _ in range(n)]
+    level = [0] * n
+    for v in range(1, n):
+        children[parents[v]].append(v)
+
+    # Родители раньше детей, но не обязательно по уровням — порядок обхода в ширину
+    order = [0]
+    for v in order:
+        for w in children[v]:
+            level[w] = level[v] + 1
+            order.append(w)
+
+    number = [0] * n
+    for kids in children:
+        for k, w in enumerate(kids):
+            number[w] = k
+
+    prelim = array('d', bytes(8 * n))
+    mod = array('d', bytes(8 * n))
+    shift = array('d', bytes(8 * n))
+    change = array('d', bytes(8 * n))
+    mid = array('d', bytes(8 * n))
+    thread = [-1] * n
+    ancestor = list(range(n))
+
+    def next_left(v):
+        return children[v][0] if children[v] else thread[v]
+
+    def next_right(v):
+        return children[v][-1] if children[v] else thread[v]
+
+    def move_subtree(wl, wr, amount):
+        subtrees = number[wr] - number[wl]
+        change[wr] -= amount / subtrees
+        shift[wr] += amount
+        change[wl] += amount / subtrees
+        prelim[wr] += amount
+        mod[wr] += amount
+
+    def apportion(v, default_ancestor):
+        if number[v] == 0:
+            return default_ancestor
+        siblings = children[parents[v]]
+        vip = vop = v
+        vim = siblings[number[v] - 1]
+        vom = siblings[0]
+        sip, sop, sim, som = mod[vip], mod[vop], mod[vim], mod[vom]
+
+        while next_right(vim) >= 0 and next_left(vip) >= 0:
+            vim = next_right(vim)
+            vip = next_left(vip)
+            vom = next_left(vom)
+            vop = next_right(vop)
+            ancestor[vop] = v
+            amount = (prelim[vim] + sim) - (prelim[vip] + sip) + DISTANCE
+            if amount > 0:
+                a = ancestor[vim]
+                wl = a if parents[a] == parents[v] else default_ancestor
+                move_subtree(wl, v, amount)
+                sip += amount
+                sop += amount
+            sim += mod[vim]
+            sip += mod[vip]
+            som += mod[vom]
+            sop += mod[vop]
+
+        if next_right(vim) >= 0 and next_right(vop) < 0:
+            thread[vop] = next_right(vim)
+            mod[vop] += sim - sop
+        if next_left(vip) >= 0 and next_left(vom) < 0:
+            thread[vom] = next_left(vip)
+            mod[vom] += sip - som
+            default_ancestor = v
+        return default_ancestor
+
+    # Первый проход: снизу вверх. prelim узла зависит от левого брата,
+    # поэтому назначается при обработке родителя — слева направо
+    for v in reversed(order):
+        kids = children[v]
+        if not kids:
+            continue
+
+        default_ancestor = kids[0]
+        for k, w in enumerate(kids):
+            if k == 0:
+                prelim[w] = mid[w] if children[w] else 0
+            else:
+                prelim[w] = prelim[kids[k - 1]] + DISTANCE
+                if children[w]:
+                    mod[w] = prelim[w] - mid[w]
+            default_ancestor = apportion(w, default_ancestor)
+
+        total_shift = total_change = 0.0
+        for w in reversed(kids):
+            prelim[w] += total_shift
+            mod[w] += total_shift
+            total_change += change[w]
+            total_shift += shift[w] + total_change
+
+        mid[v] = (prelim[kids[0]] + prelim[kids[-1]]) / 2
+
+    prelim[0] = mid[0] if children[0] else 0
+
+    # Второй проход: сверху вниз, накопленные mod предков
+    x = [0.0] * n
+    acc = [0.0] * n
+    for v in order:
+        x[v] = prelim[v] + acc[v]
+        for w in children[v]:
+            acc[w] = acc[v] + mod[v]
+
+    left = min(x)
+    return [round(value - left, 3) for value in x], level
@@ -0,0 +1,184 @@
+"""
+Узлы дерева структуры для referral_tree_api.
+
+Значения узла считаются один раз (node_rows — кортеж на узел в порядке
+NODE_FIELDS) и раскладываются в нужный формат: словарь на узел (формат
+по умолчанию), колонки (compact) или снимок для дельт (tree_version).
+
+Компактный колоночный формат (?format=compact) — общие массивы:
+
+    ids     — user_id узлов в порядке обхода в ширину (корень первый)
+    parent  — индекс пригласившего в ids, у корня -1
+    label, title — короткое и полное имя
+    columns — {поле: [[индексы], [значения]]}; узлы со значением
+              по умолчанию (defaults) в колонку не попадают
+    defaults — значения по умолчанию для колонок
+
+Уровень узла на клиенте считается по parent: родитель всегда раньше ребёнка.
+"""
+from . import extra_bonus
+
+NODE_FIELDS = (
+    'id', 'label', 'title', 'level', 'active', 'user_type',
+    'personal_volume', 'group_volume', 'partner_level', 'total_referrals', 'qualification',
+    'side_volume', 'points', 'personal_bonus', 'structure_bonus', 'mentor_bonus', 'extra_bonus',
+    'personal_money', 'group_money', 'leader_money', 'side_vol_money', 'total_money',
+    'veron', 'total_income',
+)
+
+DEFAULTS = {
+    'active':          True,
+    'user_type':       'partner',
+    'personal_volume': 0,
+    'group_volume':    0,
+    'partner_level':   '',
+    'total_referrals': 0,
+    'qualification':   '',
+    'side_volume':     0,
+    'points':          0,
+    'personal_bonus':  0,
+    'structure_bonus': 0,
+    'mentor_bonus':    0,
+    'extra_bonus':     '',
+    'personal_money':  0,
+    'group_money':     0,
+    'leader_money':    0,
+    'side_vol_money':  0,
+    'total_money':     0,
+    'veron':           0,
+    'total_income':    0,
+}
+
+# Колонки компактного формата: всё, кроме id, имён и уровня
+COLUMN_FIELDS = [(k, field) for k, field in enumerate(NODE_FIELDS) if field in DEFAULTS]
+
+
+def node_rows(tree, statuses, best_ranks):
+    """
+    Значения узлов в порядке tree.users, кортеж на узел по NODE_FIELDS.
+
+    statuses   — {user_id: статус FastAPI}
+    best_ranks — {user_id: лучший ранг extra_bonus в прошлых месяцах}
+    """
+    rows = []
+    for user in tree.users:
+        st = statuses.get(user.user_id) or {}
+
+        def metric(key):
+            return st.get(key, 0) if st else 0
+
+        current_extra = st.get('extra_bonus', '') or ''
+        if extra_bonus.rank_of(current_extra) <= best_ranks.get(user.user_id, 0):
+            current_extra = ''
+
+        rows.append((
+            user.user_id,
+            get_short_name(user),
+            get_full_name(user),
+            tree.depth[user.pk],
+            user.is_active,
+            user.user_type,
+            float(st.get('lo', 0) or 0),
+            float(st.get('go', 0) or 0),
+            st.get('qualification', user.partner_level) if st else user.partner_level,
+            user.total_referrals,
+            st.get('qualification', '') if st else '',
+            metric('side_volume'),
+            metric('points'),
+            metric('personal_bonus'),
+            metric('structure_bonus'),
+            metric('mentor_bonus'),
+            current_extra,
+            metric('personal_money'),
+            metric('group_money'),
+            metric('leader_money'),
+            metric('side_vol_money'),
+            metric('total_money'),
+            metric('veron'),
+            metric('total_income'),
+        ))
+    return rows
+
+
+def full_nodes(rows):
+    """Формат по умолчанию: словарь на узел"""
+    return [dict(zip(NODE_FIELDS, row)) for row in rows]
+
+
+def compact_tree(tree, rows, visible=None):
+    """
+    Компактный формат. visible — индексы узлов tree.users, которые
+    попадают в ответ (с предками, в порядке обхода); по умолчанию все.
+    """
+    order = range(len(rows)) if visible is None else visible
+    index = {}
+    parent = []
+    for i, source in enumerate(order):
+        user = tree.users[source]
+        index[user.pk] = i
+        parent.append(index.get(tree.parent.get(user.pk), -1))
+
+    return pack_compact([rows[source] for source in order], parent, tree.truncated)
+
+
+def pack_compact(rows, parent, truncated=False):
+    """Компактный формат из строк NODE_FIELDS и индексов пригласивших"""
+    columns = {field: ([], []) for _k, field in COLUMN_FIELDS}
+    for i, row in enumerate(rows):
+        for k, field in COLUMN_FIELDS:
+            value = row[k]
+            if value != DEFAULTS[field] and value is not None:
+                column = columns[field]
+                column[0].append(i)
+                column[1].append(value)
+
+    return {
+        'format':    'compact',
+        'ids':       [row[0] for row in rows],
+        'parent':    list(parent),
+        'label':     [row[1] for row in rows],
+        'title':     [row[2] for row in rows],
+        'columns':   {field: [idx, values] for field, (idx, values) in columns.items() if idx},
+        'defaults':  DEFAULTS,
+        'truncated': truncated,
+    }
+
+
+def unpack_compact(payload):
+    """
+    Обратно в строки NODE_FIELDS и индексы пригласивших;
+    уровень считается по parent, у корней — 0.
+    """
+    parent = payload['parent']
+    defaults = payload.get('defaults', DEFAULTS)
+    values = {field: [defaults.get(field, DEFAULTS[field])] * len(parent) for _k, field in COLUMN_FIELDS}
+    for field, (idx, column) in payload['columns'].items():
+        if field in values:
+            for i, value in zip(idx, column):
+                values[field][i] = value
+
+    level = []
+    for p in parent:
+        level.append(level[p] + 1 if p >= 0 else 0)
+
+    named = {
+        'id': payload['ids'],
+        'label': payload['label'],
+        'title': payload['title'],
+        'level': level,
+        **values,
+    }
+    rows = list(zip(*(named[field] for field in NODE_FIELDS))) if parent else []
+    return rows, parent
+
+
+def get_short_name(user):
+    parts = [user.first_name, user.last_name]
+    name = ' '.join(p for p in parts if p).strip()
+    return name or user.username
+
+
+def get_full_name(user):
+    parts = [user.last_name, user.first_name, getattr(user, 'middle_name', '')]
+    name = ' '.join(p for p in parts if p).strip()
+    return name or user.username
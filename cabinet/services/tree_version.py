@@ -0,0 +1,114 @@
+"""
+Версия дерева структуры и дельты для обновления графа (referral_tree_api?since=).
+
+Версия корня — время последнего изменения формы его структуры
+(CustomUser.referral_tree_changed_at), время последнего изменения статуса
+внутри неё (status_cache.last_changed) и хеш полей узлов, которые меняются
+без переноса: имена, активность, тип, лучший доп. бонус (users_digest).
+Статусы и правки чужих структур версию не меняют. Считается после загрузки
+статусов дерева — загрузка сама может их обновить. Совпала версия — ничего
+не изменилось, ответ 304.
+
+Снимок узлов каждой отданной версии лежит в кеше REFERRAL_TREE_SNAPSHOT_TTL
+и записывается один раз на версию — повторные запросы только продлевают его.
+По снимку версии клиента считается, кто добавился, кто ушёл и какие поля
+изменились. Снимка уже нет — клиенту отдаётся дерево целиком.
+"""
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import status_cache
+from .tree_payload import NODE_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# Поля снимка: пригласивший и всё, кроме id
+SNAPSHOT_FIELDS = ('parent', *NODE_FIELDS[1:])
+
+# Поля пользователя, из которых tree_payload.node_rows строит узел
+USER_FIELDS = (
+    'username', 'first_name', 'last_name', 'middle_name',
+    'is_active', 'user_type', 'partner_level', 'total_referrals',
+)
+
+
+def tree_version(root, tree, best_ranks):
+    """
+    Версия дерева tree корня root; статусы его узлов уже загружены,
+    best_ranks — {pk: лучший ранг extra_bonus} (extra_bonus.best_ranks)
+    """
+    changed_at = root.referral_tree_changed_at
+    stamp = int(changed_at.timestamp() * 1_000_000) if changed_at else 0
+    last_changed = status_cache.last_changed(user.user_id for user in tree.users)
+    return f"{stamp}-{last_changed}-{users_digest(tree, best_ranks)}"
+
+
+def users_digest(tree, best_ranks):
+    """Короткий хеш полей пользователей дерева и их лучших доп. бонусов"""
+    digest = hashlib.blake2b(digest_size=8)
+    for user in tree.users:
+        values = (user.pk, *(getattr(user, field) for field in USER_FIELDS), best_ranks.get(user.pk, 0))
+        digest.update(repr(values).encode())
+    return digest.hexdigest()
+
+
+def snapshot_key(root, version):
+    return f"referral_tree:snapshot:{root.pk}:{version}"
+
+
+def make_snapshot(tree, rows):
+    """{user_id: (user_id пригласившего, остальные поля узла)}"""
+    parent_ids = {referral.pk: referrer.user_id for referrer, referral in tree.edges()}
+    return {
+        row[0]: (parent_ids.get(user.pk), *row[1:])
+        for user, row in zip(tree.users, rows)
+    }
+
+
+def save_snapshot(root, version, snapshot):
+    """Снимок версии уже в кеше — только продлеваем его, не перезаписывая"""
+    key = snapshot_key(root, version)
+    timeout = settings.REFERRAL_TREE_SNAPSHOT_TTL
+    try:
+        if not cache.touch(key, timeout=timeout):
+            cache.set(key, snapshot, timeout=timeout)
+    except Exception as e:
+        logger.warning(f"Не удалось сохранить снимок дерева {root.username}: {e}")
+
+
+def load_snapshot(root, version):
+    try:
+        return cache.get(snapshot_key(root, version))
+    except Exception as e:
+        logger.warning(f"Снимок дерева {root.username} недоступен: {e}")
+        return None
+
+
+def diff(old, new):
+    """
+    Изменения между снимками:
+        added   — узлы целиком (с parent)
+        removed — user_id ушедших
+        changed — {user_id: {поле: новое значение}}
+    """
+    added = [
+        {'id': user_id, **dict(zip(SNAPSHOT_FIELDS, values))}
+        for user_id, values in new.items() if user_id not in old
+    ]
+    removed = [user_id for user_id in old if user_id not in new]
+
+    changed = {}
+    for user_id, values in new.items():
+        previous = old.get(user_id)
+        if previous is None or previous == values:
+            continue
+        changed[user_id] = {
+            field: value
+            for field, before, value in zip(SNAPSHOT_FIELDS, previous, values)
+            if before != value
+        }
+
+    return {'added': added, 'removed': removed, 'changed': changed}
@@ -1,31 +1,117 @@
 # tasks.py
 import logging
+import time
 from celery import shared_task
+from django.conf import settings
 from django.core.cache import cache
-from .services.fastapi_service import FastAPIService
+from accounts.models import CustomUser
+from .models import MonthlyReportJob
+from .services import activity_feed, forest_snapshot, monthly_report, structure_merkle
+from .services.fastapi_service import FastAPIService, HashesNotSupported
+from .services.status_cache import refresh_lock_key, store_statuses
 
 logger = logging.getLogger(__name__)
 
-CACHE_TTL = 300  # 5 минут
-
-
-# @shared_task(
-#     bind=True,
-#     autoretry_for=(Exception,),
-#     retry_backoff=10,
-#     retry_kwargs={"max_retries": 5},
-# )
-# def update_user_stats_cache(self, user_id: str):
-#     """
-#     Асинхронно получает данные из FastAPI и кладёт в cache
-#     """
-#     logger.info(f"Start async stats update for user {user_id}")
-#
-#     service = FastAPIService()
-#     data = service.get_user_stats(user_id)
-#
-#     cache_key = f"user:stats:{user_id}"
-#     cache.set(cache_key, data, timeout=CACHE_TTL)
-#
-#     logger.info(f"Stats cached for user {user_id}")
-#     return True
+
+@shared_task
+def refresh_user_statuses(user_ids):
+    """
+    Фоновое обновление кеша статусов из FastAPI.
+    Неудачные запросы не затирают последнее известное значение.
+    """
+    logger.info(f"Start async status refresh for {len(user_ids)} users")
+
+    try:
+        statuses = FastAPIService().get_users_status_bulk(user_ids)
+        refreshed = store_statuses(statuses)
+    finally:
+        cache.delete_many([refresh_lock_key(user_id) for user_id in user_ids])
+
+    logger.info(f"Statuses cached: {refreshed} of {len(user_ids)}")
+    return {'status': 'success', 'requested': len(user_ids), 'refreshed': refreshed}
+
+
+@shared_task
+def run_monthly_report_job(job_id):
+    """
+    Месячный отчёт структуры: фиксируем состав, затем пачки.
+    Повторный запуск продолжает с контрольных точек.
+    """
+    job = MonthlyReportJob.objects.select_related('owner').get(pk=job_id)
+
+    try:
+        total = monthly_report.collect_users(job)
+    except Exception as e:
+        logger.exception(f"MonthlyReportJob {job_id}: не удалось собрать структуру")
+        monthly_report.fail_job(job, e)
+        raise
+
+    logger.info(f"MonthlyReportJob {job_id}: {total} users")
+    process_monthly_report_chunks.delay(job_id)
+
+
+@shared_task
+def process_monthly_report_chunks(job_id):
+    """
+    Обрабатывает пачки, пока не выйдет MONTHLY_REPORT_TASK_BUDGET секунд,
+    затем ставит себя в очередь снова — задача не упирается в time limit.
+    """
+    job = MonthlyReportJob.objects.get(pk=job_id)
+    deadline = time.monotonic() + settings.MONTHLY_REPORT_TASK_BUDGET
+
+    try:
+        while time.monotonic() < deadline:
+            if not monthly_report.process_chunk(job):
+                return monthly_report.finish_job(job)
+    except Exception as e:
+        logger.exception(f"MonthlyReportJob {job_id}: ошибка обработки пачки")
+        monthly_report.fail_job(job, e)
+        raise
+
+    process_monthly_report_chunks.delay(job_id)
+    return monthly_report.job_progress(job)
+
+
+@shared_task
+def refresh_referral_forest_snapshot():
+    """Пересборка общего снимка леса структуры (cabinet.services.forest_snapshot)"""
+    size = forest_snapshot.publish()
+    logger.info(f"Referral forest snapshot published: {size} users")
+    return {'status': 'success', 'users': size}
+
+
+@shared_task
+def reconcile_structure(repair=False):
+    """
+    Сверка структуры с FastAPI по хешам поддеревьев (cabinet.services.structure_merkle);
+    repair=True — зарегистрировать недостающих
+    """
+    service = FastAPIService()
+    try:
+        result = structure_merkle.reconcile(service)
+    except HashesNotSupported as e:
+        logger.warning(f"Structure reconcile skipped: FastAPI has no structure hashes route ({e})")
+        return {'status': 'skipped', 'reason': 'hashes_not_supported'}
+    summary = result.summary()
+
+    if repair and result.missing:
+        summary['repaired'], summary['repair_errors'] = structure_merkle.repair(service, result)
+    if not result.in_sync:
+        logger.warning(f"Structure drift with FastAPI: {summary}")
+    return summary
+
+
+@shared_task
+def fan_out_team_event(username, kind, value=None):
+    """
+    Событие партнёра в ленты его вышестоящих (cabinet.services.activity_feed).
+    Партнёр — по username: под ним он зарегистрирован в FastAPI
+    """
+    user = CustomUser.objects.only(
+        'user_id', 'username', 'first_name', 'last_name', 'referral_path', 'referral_depth',
+    ).filter(username=username).first()
+    if user is None:
+        return {'status': 'skipped', 'username': username}
+
+    pushed = activity_feed.push(activity_feed.upline(user), activity_feed.make_event(kind, user, value))
+    return {'status': 'success', 'feeds': pushed}
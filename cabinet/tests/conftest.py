@@ -0,0 +1,25 @@
+import pytest
+from django.core.cache import cache
+
+from cabinet.services import forest_snapshot
+
+
+@pytest.fixture(autouse=True)
+def locmem_cache(settings):
+    """Кеш в памяти вместо Redis"""
+    settings.CACHES = {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+    }
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def snapshot_path(settings, tmp_path):
+    """Снимок леса структуры — во временном каталоге теста"""
+    settings.REFERRAL_FOREST_SNAPSHOT_PATH = str(tmp_path / 'var' / 'forest.snap')
+    settings.REFERRAL_FOREST_SNAPSHOT_CHECK = 0
+    forest_snapshot._current = None
+    yield settings.REFERRAL_FOREST_SNAPSHOT_PATH
+    forest_snapshot._current = None
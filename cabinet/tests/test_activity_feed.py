@@ -0,0 +1,80 @@
+from unittest.mock import patch
+
+import pytest
+from django.test import override_settings
+from django.urls import reverse
+
+from cabinet.services import activity_feed
+from cabinet.services.fastapi_stub import FastAPIStub
+from cabinet.tasks import fan_out_team_event
+
+
+@pytest.fixture
+def network(create_partner):
+    """root → a → c; other — чужая структура"""
+    root = create_partner(first_name='Root')
+    a = create_partner(referrer=root, first_name='Aziz')
+    # Логин не совпадает с user_id: в FastAPI партнёр зарегистрирован под логином
+    c = create_partner(referrer=a, first_name='Sardor', username='sardor')
+    other = create_partner()
+    return {'root': root, 'a': a, 'c': c, 'other': other}
+
+
+@pytest.mark.django_db
+def test_join_fans_out_to_upline(network):
+    root, a, c = network['root'], network['a'], network['c']
+
+    assert fan_out_team_event.delay(c.username, activity_feed.JOIN).get() == {'status': 'success', 'feeds': 2}
+
+    [for_root] = activity_feed.recent(root)
+    assert (for_root['type'], for_root['user_id'], for_root['name'], for_root['level']) == (
+        'join', c.user_id, 'Sardor', 2,
+    )
+    assert activity_feed.recent(a)[0]['level'] == 1
+    assert activity_feed.recent(c) == []
+    assert activity_feed.recent(network['other']) == []
+
+
+@pytest.mark.django_db
+@override_settings(ACTIVITY_FEED_SIZE=3, ACTIVITY_FEED_MAX_UPLINE=1)
+def test_feed_is_capped_and_upline_bounded(network):
+    for value in range(5):
+        fan_out_team_event(network['c'].username, activity_feed.LO, value)
+
+    assert [event['value'] for event in activity_feed.recent(network['a'])] == [4, 3, 2]
+    assert activity_feed.recent(network['root']) == []
+
+
+@pytest.mark.django_db
+def test_lo_change_and_dashboard(client, network, django_capture_on_commit_callbacks):
+    root, c = network['root'], network['c']
+
+    with (
+        FastAPIStub() as stub, override_settings(FASTAPI_SERVICE_URL=stub.url),
+        django_capture_on_commit_callbacks(execute=True),
+    ):
+        client.force_login(c)
+        client.post(reverse('cabinet:add_user_lo'), {'lo': '5', 'user_id': c.username},
+                    content_type='application/json')
+        client.post(reverse('cabinet:sub_user_lo'), {'lo': '2', 'user_id': c.username},
+                    content_type='application/json')
+
+    assert [(e['type'], e['value']) for e in activity_feed.recent(root)] == [('lo', -2.0), ('lo', 5.0)]
+
+    client.force_login(root)
+    with patch('cabinet.views.status_cache.get_status', return_value={}):
+        response = client.get(reverse('cabinet:dashboard'))
+
+    assert [e['user_id'] for e in response.context['team_feed']] == [c.user_id, c.user_id]
+    assert 'Sardor: ЛО -2 бал' in response.content.decode()
+
+
+@pytest.mark.django_db
+def test_publish_waits_for_commit(network, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks() as callbacks:
+        activity_feed.publish(network['c'].username, activity_feed.JOIN)
+        assert activity_feed.recent(network['a']) == []
+
+    assert len(callbacks) == 1
+    callbacks[0]()
+    assert activity_feed.recent(network['a'])[0]['type'] == 'join'
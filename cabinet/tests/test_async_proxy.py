@@ -0,0 +1,66 @@
+import pytest
+from django.test import override_settings
+from django.urls import reverse
+
+from cabinet.services.fastapi_stub import FastAPIStub
+
+
+@pytest.fixture
+def partner(client, create_partner):
+    user = create_partner()
+    client.force_login(user)
+    return user
+
+
+@pytest.fixture
+def stub():
+    with FastAPIStub() as stub, override_settings(FASTAPI_SERVICE_URL=stub.url):
+        yield stub
+
+
+@pytest.mark.django_db
+def test_user_status_proxy(client, partner, stub):
+    stub.statuses[partner.username] = {'lo': 42}
+
+    response = client.get(reverse('cabinet:get_user_data'))
+
+    assert response.status_code == 200
+    assert response.json() == {'error': False, 'data': {'lo': 42}}
+
+
+@pytest.mark.django_db
+def test_add_and_subtract_lo(client, partner, stub):
+    stub.statuses[partner.username] = {'lo': 10}
+
+    client.post(reverse('cabinet:add_user_lo'), {'lo': '5', 'user_id': partner.username},
+                content_type='application/json')
+    response = client.post(reverse('cabinet:sub_user_lo'), {'lo': '3', 'user_id': partner.username},
+                           content_type='application/json')
+
+    assert response.json()['data']['lo'] == 12
+    assert client.post(reverse('cabinet:add_user_lo'), {'lo': 'abc'},
+                       content_type='application/json').status_code == 400
+    assert client.get(reverse('cabinet:add_user_lo')).status_code == 405
+
+
+@pytest.mark.django_db
+def test_referrals_first_level(client, partner, stub, create_partner):
+    referral = create_partner(referrer=partner)
+    stub.teams[partner.username] = [{'user_id': referral.user_id, 'lo': 7, 'team': []}]
+
+    data = client.get(reverse('cabinet:referrals_json')).json()
+
+    assert data['total_count'] == 1
+    assert data['referrals'][0]['id'] == referral.user_id
+    assert data['referrals'][0]['personal_volume'] == 7
+
+
+@pytest.mark.django_db
+def test_upstream_unavailable(client, partner):
+    with FastAPIStub() as stub:
+        url = stub.url
+
+    with override_settings(FASTAPI_SERVICE_URL=url):
+        response = client.get(reverse('cabinet:get_user_team'))
+
+    assert response.status_code == 503
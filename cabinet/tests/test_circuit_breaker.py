@@ -0,0 +1,114 @@
+import asyncio
+import time
+
+import pytest
+from django.core.cache import cache
+from django.test import override_settings
+
+from cabinet.services import status_cache
+from cabinet.services.circuit_breaker import (
+    CLOSED, HALF_OPEN, OPEN, AsyncCircuitOpenError, CircuitBreaker, CircuitOpenError,
+    get_fastapi_breaker,
+)
+from cabinet.services.fastapi_async_service import AsyncFastAPIService
+from cabinet.services.fastapi_service import FastAPIService
+from cabinet.services.fastapi_stub import FastAPIStub
+
+
+@pytest.fixture
+def stub(settings):
+    settings.FASTAPI_CIRCUIT_FAILURE_THRESHOLD = 2
+    settings.FASTAPI_RETRIES = 0
+    with FastAPIStub() as stub, override_settings(FASTAPI_SERVICE_URL=stub.url):
+        yield stub
+
+
+def expire_open_state(breaker):
+    cache.set(breaker._opened_at_key, time.time() - breaker.recovery_timeout - 1, timeout=None)
+
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker('test', failure_threshold=3, failure_window=30, recovery_timeout=30)
+
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state() == CLOSED
+
+    breaker.record_failure()
+    assert breaker.state() == OPEN
+    assert not breaker.allow_request()
+
+
+def test_half_open_lets_single_probe_through():
+    breaker = CircuitBreaker('test', failure_threshold=1, failure_window=30, recovery_timeout=30)
+    breaker.record_failure()
+    expire_open_state(breaker)
+
+    assert breaker.state() == HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+    breaker.record_failure()
+    assert breaker.state() == OPEN
+
+
+def test_half_open_success_closes():
+    breaker = CircuitBreaker('test', failure_threshold=1, failure_window=30, recovery_timeout=30)
+    breaker.record_failure()
+    expire_open_state(breaker)
+
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state() == CLOSED
+    assert breaker.allow_request()
+
+
+def test_service_fails_fast_when_open(stub):
+    """После порога отказов запросы к upstream не отправляются"""
+    stub.fail = True
+    service = FastAPIService()
+
+    for _ in range(2):
+        with pytest.raises(Exception):
+            service.get_user_stats('00000001')
+    assert stub.requests['failed'] == 2
+
+    with pytest.raises(CircuitOpenError):
+        service.get_user_stats('00000001')
+    assert stub.requests['failed'] == 2
+
+    assert service.get_users_status_bulk(['00000001']) == {'00000001': {}}
+    assert stub.requests['failed'] == 2
+
+
+def test_async_service_shares_state(stub):
+    """Sync и async клиенты видят одну цепь"""
+    stub.fail = True
+    breaker = get_fastapi_breaker()
+    breaker.record_failure()
+    breaker.record_failure()
+
+    async def fetch():
+        return await AsyncFastAPIService().get_user_status('00000001')
+
+    with pytest.raises(AsyncCircuitOpenError):
+        asyncio.run(fetch())
+    assert stub.requests['failed'] == 0
+
+
+def test_status_cache_serves_last_known_when_open(stub):
+    """При открытой цепи кеш отдаёт последнее известное значение без запросов"""
+    status_cache.store_statuses({'00000001': {'lo': 1}})
+    entry = cache.get(status_cache.status_key('00000001'))
+    entry['fetched_at'] -= 3600
+    cache.set(status_cache.status_key('00000001'), entry)
+
+    breaker = get_fastapi_breaker()
+    breaker.record_failure()
+    breaker.record_failure()
+
+    assert status_cache.get_statuses(['00000001', '00000002']) == {
+        '00000001': {'lo': 1},
+        '00000002': {},
+    }
+    assert sum(stub.requests.values()) == 0
@@ -0,0 +1,63 @@
+import pytest
+from django.core.management import call_command
+
+from cabinet.models import BestExtraBonus, MonthlyReport
+from cabinet.services import extra_bonus, monthly_report
+
+
+def save_month(user, year, month, bonus):
+    monthly_report.write_reports([user], {user.username: {'lo': 1, 'extra_bonus': bonus}}, year, month)
+    return MonthlyReport.objects.get(user=user, year=year, month=month).extra_bonus
+
+
+@pytest.mark.django_db
+def test_only_better_bonus_is_recorded(create_partner):
+    user = create_partner()
+
+    assert save_month(user, 2026, 1, 'Gaz plita') == 'Gaz plita'
+    assert save_month(user, 2026, 2, 'Par dazmol') == ''
+    assert save_month(user, 2026, 3, 'Konditsioner') == 'Konditsioner'
+
+    best = BestExtraBonus.objects.get(user=user)
+    assert (best.rank, best.year, best.month, best.prior_rank) == (5, 2026, 3, 4)
+
+
+@pytest.mark.django_db
+def test_resaving_same_month_compares_with_past_only(create_partner):
+    user = create_partner()
+    save_month(user, 2026, 1, 'Gaz plita')
+
+    assert save_month(user, 2026, 2, 'Konditsioner') == 'Konditsioner'
+    assert save_month(user, 2026, 2, 'Konditsioner') == 'Konditsioner'
+
+    # Бонус за месяц исчез — лучший снова прошломесячный
+    assert save_month(user, 2026, 2, '') == ''
+    assert extra_bonus.best_ranks([user]) == {user.pk: 4}
+
+
+@pytest.mark.django_db
+def test_best_ranks_reads_only_requested_users(django_assert_num_queries, create_partner):
+    users = [create_partner() for _ in range(3)]
+    for user in users:
+        save_month(user, 2026, 1, 'Changyutgich')
+
+    with django_assert_num_queries(1):
+        ranks = extra_bonus.best_ranks(users[:2])
+
+    assert ranks == {users[0].pk: 2, users[1].pk: 2}
+
+
+@pytest.mark.django_db
+def test_rebuild_command_backfills_from_history(create_partner):
+    user = create_partner()
+    other = create_partner()
+    for month, bonus in ((1, 'Gaz plita'), (2, ''), (3, 'Onix avtomobili'), (4, 'Par dazmol')):
+        MonthlyReport.objects.create(user=user, year=2025, month=month, extra_bonus=bonus)
+    MonthlyReport.objects.create(user=other, year=2025, month=1, extra_bonus='-')
+    BestExtraBonus.objects.create(user=other, rank=9, extra_bonus='Chery Tigo 7 Pro Max')
+
+    call_command('rebuild_best_extra_bonus')
+
+    best = BestExtraBonus.objects.get(user=user)
+    assert (best.rank, best.extra_bonus, best.month, best.prior_rank) == (8, 'Onix avtomobili', 3, 4)
+    assert not BestExtraBonus.objects.filter(user=other).exists()
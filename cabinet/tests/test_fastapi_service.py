@@ -0,0 +1,59 @@
+from django.core.cache import cache
+from django.test import override_settings
+
+from cabinet.services.fastapi_service import BATCH_UNSUPPORTED_KEY, FastAPIService
+from cabinet.services.fastapi_stub import FastAPIStub
+
+
+USER_IDS = [str(i).zfill(8) for i in range(1, 11)]
+
+
+@override_settings(FASTAPI_STATUS_BATCH_SIZE=4)
+def test_bulk_status_uses_batch_route():
+    """Пакетный маршрут: ceil(10 / 4) = 3 запроса вместо 10"""
+    with FastAPIStub(statuses={'00000001': {'lo': 150}}) as stub:
+        statuses = FastAPIService(base_url=stub.url).get_users_status_bulk(USER_IDS)
+
+    assert list(statuses) == USER_IDS
+    assert statuses['00000001'] == {'lo': 150}
+    assert statuses['00000002']['qualification'] == 'Hamkor'
+    assert stub.requests == {'batch': 3}
+    assert cache.get(BATCH_UNSUPPORTED_KEY) is None
+
+
+def test_bulk_status_falls_back_to_single_calls():
+    """Без пакетного маршрута — поштучные запросы, и это запоминается"""
+    with FastAPIStub(batch=False) as stub:
+        service = FastAPIService(base_url=stub.url)
+        statuses = service.get_users_status_bulk(USER_IDS)
+        assert stub.requests['status'] == len(USER_IDS)
+
+        service.get_users_status_bulk(USER_IDS[:2])
+
+    assert all(statuses[user_id]['user_id'] == user_id for user_id in USER_IDS)
+    assert stub.requests['status'] == len(USER_IDS) + 2
+    assert stub.requests['batch'] == 0
+
+
+def test_batch_route_is_retried_after_ttl():
+    """Отказ пакетного маршрута помнится в кеше FASTAPI_BATCH_SUPPORT_TTL, а не навсегда"""
+    with FastAPIStub(batch=False) as stub:
+        service = FastAPIService(base_url=stub.url)
+        service.get_users_status_bulk(USER_IDS[:2])
+        assert cache.get(BATCH_UNSUPPORTED_KEY) is True
+
+        # Срок истёк, маршрут добавили
+        cache.delete(BATCH_UNSUPPORTED_KEY)
+        stub.batch = True
+        service.get_users_status_bulk(USER_IDS[2:4])
+
+    assert stub.requests['batch'] == 1
+    assert stub.requests['status'] == 2
+
+
+def test_bulk_status_deduplicates_ids():
+    with FastAPIStub() as stub:
+        statuses = FastAPIService(base_url=stub.url).get_users_status_bulk(['1', '1', 1])
+
+    assert list(statuses) == ['1']
+
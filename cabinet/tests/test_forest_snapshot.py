@@ -0,0 +1,163 @@
+import os
+
+import numpy as np
+import pytest
+
+from accounts.models import CustomUser
+from cabinet.services import forest_snapshot
+from cabinet.services.network_volume import ReferralForest
+from cabinet.tasks import refresh_referral_forest_snapshot
+
+
+@pytest.fixture
+def network(network, create_partner):
+    """
+    root → a → (c → e, d)
+         → b
+    other — отдельное дерево
+    """
+    network['d'] = create_partner(referrer=network['a'])
+    network['e'] = create_partner(referrer=network['c'])
+    network['other'] = create_partner()
+    return network
+
+
+@pytest.mark.django_db
+def test_subtree_and_ancestor_queries(network, snapshot_path):
+    assert refresh_referral_forest_snapshot.delay().get() == {'status': 'success', 'users': 7}
+    snapshot = forest_snapshot.get_snapshot()
+
+    assert len(snapshot) == 7
+    for user in CustomUser.objects.all():
+        expected = set(user.get_referral_descendants().values_list('pk', flat=True))
+        assert set(snapshot.descendant_pks(user.pk).tolist()) == expected
+        assert snapshot.team_size(user.pk) == len(expected)
+        assert snapshot.depth[snapshot.index_of(user.pk)] == user.referral_depth
+
+    root, a, e = network['root'], network['a'], network['e']
+    assert snapshot.ancestor_pks(e.pk) == [network['c'].pk, a.pk, root.pk]
+    assert snapshot.is_descendant(e.pk, a.pk)
+    assert not snapshot.is_descendant(a.pk, a.pk)
+    assert not snapshot.is_descendant(network['b'].pk, a.pk)
+    assert not snapshot.is_descendant(network['other'].pk, root.pk)
+
+    assert snapshot.pks[snapshot.index_of_user_id(e.user_id)] == e.pk
+    assert snapshot.index_of_user_id('missing') is None
+    assert snapshot.subtree_range(10 ** 6) is None
+
+
+@pytest.mark.django_db
+def test_swap_is_picked_up(network, create_partner, snapshot_path):
+    forest_snapshot.publish()
+    before = forest_snapshot.get_snapshot()
+    pks = before.descendant_pks(network['b'].pk)
+
+    f = create_partner(referrer=network['b'])
+    forest_snapshot.publish()
+    after = forest_snapshot.get_snapshot()
+
+    assert after is not before
+    assert after.descendant_pks(network['b'].pk).tolist() == [f.pk]
+    # Старое отображение остаётся валидным, пока на него есть ссылки
+    assert pks.tolist() == []
+    assert before.team_size(network['a'].pk) == 3
+
+
+def assert_same_forest(forest, expected):
+    assert forest.user_ids == expected.user_ids
+    assert forest.parent.tolist() == expected.parent.tolist()
+    assert forest.depth.tolist() == expected.depth.tolist()
+    assert forest.pks.tolist() == expected.pks.tolist()
+
+
+@pytest.mark.django_db
+def test_forest_is_loaded_from_fresh_snapshot(network, snapshot_path, django_assert_num_queries):
+    CustomUser.objects.filter(pk=network['e'].pk).update(username='партнёр-e')
+    forest_snapshot.publish()
+
+    # Одна проверка отметки вместо чтения всего леса
+    with django_assert_num_queries(1):
+        forest = ReferralForest.load()
+    assert_same_forest(forest, ReferralForest.load_from_db())
+
+    with django_assert_num_queries(1):
+        by_username = ReferralForest.load(id_field='username')
+    assert 'партнёр-e' in by_username.user_ids
+    assert_same_forest(by_username, ReferralForest.load_from_db(id_field='username'))
+
+
+@pytest.mark.django_db
+def test_stale_snapshot_falls_back_to_database(network, create_partner, snapshot_path):
+    forest_snapshot.publish()
+    f = create_partner(referrer=network['b'])
+    assert f.user_id in ReferralForest.load().user_ids
+
+    forest_snapshot.publish()
+    network['c'].referrer = network['b']
+    network['c'].save()
+    forest = ReferralForest.load()
+    assert forest.user_ids[forest.parent[forest.index_of(network['c'].user_id)]] == network['b'].user_id
+
+    forest_snapshot.publish()
+    network['d'].delete()
+    assert network['d'].user_id not in ReferralForest.load().user_ids
+
+
+@pytest.mark.django_db
+def test_unchanged_database_is_not_rebuilt(network, snapshot_path):
+    forest_snapshot.publish()
+    identity = forest_snapshot.get_snapshot().identity
+
+    assert forest_snapshot.publish() == 7
+    assert forest_snapshot.get_snapshot().identity == identity
+
+
+def test_missing_or_broken_file(snapshot_path):
+    assert forest_snapshot.get_snapshot() is None
+
+    os.makedirs(os.path.dirname(snapshot_path))
+    with open(snapshot_path, 'wb') as f:
+        f.write(b'x' * 64)
+    assert forest_snapshot.get_snapshot() is None
+
+
+def test_random_forest_ranges(tmp_path):
+    rng = np.random.default_rng(17)
+    n = 400
+    parents = [-1] + [int(rng.integers(v)) if rng.random() > 0.1 else -1 for v in range(1, n)]
+    depth = [0] * n
+    for v in range(1, n):
+        depth[v] = depth[parents[v]] + 1 if parents[v] >= 0 else 0
+
+    order = sorted(range(n), key=lambda v: (depth[v], parents[v]))
+    position = {v: i for i, v in enumerate(order)}
+    forest = ReferralForest(
+        [f'{v + 1:08d}' for v in order],
+        np.array([position[parents[v]] if parents[v] >= 0 else -1 for v in order]),
+        np.array([depth[v] for v in order]),
+        pks=np.array([v + 1 for v in order]),
+    )
+    path = str(tmp_path / 'forest.snap')
+    forest_snapshot.write_snapshot(path, forest_snapshot.build_arrays(forest))
+    snapshot = forest_snapshot.ForestSnapshot(path)
+
+    children = {v: [] for v in range(n)}
+    for v, p in enumerate(parents):
+        if p >= 0:
+            children[p].append(v)
+
+    def descendants(v):
+        stack, found = list(children[v]), set()
+        while stack:
+            u = stack.pop()
+            found.add(u + 1)
+            stack.extend(children[u])
+        return found
+
+    for v in range(n):
+        assert set(snapshot.descendant_pks(v + 1).tolist()) == descendants(v)
+        ancestors, p = [], parents[v]
+        while p >= 0:
+            ancestors.append(p + 1)
+            p = parents[p]
+        assert snapshot.ancestor_pks(v + 1) == ancestors
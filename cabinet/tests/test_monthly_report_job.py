@@ -0,0 +1,126 @@
+from unittest.mock import patch
+
+import pytest
+from django.test import override_settings
+from django.urls import reverse
+
+from cabinet.models import MonthlyReport, MonthlyReportJob
+from cabinet.services import monthly_report
+from cabinet.services.fastapi_stub import FastAPIStub
+
+
+@pytest.fixture
+def network(client, network):
+    """root → (a → c, b); root авторизован"""
+    client.force_login(network['root'])
+    return network
+
+
+@pytest.fixture
+def stub():
+    with FastAPIStub() as stub, override_settings(
+        FASTAPI_SERVICE_URL=stub.url,
+        MONTHLY_REPORT_CHUNK_SIZE=2,
+    ):
+        yield stub
+
+
+def start_report(client, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        response = client.post(reverse('cabinet:generate_monthly_report'))
+    assert response.status_code == 202
+    return response.json()
+
+
+@pytest.mark.django_db
+def test_report_job_saves_and_resets_everyone(client, network, stub, django_capture_on_commit_callbacks):
+    stub.statuses[network['a'].username] = {'lo': 77, 'qualification': 'Menejer'}
+
+    data = start_report(client, django_capture_on_commit_callbacks)
+    progress = client.get(data['progress_url']).json()
+
+    assert progress['status'] == 'done'
+    assert progress['total'] == 4
+    assert progress['saved'] == 4
+    assert progress['reset_ok'] == 4
+    assert progress['percent'] == 100
+    assert stub.requests['reset'] == 4
+    report = MonthlyReport.objects.get(user=network['a'])
+    assert report.personal_volume == 77
+    assert report.partner_level == 'Menejer'
+
+
+@pytest.mark.django_db
+def test_rerun_resumes_after_crash(client, network, stub, django_capture_on_commit_callbacks):
+    """Сбой посреди сброса: перезапуск не пересохраняет отчёты и досбрасывает"""
+    with patch.object(monthly_report, '_reset_upstream', side_effect=RuntimeError('worker killed')):
+        start_report(client, django_capture_on_commit_callbacks)
+
+    job = MonthlyReportJob.objects.get()
+    assert job.status == 'failed'
+    assert job.items.filter(saved_at__isnull=False).count() == 2
+    assert stub.requests['reset'] == 0
+    assert sum(stub.status_ids.values()) == 2
+
+    start_report(client, django_capture_on_commit_callbacks)
+
+    job.refresh_from_db()
+    assert job.status == 'done'
+    assert job.items.filter(saved_at__isnull=False, reset_at__isnull=False).count() == 4
+    assert stub.requests['reset'] == 4
+    # статусы первой пачки повторно не запрашивались
+    assert sum(stub.status_ids.values()) == 4
+
+
+@pytest.mark.django_db
+def test_user_without_status_is_not_reset(client, network, stub, django_capture_on_commit_callbacks):
+    """Без данных FastAPI отчёт не сохраняется и сброс не выполняется"""
+    with patch('cabinet.services.fastapi_service.FastAPIService.get_users_status_bulk',
+               side_effect=lambda ids: {user_id: {} if user_id == network['b'].username else {'lo': 1} for user_id in ids}):
+        data = start_report(client, django_capture_on_commit_callbacks)
+
+    progress = client.get(data['progress_url']).json()
+    assert progress['saved'] == 3
+    assert progress['errors'] == 1
+    assert progress['reset_ok'] == 3
+    assert not MonthlyReport.objects.filter(user=network['b']).exists()
+
+
+@pytest.mark.django_db
+def test_running_job_is_not_started_twice(client, network, stub):
+    job, dispatched = monthly_report.start_job(network['root'])
+    assert dispatched
+
+    again, dispatched = monthly_report.start_job(network['root'])
+    assert again.pk == job.pk
+    assert not dispatched
+
+
+@pytest.mark.django_db
+def test_progress_is_private(client, network, stub):
+    job, _ = monthly_report.start_job(network['a'])
+
+    response = client.get(reverse('cabinet:monthly_report_progress', args=[job.pk]))
+
+    assert response.status_code == 404
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('size', [3, 30])
+def test_write_reports_query_count_is_constant(size, django_assert_num_queries, create_partner):
+    """Запросов столько же при любом размере структуры"""
+    root = create_partner()
+    users = [root] + [create_partner(referrer=root) for _ in range(size - 1)]
+    statuses = {user.username: {'lo': 5} for user in users}
+
+    # лучшие extra_bonus, покупки, новые рефералы и один upsert
+    with django_assert_num_queries(4):
+        monthly_report.write_reports(users, statuses, 2026, 1)
+
+    assert MonthlyReport.objects.count() == size
+
+    # повторная запись обновляет строки на месте
+    statuses[root.username] = {'lo': 9}
+    monthly_report.write_reports(users, statuses, 2026, 1)
+    assert MonthlyReport.objects.count() == size
+    assert MonthlyReport.objects.get(user=root).personal_volume == 9
@@ -0,0 +1,128 @@
+from io import StringIO
+
+import numpy as np
+import pytest
+from django.core.management import call_command
+
+from accounts.models import CustomUser
+from cabinet.services import status_cache
+from cabinet.services.network_volume import ReferralForest, compute
+
+
+@pytest.fixture
+def network(network, create_partner):
+    """
+    root → a → (c → e, d)
+         → b
+    other — отдельное дерево
+    """
+    network['d'] = create_partner(referrer=network['a'])
+    network['e'] = create_partner(referrer=network['c'])
+    network['other'] = create_partner()
+    return network
+
+
+LO = {'root': 10, 'a': 20, 'b': 100, 'c': 5, 'd': 7, 'e': 40, 'other': 3}
+
+
+def lo_by_user_id(network):
+    return {network[name].user_id: value for name, value in LO.items()}
+
+
+@pytest.mark.django_db
+def test_forest_order(network, django_assert_num_queries):
+    with django_assert_num_queries(1):
+        forest = ReferralForest.load()
+
+    assert len(forest) == 7
+    for i, p in enumerate(forest.parent.tolist()):
+        assert p < i
+        if p >= 0:
+            assert forest.depth[p] + 1 == forest.depth[i]
+    assert [stop - start for start, stop in forest.levels] == [2, 2, 2, 1]
+
+
+@pytest.mark.django_db
+def test_volumes(network):
+    forest = ReferralForest.load()
+    volumes = compute(forest, forest.vector(lo_by_user_id(network)), levels=3)
+
+    root = volumes.for_user(network['root'].user_id)
+    assert root['group_volume'] == 182
+    assert root['largest_leg'] == 100
+    assert root['side_volume'] == 182 - 10 - 100
+    assert root['team_size'] == 5
+    assert root['level_counts'] == [2, 2, 1]
+
+    a = volumes.for_user(network['a'].user_id)
+    assert (a['group_volume'], a['largest_leg'], a['side_volume']) == (72, 45, 7)
+    assert a['level_counts'] == [2, 1, 0]
+
+    assert volumes.for_user(network['other'].user_id)['group_volume'] == 3
+    assert volumes.for_user(network['e'].user_id)['team_size'] == 0
+    assert volumes.for_user('missing') is None
+
+
+@pytest.mark.django_db
+def test_subtree_forest(network):
+    """Структура одного партнёра: его пригласивший вне выборки"""
+    a = network['a']
+    forest = ReferralForest.load(CustomUser.objects.filter(pk=a.pk) | a.get_referral_descendants())
+    volumes = compute(forest, forest.vector(lo_by_user_id(network)))
+
+    assert len(forest) == 4
+    assert forest.parent[forest.index_of(a.user_id)] == -1
+    assert volumes.for_user(a.user_id)['group_volume'] == 72
+
+
+def test_random_forest_matches_naive():
+    rng = np.random.default_rng(16)
+    n = 500
+    parents = [-1] + [int(rng.integers(v)) if rng.random() > 0.1 else -1 for v in range(1, n)]
+    depth = [0] * n
+    for v in range(1, n):
+        depth[v] = depth[parents[v]] + 1 if parents[v] >= 0 else 0
+
+    order = sorted(range(n), key=lambda v: (depth[v], parents[v]))
+    position = {v: i for i, v in enumerate(order)}
+    forest = ReferralForest(
+        [str(v) for v in order],
+        np.array([position[parents[v]] if parents[v] >= 0 else -1 for v in order]),
+        np.array([depth[v] for v in order]),
+    )
+    personal = rng.integers(0, 100, n).astype(float)
+    volumes = compute(forest, personal, levels=2)
+
+    children = {i: [] for i in range(n)}
+    for i, p in enumerate(forest.parent.tolist()):
+        if p >= 0:
+            children[p].append(i)
+
+    group = personal.copy()
+    for i in reversed(range(n)):
+        for c in children[i]:
+            group[i] += group[c]
+
+    assert np.allclose(volumes.group_volume, group)
+    for i in range(n):
+        legs = [group[c] for c in children[i]]
+        assert volumes.largest_leg[i] == max(legs, default=0)
+        assert volumes.level_counts[i].tolist() == [
+            len(children[i]), sum(len(children[c]) for c in children[i]),
+        ]
+
+
+@pytest.mark.django_db
+def test_reconcile_command(network):
+    go = {'root': 182, 'a': 70, 'b': 100, 'c': 45, 'd': 7, 'e': 40, 'other': 3}
+    status_cache.store_statuses({
+        network[name].user_id: {'lo': LO[name], 'go': go[name]} for name in LO
+    })
+
+    out = StringIO()
+    call_command('network_volumes', '--reconcile', '--top', '1', stdout=out)
+
+    output = out.getvalue()
+    assert f"{network['root'].user_id}: ГО 182.00" in output
+    assert 'ГО расходится с FastAPI у 1 из 7 партнёров' in output
+    assert f"{network['a'].user_id}: FastAPI 70.00, локально 72.00" in output
@@ -0,0 +1,81 @@
+import pytest
+from django.test import override_settings
+from django.urls import reverse
+
+from cabinet.services.fastapi_stub import FastAPIStub
+
+
+@pytest.fixture
+def network(client, create_partner):
+    """root → (a → (c, d), b, e → f); b — без структуры"""
+    users = {'root': create_partner()}
+    users['a'] = create_partner(users['root'], first_name='Anvar')
+    users['b'] = create_partner(users['root'], first_name='Bobur')
+    users['c'] = create_partner(users['a'])
+    users['d'] = create_partner(users['a'])
+    users['e'] = create_partner(users['root'], first_name='Elyor')
+    users['f'] = create_partner(users['e'])
+    client.force_login(users['root'])
+    return users
+
+
+@pytest.fixture(autouse=True)
+def stub():
+    with FastAPIStub() as stub, override_settings(FASTAPI_SERVICE_URL=stub.url):
+        yield stub
+
+
+def get_children(client, **params):
+    return client.get(reverse('cabinet:referral_children'), params)
+
+
+@pytest.mark.django_db
+def test_root_children_sorted_by_downline(client, network):
+    data = get_children(client).json()
+
+    assert data['node']['id'] == network['root'].user_id
+    assert data['node']['descendants'] == 6
+    assert [(c['label'], c['descendants']) for c in data['children']] == [
+        ('Anvar', 2), ('Elyor', 1), ('Bobur', 0),
+    ]
+    assert data['total'] == 3
+    assert data['has_next'] is False
+
+
+@pytest.mark.django_db
+def test_children_paged(client, network):
+    first = get_children(client, sort='name', page_size=2).json()
+    second = get_children(client, sort='name', page_size=2, page=2).json()
+
+    assert [c['label'] for c in first['children']] == ['Anvar', 'Bobur']
+    assert first['has_next'] is True
+    assert [c['label'] for c in second['children']] == ['Elyor']
+    assert second['has_next'] is False
+
+
+@pytest.mark.django_db
+def test_expand_nested_node(client, network):
+    data = get_children(client, node=network['a'].user_id).json()
+
+    assert {c['id'] for c in data['children']} == {network['c'].user_id, network['d'].user_id}
+    assert all(c['level'] == 2 for c in data['children'])
+
+
+@pytest.mark.django_db
+def test_first_screen_query_count_independent_of_size(client, network, django_assert_max_num_queries, create_partner):
+    """Первый экран не зависит от размера структуры: прямые рефералы одной страницей"""
+    for _ in range(30):
+        create_partner(network['c'])
+
+    with django_assert_max_num_queries(8):
+        data = get_children(client).json()
+
+    assert data['node']['descendants'] == 36
+
+
+@pytest.mark.django_db
+def test_foreign_node_forbidden(client, network, create_partner):
+    outsider = create_partner()
+
+    assert get_children(client, node=outsider.user_id).status_code == 403
+    assert get_children(client, sort='unknown').status_code == 400
@@ -0,0 +1,154 @@
+import gzip
+import json
+
+import pytest
+from unittest.mock import patch
+from django.test import override_settings
+from django.urls import reverse
+
+from cabinet.services import compression
+from cabinet.services.fastapi_stub import FastAPIStub
+from cabinet.services.referral_tree import load_referral_tree
+
+
+@pytest.mark.django_db
+def test_tree_loaded_in_single_query(network, django_assert_num_queries):
+    """Всё поддерево загружается одним запросом"""
+    root = network['root']
+
+    with django_assert_num_queries(1):
+        tree = load_referral_tree(root)
+
+    assert [u.pk for u in tree.users][0] == root.pk
+    assert len(tree) == 4
+    assert tree.depth[network['c'].pk] == 2
+    assert tree.parent[network['c'].pk] == network['a'].pk
+    assert root.pk not in tree.parent
+    assert tree.truncated is False
+
+
+@pytest.mark.django_db
+def test_tree_limits(network):
+    """Лимиты глубины и количества узлов"""
+    root = network['root']
+
+    shallow = load_referral_tree(root, max_depth=1)
+    assert {u.pk for u in shallow} == {root.pk, network['a'].pk, network['b'].pk}
+
+    capped = load_referral_tree(root, max_nodes=2)
+    assert len(capped) == 2
+    assert capped.truncated is True
+
+
+@pytest.mark.django_db
+def test_subtree_of_partner(network):
+    """Поддерево строится от произвольного узла"""
+    tree = load_referral_tree(network['a'])
+
+    assert {u.pk for u in tree} == {network['a'].pk, network['c'].pk}
+    assert [(p.pk, c.pk) for p, c in tree.edges()] == [
+        (network['a'].pk, network['c'].pk)
+    ]
+
+
+@pytest.mark.django_db
+def test_referral_tree_api(client, network):
+    """API дерева отдаёт узлы и рёбра всей структуры"""
+    root = network['root']
+    client.force_login(root)
+
+    statuses = {root.user_id: {'lo': 120, 'go': 480, 'qualification': 'Mentor'}}
+    with FastAPIStub(statuses=statuses) as stub, override_settings(FASTAPI_SERVICE_URL=stub.url):
+        response = client.get(reverse('cabinet:referral_tree'))
+
+    assert response.status_code == 200
+    data = response.json()
+    levels = {n['id']: n['level'] for n in data['nodes']}
+    root_node = next(n for n in data['nodes'] if n['id'] == root.user_id)
+    assert root_node['personal_volume'] == 120
+    assert root_node['qualification'] == 'Mentor'
+    assert levels[root.user_id] == 0
+    assert levels[network['c'].user_id] == 2
+    assert len(data['edges']) == 3
+    assert {'from': network['a'].user_id, 'to': network['c'].user_id} in data['edges']
+
+
+@pytest.mark.django_db
+def test_referral_details_outside_structure(client, network):
+    """Детали доступны только по участникам своей структуры"""
+    client.force_login(network['a'])
+
+    with patch('cabinet.views.status_cache.get_statuses', side_effect=lambda ids: {i: {} for i in ids}):
+        own = client.get(reverse('cabinet:referral_details', args=[network['c'].user_id]))
+        foreign = client.get(reverse('cabinet:referral_details', args=[network['b'].user_id]))
+
+    assert own.status_code == 200
+    assert foreign.status_code == 403
+
+
+def expand_compact(data):
+    """Компактный формат обратно в узлы по user_id"""
+    nodes = [{**data['defaults'], 'id': user_id} for user_id in data['ids']]
+    for field, (indexes, values) in data['columns'].items():
+        for i, value in zip(indexes, values):
+            nodes[i][field] = value
+    return {node['id']: node for node in nodes}
+
+
+@pytest.mark.django_db
+def test_referral_tree_api_compact(client, network):
+    """Компактный формат несёт те же данные, что и формат по умолчанию"""
+    root = network['root']
+    client.force_login(root)
+
+    statuses = {
+        root.user_id: {'lo': 120, 'go': 480, 'qualification': 'Mentor', 'points': 7},
+        network['c'].user_id: {'total_income': 15.5},
+    }
+    with FastAPIStub(statuses=statuses) as stub, override_settings(FASTAPI_SERVICE_URL=stub.url):
+        full = client.get(reverse('cabinet:referral_tree')).json()
+        compact = client.get(reverse('cabinet:referral_tree'), {'format': 'compact'}).json()
+
+    assert compact['format'] == 'compact'
+    assert compact['ids'][0] == root.user_id
+    ids = compact['ids']
+    parents = {ids[i]: ids[p] for i, p in enumerate(compact['parent']) if p >= 0}
+    assert parents == {e['to']: e['from'] for e in full['edges']}
+
+    # Нули и значения по умолчанию не передаются
+    assert compact['columns']['points'] == [[0], [7]]
+    assert 'side_volume' not in compact['columns']
+
+    nodes = expand_compact(compact)
+    for node in full['nodes']:
+        expected = {k: v for k, v in node.items() if k not in ('label', 'title', 'level')}
+        assert {k: nodes[node['id']][k] for k in expected} == expected
+
+
+@pytest.mark.django_db
+def test_referral_tree_api_compression(client, network, create_partner):
+    """Сжатие по Accept-Encoding; неизвестный формат — 400"""
+    root = network['root']
+    client.force_login(root)
+    for _ in range(30):
+        create_partner(referrer=root)
+
+    with patch('cabinet.views.status_cache.get_statuses', side_effect=lambda ids: {i: {} for i in ids}):
+        plain = client.get(reverse('cabinet:referral_tree'))
+        gzipped = client.get(reverse('cabinet:referral_tree'), HTTP_ACCEPT_ENCODING='gzip, deflate')
+        refused = client.get(reverse('cabinet:referral_tree'), HTTP_ACCEPT_ENCODING='gzip;q=0')
+        unknown = client.get(reverse('cabinet:referral_tree'), {'format': 'xml'})
+
+    assert not plain.has_header('Content-Encoding')
+    assert 'Accept-Encoding' in plain['Vary']
+    assert gzipped['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(gzipped.content)) == plain.json()
+    assert not refused.has_header('Content-Encoding')
+    assert unknown.status_code == 400
+
+
+def test_accepted_encodings_tolerates_bad_quality(rf):
+    """Неразборчивый q в заголовке клиента — не 500, а отказ от кодировки"""
+    request = rf.get('/', HTTP_ACCEPT_ENCODING='br;q=., gzip;q=1.2.3, deflate;q=0.5, identity;q=0')
+
+    assert compression.accepted_encodings(request) == {'deflate'}
@@ -0,0 +1,79 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from django.core.cache import cache
+from django.test import override_settings
+
+from cabinet.services import single_flight
+from cabinet.services.fastapi_service import FastAPIService
+from cabinet.services.fastapi_stub import FastAPIStub
+
+
+@pytest.fixture
+def slow_stub():
+    with FastAPIStub(statuses={'00000001': {'lo': 10}}, latency=0.3) as stub, \
+            override_settings(FASTAPI_SERVICE_URL=stub.url):
+        yield stub
+
+
+def run_concurrently(fn, count=8):
+    barrier = threading.Barrier(count)
+
+    def call(_):
+        barrier.wait()
+        return fn()
+
+    with ThreadPoolExecutor(max_workers=count) as executor:
+        return list(executor.map(call, range(count)))
+
+
+def test_concurrent_stats_share_one_request(slow_stub):
+    results = run_concurrently(lambda: FastAPIService().get_user_stats('00000001'))
+
+    assert results == [{'lo': 10}] * 8
+    assert slow_stub.requests['status'] == 1
+
+
+def test_concurrent_bulk_requests_share_fetch(slow_stub):
+    ids = ['00000001', '00000002', '00000003']
+    results = run_concurrently(lambda: FastAPIService().get_users_status_bulk(ids))
+
+    assert all(result['00000001'] == {'lo': 10} for result in results)
+    assert all(set(result) == set(ids) for result in results)
+    # каждый id запрошен ровно один раз, даже если блокировки разошлись по потокам
+    assert slow_stub.status_ids == {user_id: 1 for user_id in ids}
+
+
+def test_sequential_requests_are_not_cached(slow_stub):
+    """Single-flight не кеш: следующий запрос снова идёт в upstream"""
+    service = FastAPIService()
+    service.get_user_stats('00000001')
+    service.get_user_stats('00000001')
+
+    assert slow_stub.requests['status'] == 2
+
+
+def test_waiter_falls_back_when_leader_fails():
+    calls = []
+    started = threading.Event()
+
+    def failing():
+        calls.append('leader')
+        started.set()
+        threading.Event().wait(0.1)
+        raise RuntimeError('upstream')
+
+    def follower():
+        started.wait()
+        return single_flight.do('key', lambda: calls.append('follower') or 'ok')
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(single_flight.do, 'key', failing)
+        result = executor.submit(follower).result()
+
+    with pytest.raises(RuntimeError):
+        leader.result()
+    assert result == 'ok'
+    assert calls == ['leader', 'follower']
+    assert cache.get(single_flight.lock_key('key')) is None
@@ -0,0 +1,80 @@
+import time
+
+import pytest
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+
+from accounts.models import CustomUser
+from cabinet.services import status_cache
+from cabinet.services.fastapi_stub import FastAPIStub
+
+
+@pytest.fixture
+def stub():
+    with FastAPIStub(statuses={'00000001': {'lo': 10}}) as stub, \
+            override_settings(FASTAPI_SERVICE_URL=stub.url):
+        yield stub
+
+
+def age_entry(user_id, seconds):
+    entry = cache.get(status_cache.status_key(user_id))
+    entry['fetched_at'] -= seconds
+    cache.set(status_cache.status_key(user_id), entry)
+
+
+def test_miss_schedules_refresh(stub):
+    """Промах: сразу None, обновление уходит в Celery и кладёт данные в кеш"""
+    assert status_cache.get_status('00000001') is None
+    assert status_cache.get_status('00000001') == {'lo': 10}
+
+
+def test_stale_entry_served_and_refreshed(stub):
+    """Устаревшая запись отдаётся сразу и обновляется в фоне"""
+    status_cache.store_statuses({'00000001': {'lo': 1}})
+    age_entry('00000001', 3600)
+
+    assert status_cache.get_status('00000001') == {'lo': 1}
+    assert status_cache.get_status('00000001') == {'lo': 10}
+
+
+def test_refresh_not_duplicated(stub):
+    """Пока обновление в процессе, повторно не ставится"""
+    cache.add(status_cache.refresh_lock_key('00000001'), 1)
+
+    assert status_cache.schedule_refresh(['00000001', '00000002']) == ['00000002']
+
+
+def test_upstream_failure_keeps_last_known():
+    status_cache.store_statuses({'00000001': {'lo': 5}})
+    age_entry('00000001', 3600)
+
+    with FastAPIStub() as stub:
+        url = stub.url
+    with override_settings(FASTAPI_SERVICE_URL=url, FASTAPI_STATUS_CONCURRENCY=1):
+        status_cache.get_status('00000001')
+
+    assert status_cache.get_status('00000001') == {'lo': 5}
+
+
+def test_get_statuses_fetches_only_missing(stub):
+    status_cache.store_statuses({'00000001': {'lo': 1}})
+
+    statuses = status_cache.get_statuses(['00000001', '00000002'])
+
+    assert statuses['00000001'] == {'lo': 1}
+    assert statuses['00000002']['qualification'] == 'Hamkor'
+    assert stub.requests == {'batch': 1}
+
+
+@pytest.mark.django_db
+def test_dashboard_reads_cache(client, stub):
+    user = CustomUser.objects.create(phone='+998901234567', country='Узбекистан')
+    client.force_login(user)
+    status_cache.store_statuses({user.username: {'lo': 77, 'qualification': 'Mentor'}})
+
+    response = client.get(reverse('cabinet:dashboard'))
+
+    assert response.context['user_stats']['lo'] == 77
+    assert response.context['loading'] is False
+    assert sum(stub.requests.values()) == 0
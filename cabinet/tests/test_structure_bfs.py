@@ -0,0 +1,81 @@
+import pytest
+from django.test import override_settings
+from django.urls import reverse
+
+from cabinet.services.fastapi_stub import FastAPIStub
+
+
+def member(user_id, lo=0):
+    return {'user_id': user_id, 'lo': lo, 'team': []}
+
+
+@pytest.fixture
+def network(client, network, create_partner):
+    """root → (a → c, b → d); d → e"""
+    network['d'] = create_partner(referrer=network['b'])
+    network['e'] = create_partner(referrer=network['d'])
+    client.force_login(network['root'])
+    return network
+
+
+@pytest.fixture
+def stub(network):
+    ids = {name: user.user_id for name, user in network.items()}
+    teams = {
+        ids['root']: [member(ids['a'], 5), member(ids['b'])],
+        ids['a']: [member(ids['c'])],
+        ids['b']: [member(ids['d'])],
+        ids['d']: [member(ids['e'])],
+    }
+    with FastAPIStub(teams=teams) as stub, override_settings(FASTAPI_SERVICE_URL=stub.url):
+        yield stub
+
+
+def get_level(client, level):
+    return client.get(reverse('cabinet:referrals_json'), {'level': level}).json()
+
+
+@pytest.mark.django_db
+def test_deep_levels_walked_breadth_first(client, network, stub):
+    data = get_level(client, 3)
+
+    ids = [(item['id'], item['level']) for item in data['referrals']]
+    assert ids == [
+        (network['a'].user_id, 2), (network['b'].user_id, 2),
+        (network['c'].user_id, 3), (network['d'].user_id, 3),
+    ]
+    assert data['referrals'][0]['personal_volume'] == 5
+    assert data['referrals'][0]['phone'] == '+998901234567'
+    assert data['budget']['truncated'] is False
+    # корень + по запросу на каждого участника уровня 2; уровень 3 не раскрывается
+    assert stub.requests['structure'] == 3
+
+
+@pytest.mark.django_db
+@override_settings(REFERRALS_BFS_MAX_NODES=3)
+def test_node_budget_reported(client, network, stub):
+    data = get_level(client, 4)
+
+    assert data['total_count'] == 3
+    assert data['budget']['truncated_by'] == 'nodes'
+
+
+@pytest.mark.django_db
+@override_settings(REFERRALS_BFS_TIME_BUDGET=0.2)
+def test_time_budget_reported(client, network, stub):
+    stub.latency = 0.3
+
+    data = get_level(client, 4)
+
+    assert data['budget']['truncated_by'] == 'time'
+    assert {item['level'] for item in data['referrals']} == {2}
+
+
+@pytest.mark.django_db
+def test_failed_member_is_counted_not_swallowed(client, network, stub):
+    stub.broken.add(network['a'].user_id)
+
+    data = get_level(client, 3)
+
+    assert data['budget']['failed'] == 1
+    assert [item['id'] for item in data['referrals'] if item['level'] == 3] == [network['d'].user_id]
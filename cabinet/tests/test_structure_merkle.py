@@ -0,0 +1,167 @@
+from io import StringIO
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from django.core.management import call_command
+from django.test import override_settings
+
+from accounts.models import CustomUser
+from cabinet.services import structure_merkle
+from cabinet.services.fastapi_service import FastAPIService, HashesNotSupported
+from cabinet.services.fastapi_stub import FastAPIStub, structure_hashes
+from cabinet.services.network_volume import ReferralForest
+from cabinet.tasks import reconcile_structure
+
+
+@pytest.fixture
+def network(network, create_partner):
+    """
+    root → a → (c → e, d)
+         → b
+    """
+    network['d'] = create_partner(referrer=network['a'])
+    network['e'] = create_partner(referrer=network['c'])
+    return network
+
+
+def fastapi_structure():
+    """Структура так, как её регистрирует accounts.views: по username"""
+    return {
+        user.username: user.referrer.username if user.referrer else None
+        for user in CustomUser.objects.select_related('referrer')
+    }
+
+
+@pytest.fixture
+def stub(network):
+    with FastAPIStub(structure=fastapi_structure()) as stub, override_settings(FASTAPI_SERVICE_URL=stub.url):
+        yield stub
+
+
+def ids(entries):
+    return [entry['user_id'] for entry in entries]
+
+
+@pytest.mark.django_db
+def test_in_sync_costs_one_call(stub):
+    result = structure_merkle.reconcile(FastAPIService())
+
+    assert result.in_sync
+    assert result.calls == 1
+    assert stub.requests['hashes'] == 1
+
+
+@pytest.mark.django_db
+def test_missing_leaf_found_along_one_path(network, stub):
+    del stub.structure[network['e'].user_id]
+
+    result = structure_merkle.reconcile(FastAPIService())
+
+    assert result.missing == [{'user_id': network['e'].user_id, 'referrer_id': network['c'].user_id}]
+    assert result.unexpected == [] and result.wrong_referrer == []
+    # root → a → c: в ветку b и в d не спускались
+    assert result.calls == 3
+    assert result.compared == 3
+
+
+@pytest.mark.django_db
+def test_moved_and_unexpected(network, stub):
+    stub.structure[network['c'].user_id] = network['b'].user_id
+    stub.structure['99999999'] = network['b'].user_id
+
+    result = structure_merkle.reconcile(FastAPIService())
+
+    assert result.wrong_referrer == [{
+        'user_id': network['c'].user_id,
+        'referrer_id': network['a'].user_id,
+        'remote_referrer': network['b'].user_id,
+    }]
+    assert result.unexpected == [{'user_id': '99999999', 'remote_referrer': network['b'].user_id}]
+    # e переехал вместе с c и совпадает — не пропуск
+    assert result.missing == []
+
+
+@pytest.mark.django_db
+def test_command_repairs_missing_subtree(network, stub):
+    del stub.structure[network['c'].user_id]
+    del stub.structure[network['e'].user_id]
+
+    out = StringIO()
+    call_command('reconcile_structure', '--repair', stdout=out)
+
+    assert 'Нет в FastAPI: 2' in out.getvalue()
+    assert 'Зарегистрировано в FastAPI: 2, ошибок: 0' in out.getvalue()
+    assert stub.structure[network['e'].user_id] == network['c'].user_id
+    assert structure_merkle.reconcile(FastAPIService()).in_sync
+
+
+@pytest.mark.django_db
+def test_task_skips_without_hashes_route(network, stub, caplog):
+    with patch.object(FastAPIService, 'get_structure_hashes', side_effect=HashesNotSupported('hashes')):
+        assert reconcile_structure.delay().get() == {'status': 'skipped', 'reason': 'hashes_not_supported'}
+    assert 'no structure hashes route' in caplog.text
+
+
+@pytest.mark.django_db
+def test_nodes_keyed_on_username(network):
+    """username может отличаться от user_id — FastAPI знает пользователя по username"""
+    c = network['c']
+    c.username = 'partner-c'
+    c.save()
+    structure = fastapi_structure()
+    e = network['e'].username
+    del structure[e]
+
+    with FastAPIStub(structure=structure) as stub, override_settings(FASTAPI_SERVICE_URL=stub.url):
+        service = FastAPIService()
+        result = structure_merkle.reconcile(service)
+
+        assert result.missing == [{'user_id': e, 'referrer_id': 'partner-c'}]
+        assert result.unexpected == [] and result.wrong_referrer == []
+
+        assert structure_merkle.repair(service, result) == (1, 0)
+        assert stub.structure[e] == 'partner-c'
+        assert c.user_id not in stub.structure
+        assert structure_merkle.reconcile(service).in_sync
+
+
+class HashService:
+    """Upstream по словарю {user_id: пригласивший} без HTTP"""
+
+    def __init__(self, structure):
+        self.hashes = structure_hashes(structure)
+        self.calls = 0
+
+    def get_structure_hashes(self, user_ids):
+        self.calls += 1
+        return {user_id: self.hashes[user_id] for user_id in user_ids if user_id in self.hashes}
+
+
+def test_drift_in_large_network_costs_depth_calls():
+    rng = np.random.default_rng(19)
+    n = 100_000
+    parents = [-1] + rng.integers(0, np.arange(1, n)).tolist()
+    depth = [0] * n
+    for v in range(1, n):
+        depth[v] = depth[parents[v]] + 1
+
+    order = sorted(range(n), key=lambda v: (depth[v], parents[v]))
+    position = {v: i for i, v in enumerate(order)}
+    forest = ReferralForest(
+        [f'{v:08d}' for v in order],
+        np.array([position[parents[v]] if parents[v] >= 0 else -1 for v in order]),
+        np.array([depth[v] for v in order]),
+    )
+    local = structure_merkle.LocalTree(forest)
+
+    structure = {f'{v:08d}': f'{parents[v]:08d}' if parents[v] >= 0 else None for v in range(n)}
+    leaf = max(range(n), key=lambda v: depth[v])
+    del structure[f'{leaf:08d}']
+
+    service = HashService(structure)
+    result = structure_merkle.reconcile(service, local=local)
+
+    assert ids(result.missing) == [f'{leaf:08d}']
+    assert service.calls == depth[leaf]
+    assert result.compared < 100
@@ -0,0 +1,72 @@
+import pytest
+from django.urls import reverse
+
+from cabinet.models import MonthlyReport, MonthlyReportJob, MonthlyTreeSnapshot
+from cabinet.services import monthly_report, tree_history
+
+
+def close_month(owner, year, month, volumes):
+    MonthlyReport.objects.bulk_create([
+        MonthlyReport(user=user, year=year, month=month, personal_volume=lo, partner_level='Partner')
+        for user, lo in volumes.items()
+    ])
+    job = MonthlyReportJob.objects.create(owner=owner, year=year, month=month, status='running')
+    monthly_report.finish_job(job)
+
+
+@pytest.mark.django_db
+def test_month_close_stores_snapshot(network, reload):
+    root, a = network['root'], network['a']
+    close_month(root, 2026, 8, {root: 10, a: 20, network['c']: 5})
+
+    snapshot = MonthlyTreeSnapshot.objects.get(owner=root, year=2026, month=8)
+    assert snapshot.size == 4
+
+    payload = tree_history.load_month(reload(root), 2026, 8)
+    assert payload['ids'] == [root.user_id, a.user_id, network['b'].user_id, network['c'].user_id]
+    assert payload['parent'] == [-1, 0, 0, 1]
+    assert payload['columns']['personal_volume'] == [[0, 1, 3], [10.0, 20.0, 5.0]]
+    assert payload['columns']['total_referrals'] == [[0, 1], [2, 1]]
+
+
+@pytest.mark.django_db
+def test_partner_sees_own_subtree_from_upline_snapshot(client, network):
+    root, a = network['root'], network['a']
+    close_month(root, 2026, 8, {a: 20, network['c']: 5})
+    client.force_login(a)
+
+    data = client.get(reverse('cabinet:referral_tree_history', args=[2026, 8])).json()
+
+    assert data['ids'] == [a.user_id, network['c'].user_id]
+    assert data['parent'] == [-1, 0]
+    assert (data['year'], data['month']) == (2026, 8)
+
+    missing = client.get(reverse('cabinet:referral_tree_history', args=[2026, 7]))
+    assert missing.status_code == 404
+
+
+@pytest.mark.django_db
+def test_month_over_month_diff(client, network, create_partner, reload):
+    root, a, b, c = network['root'], network['a'], network['b'], network['c']
+    close_month(root, 2026, 8, {root: 10, a: 20, c: 5})
+
+    d = create_partner(referrer=b)
+    c.delete()
+    close_month(reload(root), 2026, 9, {root: 10, a: 35, d: 1})
+
+    client.force_login(root)
+    data = client.get(
+        reverse('cabinet:referral_tree_history', args=[2026, 9]), {'compare': '2026-08'},
+    ).json()
+
+    assert data['compare'] == '2026-08'
+    assert [node['id'] for node in data['added']] == [d.user_id]
+    assert data['added'][0]['parent'] == b.user_id
+    assert data['removed'] == [c.user_id]
+    assert data['changed'] == {
+        a.user_id: {'personal_volume': 35.0, 'total_referrals': 0},
+        b.user_id: {'total_referrals': 1},
+    }
+
+    bad = client.get(reverse('cabinet:referral_tree_history', args=[2026, 9]), {'compare': 'august'})
+    assert bad.status_code == 400
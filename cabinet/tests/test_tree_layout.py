@@ -0,0 +1,114 @@
+import random
+from unittest.mock import patch
+
+import pytest
+from django.urls import reverse
+
+from cabinet.services import tree_layout
+from cabinet.services.referral_tree import load_referral_tree
+from cabinet.services.tree_layout import compute_layout, get_layout, tidy_tree
+
+
+def children_of(parents):
+    children = [[] for _ in parents]
+    for v, p in enumerate(parents):
+        if p >= 0:
+            children[p].append(v)
+    return children
+
+
+def test_tidy_tree_small():
+    """Родитель над серединой детей, соседи не ближе шага"""
+    x, y = tidy_tree([-1, 0, 0, 0, 1, 3])
+
+    assert y == [0, 1, 1, 1, 2, 2]
+    assert x == [1.0, 0.0, 1.0, 2.0, 0.0, 2.0]
+
+
+def test_tidy_tree_random():
+    rng = random.Random(14)
+    for _ in range(300):
+        n = rng.randint(1, 80)
+        parents = [-1] + [rng.randrange(v) for v in range(1, n)]
+        x, y = tidy_tree(parents)
+        children = children_of(parents)
+
+        order = [0]
+        for v in order:
+            order.extend(children[v])
+        by_level = {}
+        for v in order:
+            by_level.setdefault(y[v], []).append(v)
+
+        for row in by_level.values():
+            for left, right in zip(row, row[1:]):
+                assert x[right] - x[left] >= 1 - 1e-3
+        for v, kids in enumerate(children):
+            if kids:
+                assert x[v] == pytest.approx((x[kids[0]] + x[kids[-1]]) / 2, abs=1e-3)
+        assert min(x) == 0
+
+
+def test_tidy_tree_deep_chain():
+    """Глубина не ограничена стеком рекурсии"""
+    x, y = tidy_tree([-1, *range(4999)])
+
+    assert max(y) == 4999
+    assert set(x) == {0}
+
+
+@pytest.fixture
+def network(create_partner):
+    """root → (a → 3 реферала → по 1 рефералу, b)"""
+    root = create_partner()
+    a = create_partner(referrer=root)
+    b = create_partner(referrer=root)
+    for _ in range(3):
+        create_partner(referrer=create_partner(referrer=a))
+    return {'root': root, 'a': a, 'b': b}
+
+
+@pytest.mark.django_db
+def test_large_subtree_collapsed(network):
+    tree = load_referral_tree(network['root'])
+    layout = compute_layout(tree, threshold=5)
+
+    a_index = next(i for i, u in enumerate(tree.users) if u.pk == network['a'].pk)
+    assert [tree.users[i].pk for i in layout.visible] == [network['root'].pk, network['a'].pk, network['b'].pk]
+    assert layout.clusters == [(a_index, 6, layout.x[a_index], 2)]
+
+    # Корень не сворачивается, небольшие поддеревья тоже
+    assert compute_layout(tree, threshold=6).clusters == []
+
+
+@pytest.mark.django_db
+def test_layout_cached_by_tree_shape(network, create_partner):
+    tree = load_referral_tree(network['root'])
+
+    with patch.object(tree_layout, 'compute_layout', wraps=compute_layout) as compute:
+        get_layout(tree)
+        get_layout(load_referral_tree(network['root']))
+        assert compute.call_count == 1
+
+        create_partner(referrer=network['b'])
+        get_layout(load_referral_tree(network['root']))
+        assert compute.call_count == 2
+
+
+@pytest.mark.django_db
+def test_referral_tree_api_layout(client, settings, network):
+    settings.REFERRAL_TREE_CLUSTER_THRESHOLD = 5
+    root = network['root']
+    client.force_login(root)
+
+    statuses = {u.user_id: {'lo': 10} for u in network['a'].get_referral_descendants()}
+    with patch('cabinet.views.status_cache.get_statuses', side_effect=lambda ids: {i: statuses.get(i, {}) for i in ids}):
+        data = client.get(reverse('cabinet:referral_tree'), {'format': 'compact', 'layout': '1'}).json()
+
+    assert data['ids'] == [root.user_id, network['a'].user_id, network['b'].user_id]
+    assert data['parent'] == [-1, 0, 0]
+    assert data['layout']['y'] == [0, 1, 1]
+    assert data['layout']['clusters']['node'] == [1]
+    assert data['layout']['clusters']['count'] == [6]
+    assert data['layout']['clusters']['personal_volume'] == [60]
+    assert data['layout']['depth'] == 2
@@ -0,0 +1,177 @@
+from unittest.mock import patch
+
+import pytest
+from django.urls import reverse
+
+from accounts.models import CustomUser
+from cabinet.models import BestExtraBonus
+from cabinet.services import extra_bonus, status_cache
+from cabinet.services import tree_version as tree_version_module
+from cabinet.services.referral_tree import load_referral_tree
+from cabinet.services.tree_version import tree_version
+
+
+def version_of(root):
+    root = CustomUser.objects.get(pk=root.pk)
+    tree = load_referral_tree(root)
+    return tree_version(root, tree, extra_bonus.best_ranks(tree.users))
+
+
+@pytest.fixture
+def network(network, create_partner):
+    """root → (a → c, b); other — чужая структура"""
+    network['other'] = create_partner()
+    return network
+
+
+@pytest.fixture
+def statuses():
+    """Статусы только из кеша, без FastAPI"""
+    def get_statuses(ids):
+        entries = status_cache.cache.get_many([status_cache.status_key(i) for i in ids])
+        return {i: (entries.get(status_cache.status_key(i)) or {}).get('data', {}) for i in ids}
+
+    with patch('cabinet.views.status_cache.get_statuses', side_effect=get_statuses):
+        yield
+
+
+@pytest.mark.django_db
+def test_version_follows_structure_changes(network, create_partner, reload):
+    root, a = network['root'], network['a']
+    versions = [version_of(root)]
+
+    def changed():
+        versions.append(version_of(root))
+        return versions[-1] != versions[-2]
+
+    create_partner(referrer=network['other'])
+    assert not changed()
+
+    create_partner(referrer=network['c'])
+    assert changed()
+
+    # Переезд внутри структуры: размер тот же, форма другая
+    c = reload(network['c'])
+    c.referrer = network['b']
+    c.save()
+    assert changed()
+
+    c.delete()
+    assert changed()
+
+
+@pytest.mark.django_db
+def test_version_follows_node_fields(network, reload):
+    root, a = network['root'], network['a']
+    versions = [version_of(root)]
+
+    def changed():
+        versions.append(version_of(root))
+        return versions[-1] != versions[-2]
+
+    a.first_name = 'Aziz'
+    a.save()
+    assert changed()
+
+    CustomUser.objects.filter(pk=network['b'].pk).update(is_active=False)
+    assert changed()
+
+    CustomUser.objects.filter(pk=network['c'].pk).update(user_type='store')
+    assert changed()
+
+    BestExtraBonus.objects.create(user=a, rank=3, extra_bonus='Smartphone')
+    assert changed()
+
+    # Правки вне структуры версию не меняют
+    other = reload(network['other'])
+    other.first_name = 'Other'
+    other.save()
+    BestExtraBonus.objects.create(user=other, rank=3, extra_bonus='Smartphone')
+    assert not changed()
+
+
+@pytest.mark.django_db
+def test_version_follows_statuses_of_own_structure(network):
+    root = network['root']
+    version = version_of(root)
+
+    status_cache.store_statuses({network['other'].user_id: {'lo': 1}})
+    assert version_of(root) == version
+
+    status_cache.store_statuses({network['c'].user_id: {'lo': 1}})
+    changed = version_of(root)
+    assert changed != version
+
+    # Обновление тем же значением — не изменение
+    status_cache.store_statuses({network['c'].user_id: {'lo': 1}})
+    assert version_of(root) == changed
+
+
+@pytest.mark.django_db
+def test_since_returns_delta_and_304(client, network, statuses, create_partner):
+    root = network['root']
+    client.force_login(root)
+    url = reverse('cabinet:referral_tree')
+
+    full = client.get(url, {'format': 'compact'}).json()
+    version = full['version']
+
+    unchanged = client.get(url, {'format': 'compact', 'since': version})
+    assert unchanged.status_code == 304
+    assert unchanged['ETag'] == f'"{version}"'
+
+    d = create_partner(referrer=network['b'])
+    status_cache.store_statuses({network['a'].user_id: {'lo': 55, 'qualification': 'Mentor'}})
+
+    delta = client.get(url, {'format': 'compact', 'since': version}).json()
+    assert delta['delta'] is True
+    assert delta['version'] != version
+    assert [n['id'] for n in delta['added']] == [d.user_id]
+    assert delta['added'][0]['parent'] == network['b'].user_id
+    assert delta['removed'] == []
+    assert delta['changed'] == {
+        network['a'].user_id: {'personal_volume': 55.0, 'partner_level': 'Mentor', 'qualification': 'Mentor'},
+    }
+
+    d.delete()
+    removed = client.get(url, {'format': 'compact', 'since': delta['version']}).json()
+    assert removed['removed'] == [d.user_id]
+    assert removed['added'] == [] and removed['changed'] == {}
+
+
+@pytest.mark.django_db
+def test_since_ignores_statuses_outside_structure(client, network, statuses):
+    """Статус изменился вне структуры — 304 с той же версией"""
+    client.force_login(network['root'])
+    url = reverse('cabinet:referral_tree')
+    version = client.get(url).json()['version']
+
+    status_cache.store_statuses({network['other'].user_id: {'lo': 1}})
+    response = client.get(url, {'since': version})
+
+    assert response.status_code == 304
+    assert response['ETag'] == f'"{version}"'
+
+
+@pytest.mark.django_db
+def test_unknown_since_returns_full_tree(client, network, statuses):
+    client.force_login(network['root'])
+
+    data = client.get(reverse('cabinet:referral_tree'), {'since': 'expired'}).json()
+
+    assert 'delta' not in data
+    assert len(data['nodes']) == 4
+
+
+@pytest.mark.django_db
+def test_snapshot_is_written_once_per_version(client, network, statuses):
+    client.force_login(network['root'])
+    url = reverse('cabinet:referral_tree')
+
+    with patch.object(tree_version_module.cache, 'set', wraps=tree_version_module.cache.set) as cache_set:
+        first = client.get(url).json()['version']
+        again = client.get(url).json()['version']
+
+    assert first == again
+    snapshot_key = tree_version_module.snapshot_key(network['root'], first)
+    assert [call.args[0] for call in cache_set.call_args_list].count(snapshot_key) == 1
@@ -19,8 +19,11 @@ urlpatterns = [
     path('api/user/lo/subtract/', views.sub_user_lo, name='sub_user_lo'),
     path('api/referrals/', views.get_referrals_json, name='referrals_json'),
     path('api/referrals/tree/', views.referral_tree_api, name='referral_tree'),
+    path('api/referrals/children/', views.referral_children_api, name='referral_children'),
+    path('api/referrals/history/<int:year>/<int:month>/', views.referral_tree_history_api, name='referral_tree_history'),
     path('api/referrals/<str:user_id>/details/', views.get_referral_details, name='referral_details'),
     path('api/monthly-report/generate/', views.generate_monthly_report, name='generate_monthly_report'),
+    path('api/monthly-report/<int:job_id>/progress/', views.monthly_report_progress, name='monthly_report_progress'),
 
     path('reports/history/', views.monthly_reports_history, name='monthly_reports'),
     path('reports/history/export/', views.export_monthly_reports_excel, name='export_monthly_reports'),
@@ -1,21 +1,31 @@
 import json
 import logging
 
-import requests
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
 from django.core.paginator import Paginator
-from core.settings import FASTAPI_SERVICE_URL
-# from .tasks import update_user_stats_cache
-from django.http import JsonResponse
-from django.shortcuts import render
+from django.http import HttpResponseNotModified, JsonResponse
+from django.shortcuts import get_object_or_404, render
+from django.urls import reverse
+from django.utils.http import quote_etag
 from django.contrib.auth.decorators import login_required
 from django.db.models import Sum
-from .models import Purchase, News, MonthlyReport
+from .models import Purchase, News, MonthlyReport, MonthlyReportJob
 from datetime import datetime, timedelta
 from accounts.models import CustomUser
 
+from .services.fastapi_async_service import AsyncFastAPIService
 from .services.fastapi_service import FastAPIService
+from .services.referral_tree import load_referral_tree
+from .services.structure_bfs import walk_structure
+from .services.tree_payload import get_full_name, get_short_name
+from .services import (
+    activity_feed, compression, extra_bonus, monthly_report, status_cache, tree_history, tree_layout, tree_payload,
+    tree_version,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -24,14 +34,8 @@ logger = logging.getLogger(__name__)
 
 @login_required
 def dashboard_view(request):
-    stats = {}
-    # user_id = request.user.username
-    # cache_key = f"user:stats:{user_id}"
-    # stats = cache.get(cache_key)  # быстрое чтение, не блокирующее
-    #
-    # if stats is None:
-    #     # стартуем фоновую задачу, но не ждём её результата
-    #     update_user_stats_cache.delay(user_id)
+    # Быстрое чтение из кеша; при промахе обновление уже ушло в Celery
+    stats = status_cache.get_status(request.user.username)
 
     return render(
         request,
@@ -39,6 +43,8 @@ def dashboard_view(request):
         {
             "user_stats": stats or {},  # пустой словарь пока нет данных
             "loading": stats is None,
+            # Последнее в команде — один LRANGE, без обхода структуры
+            "team_feed": activity_feed.recent(request.user, limit=10),
         }
     )
 
@@ -61,80 +67,30 @@ def finance_view(request):
 
 
 @login_required
-def get_user_data(request):
-    user_id = request.user.username
-    try:
-        r = requests.get(
-            f"{FASTAPI_SERVICE_URL}/user/users/{user_id}/status",
-            timeout=5
-        )
-        r.raise_for_status()
-    except requests.RequestException as e:
+async def get_user_data(request):
+    user = await request.auser()
+    stats = await status_cache.aget_status(user.username)
+    if stats is None:
         return JsonResponse(
-            {"error": str(e)},
+            {"error": "Сервис статистики недоступен"},
             status=503
         )
 
-    return JsonResponse(r.json(), safe=False)
+    return JsonResponse({"error": False, "data": stats})
 
 
 
 @login_required
-def add_user_lo(request):
-    # user_id = request.user.username
-
-    # Получаем данные из POST запроса
-    if request.method == 'POST':
-        try:
-            # Пытаемся получить данные из JSON
-            data = json.loads(request.body)
-        except json.JSONDecodeError:
-            # Если не JSON, пробуем получить из формы
-            data = request.POST.dict()
-
-        lo_amount = data.get('lo')
-        user_id = data.get('user_id')
-
-        if not lo_amount:
-            return JsonResponse(
-                {"error": "Параметр 'lo' не указан"},
-                status=400
-            )
-
-        try:
-            payload = {"lo": float(lo_amount)}
-
-            r = requests.post(
-                f"{FASTAPI_SERVICE_URL}/user/users/{user_id}/lo/add",
-                json=payload,
-                timeout=5
-            )
-            r.raise_for_status()
-
-            return JsonResponse(r.json(), safe=False)
-
-        except ValueError:
-            return JsonResponse(
-                {"error": "Параметр 'lo' должен быть числом"},
-                status=400
-            )
-        except requests.RequestException as e:
-            return JsonResponse(
-                {"error": str(e)},
-                status=503
-            )
-
-    # Если метод не POST
-    return JsonResponse(
-        {"error": "Метод не поддерживается. Используйте POST."},
-        status=405
-    )
+async def add_user_lo(request):
+    return await _change_user_lo(request, 'add')
 
 
 @login_required
-def sub_user_lo(request):
-    # user_id = request.user.username
+async def sub_user_lo(request):
+    return await _change_user_lo(request, 'subtract')
 
+
+async def _change_user_lo(request, operation):
     # Получаем данные из POST запроса
     if request.method == 'POST':
         try:
@@ -154,28 +110,31 @@ def sub_user_lo(request):
             )
 
         try:
-            payload = {"lo": float(lo_amount)}
-
-            r = requests.post(
-                f"{FASTAPI_SERVICE_URL}/user/users/{user_id}/lo/subtract",
-                json=payload,
-                timeout=5
-            )
-            r.raise_for_status()
-
-            return JsonResponse(r.json(), safe=False)
-
+            lo = float(lo_amount)
         except ValueError:
             return JsonResponse(
                 {"error": "Параметр 'lo' должен быть числом"},
                 status=400
             )
-        except requests.RequestException as e:
+
+        service = AsyncFastAPIService()
+        try:
+            if operation == 'add':
+                payload = await service.add_user_lo(user_id, lo)
+            else:
+                payload = await service.sub_user_lo(user_id, lo)
+        except httpx.HTTPError as e:
             return JsonResponse(
                 {"error": str(e)},
                 status=503
             )
 
+        if isinstance(payload, dict) and not payload.get('error'):
+            delta = lo if operation == 'add' else -lo
+            await sync_to_async(activity_feed.publish)(user_id, activity_feed.LO, delta)
+
+        return JsonResponse(payload, safe=False)
+
     # Если метод не POST
     return JsonResponse(
         {"error": "Метод не поддерживается. Используйте POST."},
@@ -184,21 +143,17 @@ def sub_user_lo(request):
 
 
 @login_required
-def get_user_team(request):
-    user_id = request.user.username
+async def get_user_team(request):
+    user = await request.auser()
     try:
-        r = requests.get(
-            f"{FASTAPI_SERVICE_URL}/user/users/{user_id}/structure",
-            timeout=5
-        )
-        r.raise_for_status()
-    except requests.RequestException as e:
+        payload = await AsyncFastAPIService().get_user_structure(user.username)
+    except httpx.HTTPError as e:
         return JsonResponse(
             {"error": str(e)},
             status=503
         )
 
-    return JsonResponse(r.json(), safe=False)
+    return JsonResponse(payload, safe=False)
 
 
 @login_required
@@ -246,6 +201,14 @@ def structure_view(request):
         month=today.month,
     ).exists()
 
+    # Незавершённая задача отчёта — страница продолжит показывать её прогресс
+    running_report_job = MonthlyReportJob.objects.filter(
+        owner=user,
+        year=today.year,
+        month=today.month,
+        status__in=('pending', 'running'),
+    ).first()
+
     # Дата следующего доступного сохранения — 1-е число следующего месяца
     if today.month == 12:
         next_available_date = date(today.year + 1, 1, 1)
@@ -258,6 +221,7 @@ def structure_view(request):
         'active_referrals': active_referrals,
         'group_volume': group_volume,
         'report_already_saved': report_already_saved,
+        'running_report_job': running_report_job,
         'next_available_date': next_available_date,
     }
 
@@ -266,25 +230,21 @@ def structure_view(request):
 
 # Дополнительная функция для AJAX-загрузки рефералов (по желанию)
 @login_required
-def get_referrals_json(request):
+async def get_referrals_json(request):
     """Получение списка рефералов в формате JSON с данными из API"""
-    user = request.user
+    user = await request.auser()
     level = request.GET.get('level', '1')
     
     try:
         level = int(level)
     except ValueError:
         level = 1
-    
+
+    service = AsyncFastAPIService()
+
     try:
         # Получаем структуру из FastAPI
-        response = requests.get(
-            f"{FASTAPI_SERVICE_URL}/user/users/{user.username}/structure",
-            timeout=5
-        )
-        response.raise_for_status()
-        api_data = response.json()
-        print(f"api_data.get('error') -- {api_data.get('error')}")
+        api_data = await service.get_user_structure(user.username)
         
         if api_data.get('error'):
             return JsonResponse({
@@ -295,7 +255,7 @@ def get_referrals_json(request):
         structure_data = api_data.get('data', {})
         team_members = structure_data.get('team', [])
         
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Ошибка API при получении структуры: {e}")
         return JsonResponse({
             'error': True,
@@ -304,8 +264,10 @@ def get_referrals_json(request):
     
     # Получаем данные из БД
     referral_user_ids = [str(member.get('user_id')) for member in team_members]
-    db_referrals = CustomUser.objects.filter(user_id__in=referral_user_ids)
-    db_referrals_dict = {str(ref.user_id): ref for ref in db_referrals}
+    db_referrals_dict = {
+        str(ref.user_id): ref
+        async for ref in CustomUser.objects.filter(user_id__in=referral_user_ids)
+    }
     
     # Обрабатываем только первый уровень
     if level == 1:
@@ -340,73 +302,23 @@ def get_referrals_json(request):
             'error': False
         })
     
-    # Для второго уровня и глубже (рекурсивно)
+    # Для второго уровня и глубже — обход в ширину с бюджетом узлов и времени
     elif level > 1:
-        all_referrals_data = []
-        
-        def get_deep_referrals(members, current_level, max_level):
-            if current_level > max_level:
-                return []
-            
-            referrals_data = []
-            for member in members:
-                user_id = str(member.get('user_id'))
-                
-                try:
-                    # Получаем структуру для каждого члена команды
-                    member_response = requests.get(
-                        f"{FASTAPI_SERVICE_URL}/user/users/{user_id}/structure",
-                        timeout=3
-                    )
-                    if member_response.status_code == 200:
-                        member_data = member_response.json()
-                        if not member_data.get('error'):
-                            # Получаем данные из БД
-                            try:
-                                db_data = CustomUser.objects.get(user_id=user_id)
-                            except CustomUser.DoesNotExist:
-                                db_data = None
-                            
-                            member_info = {
-                                'id': user_id,
-                                'level': current_level,
-                                'personal_volume': float(member.get('lo', 0)),
-                                'team_count': len(member.get('team', [])),
-                            }
-                            
-                            if db_data:
-                                member_info.update({
-                                    'name': db_data.get_full_name() or db_data.username,
-                                    'email': db_data.email,
-                                    'phone': db_data.phone,
-                                    'registration_date': db_data.date_joined.strftime('%d.%m.%Y'),
-                                    'group_volume': float(db_data.group_volume),
-                                    'partner_level': db_data.partner_level,
-                                })
-                            
-                            referrals_data.append(member_info)
-                            
-                            # Рекурсивно получаем команду
-                            if current_level < max_level:
-                                sub_team = member_data.get('data', {}).get('team', [])
-                                referrals_data.extend(
-                                    get_deep_referrals(sub_team, current_level + 1, max_level)
-                                )
-                except:
-                    continue
-            
-            return referrals_data
-        
-        # Начинаем рекурсию с команды первого уровня
-        deep_referrals = get_deep_referrals(team_members, 2, level)
-        
+        walk = await walk_structure(
+            service,
+            team_members,
+            start_level=2,
+            max_level=min(level, settings.REFERRAL_TREE_MAX_DEPTH),
+        )
+
         return JsonResponse({
             'level': level,
-            'referrals': deep_referrals,
-            'total_count': len(deep_referrals),
+            'referrals': walk.members,
+            'total_count': len(walk.members),
+            'budget': walk.budget(),
             'error': False
         })
-    
+
     return JsonResponse({
         'level': level,
         'referrals': [],
@@ -415,334 +327,227 @@ def get_referrals_json(request):
     })
 
 
-from datetime import date
-
-EXTRA_BONUS_RANK = {
-    "-":                     0,
-    "Par dazmol":            1,
-    "Changyutgich":          2,
-    "Televizor smart-32":    3,
-    "Gaz plita":             4,
-    "Konditsioner":          5,
-    "Kir yuvadigan mashina": 6,
-    "Chet el sayohati":      7,
-    "Onix avtomobili":       8,
-    "Chery Tigo 7 Pro Max":  9,
-}
-
-
 def get_prev_month(today):
     if today.month == 1:
         return today.year - 1, 12
     return today.year, today.month - 1
 
 
-def build_best_extra_bonus_map():
-    """Возвращает {user_id: max_rank} за всю историю."""
-    best_map = {}
-    for user_id, extra_bonus in MonthlyReport.objects.exclude(
-        extra_bonus=''
-    ).exclude(
-        extra_bonus='-'
-    ).values_list('user__user_id', 'extra_bonus'):  # ← user__user_id
-        rank = EXTRA_BONUS_RANK.get(extra_bonus, 0)
-        if rank > best_map.get(user_id, 0):
-            best_map[user_id] = rank
-    return best_map
+REFERRAL_TREE_FORMATS = ('full', 'compact')
 
 
 @login_required
 def referral_tree_api(request):
-    from concurrent.futures import ThreadPoolExecutor, as_completed
-
-    nodes = []
-    edges = []
-    visited = set()
-
-    best_extra_bonus_map = build_best_extra_bonus_map()
-
-    def get_short_name(user):
-        parts = [user.first_name, user.last_name]
-        name = ' '.join(p for p in parts if p).strip()
-        return name or user.username
-
-    def get_full_name(user):
-        parts = [user.last_name, user.first_name, getattr(user, 'middle_name', '')]
-        name = ' '.join(p for p in parts if p).strip()
-        return name or user.username
-
-    def traverse(user, level):
-        if user.pk in visited:
-            return
-        visited.add(user.pk)
-
-        nodes.append({
-            'id':              user.user_id,
-            'label':           get_short_name(user),
-            'title':           get_full_name(user),
-            'level':           level,
-            'active':          getattr(user, 'is_active', True),
-            'user_type':       getattr(user, 'user_type', 'partner'),
-            'personal_volume': 0.0,
-            'group_volume':    0.0,
-            'partner_level':   getattr(user, 'partner_level', ''),
-            'total_referrals': getattr(user, 'total_referrals', 0),
-            'qualification':   '',
-            'side_volume':     0,
-            'points':          0,
-            'personal_bonus':  0,
-            'structure_bonus': 0,
-            'mentor_bonus':    0,
-            'extra_bonus':     '',
-            'personal_money':  0,
-            'group_money':     0,
-            'leader_money':    0,
-            'side_vol_money':  0,
-            'total_money':     0,
-            'veron':           0,
-            'total_income':    0,
-        })
+    """
+    Всё дерево структуры. По умолчанию — словарь на узел и список рёбер;
+    ?format=compact — колоночный формат (services/tree_payload.py) для
+    больших структур, &layout=1 — с готовыми координатами и свёрнутыми
+    большими поддеревьями (services/tree_layout.py).
+
+    ?since=<version> — только изменения с версии клиента
+    (services/tree_version.py) или 304, если изменений нет.
+    Ответ сжимается по Accept-Encoding.
+    """
+    fmt = request.GET.get('format', 'full')
+    if fmt not in REFERRAL_TREE_FORMATS:
+        return JsonResponse({'error': True, 'message': 'Неизвестный формат'}, status=400)
+
+    root = request.user
+    since = request.GET.get('since')
+    tree = load_referral_tree(root)
+    status_map = status_cache.get_statuses([user.user_id for user in tree.users])
+    best_ranks = extra_bonus.best_ranks(tree.users)
+    version = tree_version.tree_version(root, tree, best_ranks)
+    if since == version:
+        return tree_not_modified(version)
+
+    best_extra_bonus_map = {tree.get(pk).user_id: rank for pk, rank in best_ranks.items()}
+    rows = tree_payload.node_rows(tree, status_map, best_extra_bonus_map)
+
+    snapshot = tree_version.make_snapshot(tree, rows)
+    tree_version.save_snapshot(root, version, snapshot)
+
+    previous = tree_version.load_snapshot(root, since) if since else None
+    if previous is not None:
+        delta = tree_version.diff(previous, snapshot)
+        if not any(delta.values()):
+            return tree_not_modified(version)
+        payload = {'delta': True, 'since': since, **delta, 'truncated': tree.truncated}
+
+    elif fmt == 'compact':
+        if request.GET.get('layout') == '1':
+            layout = tree_layout.get_layout(tree)
+            payload = tree_payload.compact_tree(tree, rows, visible=layout.visible)
+            payload['layout'] = tree_layout.layout_payload(tree, layout, status_map)
+        else:
+            payload = tree_payload.compact_tree(tree, rows)
+
+    else:
+        edges = [
+            {'from': referrer.user_id, 'to': referral.user_id}
+            for referrer, referral in tree.edges()
+        ]
+        payload = {'nodes': tree_payload.full_nodes(rows), 'edges': edges, 'truncated': tree.truncated}
+
+    payload['version'] = version
+    response = JsonResponse(payload, json_dumps_params={'separators': (',', ':')} if fmt == 'compact' else {})
+    response['ETag'] = quote_etag(version)
+    return compression.compress_response(request, response)
 
-        referrals = CustomUser.objects.filter(referrer=user)
-        for referral in referrals:
-            edges.append({'from': user.user_id, 'to': referral.user_id})
-            traverse(referral, level + 1)
 
-    traverse(request.user, level=0)
+def tree_not_modified(version):
+    response = HttpResponseNotModified()
+    response['ETag'] = quote_etag(version)
+    return response
+
 
-    def fetch_status(user_id):
+@login_required
+def referral_tree_history_api(request, year, month):
+    """
+    Структура на конец месяца из снимка MonthlyTreeSnapshot в компактном
+    формате. ?compare=YYYY-MM — вместо дерева изменения относительно
+    другого месяца: кто добавился, кто ушёл и какие показатели изменились.
+    """
+    payload = tree_history.load_month(request.user, year, month)
+    if payload is None:
+        return JsonResponse({'error': True, 'message': 'Нет снимка структуры за этот месяц'}, status=404)
+
+    compare = request.GET.get('compare')
+    if compare:
         try:
-            resp = requests.get(
-                f"{FASTAPI_SERVICE_URL}/user/users/{user_id}/status",
-                timeout=5
-            )
-            if resp.status_code == 200:
-                data = resp.json()
-                if not data.get('error'):
-                    return user_id, data.get('data', {})
-        except Exception as e:
-            logger.warning(f"Не удалось получить статус для {user_id}: {e}")
-        return user_id, {}
-
-    user_ids = [n['id'] for n in nodes]
-    status_map = {}
-
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        futures = {executor.submit(fetch_status, uid): uid for uid in user_ids}
-        for future in as_completed(futures):
-            uid, status = future.result()
-            status_map[uid] = status
-
-    for node in nodes:
-        st = status_map.get(node['id'], {})
-
-        current_extra = st.get('extra_bonus', '') or ''
-        current_rank  = EXTRA_BONUS_RANK.get(current_extra, 0)
-        best_rank     = best_extra_bonus_map.get(node['id'], 0)
-        node['extra_bonus'] = current_extra if current_rank > best_rank else ''
-
-        if st:
-            node['personal_volume'] = float(st.get('lo', 0) or 0)
-            node['group_volume']    = float(st.get('go', 0) or 0)
-            node['qualification']   = st.get('qualification', '')
-            node['partner_level']   = st.get('qualification', node['partner_level'])
-            node['side_volume']     = st.get('side_volume', 0)
-            node['points']          = st.get('points', 0)
-            node['personal_bonus']  = st.get('personal_bonus', 0)
-            node['structure_bonus'] = st.get('structure_bonus', 0)
-            node['mentor_bonus']    = st.get('mentor_bonus', 0)
-            node['personal_money']  = st.get('personal_money', 0)
-            node['group_money']     = st.get('group_money', 0)
-            node['leader_money']    = st.get('leader_money', 0)
-            node['side_vol_money']  = st.get('side_vol_money', 0)
-            node['total_money']     = st.get('total_money', 0)
-            node['veron']           = st.get('veron', 0)
-            node['total_income']    = st.get('total_income', 0)
-
-    return JsonResponse({'nodes': nodes, 'edges': edges})
+            compare_year, compare_month = (int(part) for part in compare.split('-'))
+        except ValueError:
+            return JsonResponse({'error': True, 'message': 'Некорректный месяц сравнения'}, status=400)
+
+        previous = tree_history.load_month(request.user, compare_year, compare_month)
+        if previous is None:
+            return JsonResponse({'error': True, 'message': 'Нет снимка структуры за месяц сравнения'}, status=404)
+        payload = {'compare': compare, **tree_history.diff(previous, payload)}
+
+    payload.update(year=year, month=month)
+    response = JsonResponse(payload, json_dumps_params={'separators': (',', ':')})
+    return compression.compress_response(request, response)
+
+
+REFERRAL_NODE_FIELDS = (
+    'user_id', 'username', 'first_name', 'last_name', 'middle_name', 'is_active',
+    'user_type', 'partner_level', 'referral_path', 'referral_depth', 'referral_downline_count',
+)
+
+REFERRAL_CHILDREN_SORTS = {
+    'downline': ('-referral_downline_count',),
+    'joined':   ('-date_joined',),
+    'name':     ('first_name', 'last_name'),
+}
 
 
 @login_required
-def generate_monthly_report(request):
-    if request.method != 'POST':
-        return JsonResponse({'error': 'Метод не поддерживается'}, status=405)
+def referral_children_api(request):
+    """
+    Прямые рефералы узла структуры постранично — для раскрытия графа по клику.
+    Без ?node= — корень (текущий пользователь); у каждого узла есть
+    descendants — размер его структуры, чтобы показать, есть ли что раскрывать.
+    """
+    user = request.user
+    node_id = request.GET.get('node') or user.user_id
 
-    from django.db.models import Sum, Count
-    from concurrent.futures import ThreadPoolExecutor, as_completed
+    if node_id == user.user_id:
+        node = user
+    else:
+        node = get_object_or_404(CustomUser, user_id=node_id)
+        if not node.is_referral_descendant_of(user):
+            return JsonResponse({'error': True, 'message': 'Доступ запрещен'}, status=403)
 
-    today = date.today()
-    year  = today.year
-    month = today.month
-
-    # Максимальный ранг extra_bonus за всю историю исключая текущий месяц
-    best_extra_bonus_map = {}
-    for user_id, extra_bonus in MonthlyReport.objects.exclude(
-        extra_bonus=''
-    ).exclude(
-        extra_bonus='-'
-    ).exclude(
-        year=year, month=month
-    ).values_list('user__user_id', 'extra_bonus'):  # ← user__user_id
-        rank = EXTRA_BONUS_RANK.get(extra_bonus, 0)
-        if rank > best_extra_bonus_map.get(user_id, 0):
-            best_extra_bonus_map[user_id] = rank
-
-    all_users = []
-    visited   = set()
-
-    def traverse(user):
-        if user.pk in visited:
-            return
-        visited.add(user.pk)
-        all_users.append(user)
-        for referral in CustomUser.objects.filter(referrer=user):
-            traverse(referral)
-
-    traverse(request.user)
-
-    def fetch_status(user):
-        try:
-            resp = requests.get(
-                f"{FASTAPI_SERVICE_URL}/user/users/{user.username}/status",
-                timeout=5
-            )
-            if resp.status_code == 200:
-                data = resp.json()
-                if not data.get('error'):
-                    return user.pk, data.get('data', {})
-        except Exception as e:
-            logger.warning(f"Не удалось получить статус для {user.username}: {e}")
-        return user.pk, {}
-
-    status_map = {}
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        futures = {executor.submit(fetch_status, u): u for u in all_users}
-        for future in as_completed(futures):
-            pk, status = future.result()
-            status_map[pk] = status
-
-    saved  = 0
-    errors = 0
-
-    for user in all_users:
-        st = status_map.get(user.pk, {})
-
-        current_extra = st.get('extra_bonus', '') or ''
-        current_rank  = EXTRA_BONUS_RANK.get(current_extra, 0)
-        best_rank     = best_extra_bonus_map.get(user.user_id, 0)  # ← user.user_id
-        extra_bonus_value = current_extra if current_rank > best_rank else ''
-
-        purchases_agg = Purchase.objects.filter(
-            user=user, date__year=year, date__month=month
-        ).aggregate(
-            count=Count('id'),
-            amount=Sum('amount'),
-        )
+    sort = request.GET.get('sort', 'downline')
+    if sort not in REFERRAL_CHILDREN_SORTS:
+        return JsonResponse({'error': True, 'message': 'Неизвестная сортировка'}, status=400)
 
-        new_referrals = CustomUser.objects.filter(
-            referrer=user,
-            date_joined__year=year,
-            date_joined__month=month,
-        ).count()
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+        page_size = int(request.GET.get('page_size', settings.REFERRAL_CHILDREN_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({'error': True, 'message': 'Некорректная страница'}, status=400)
+    page_size = min(max(page_size, 1), settings.REFERRAL_CHILDREN_MAX_PAGE_SIZE)
+
+    children_qs = CustomUser.objects.filter(referrer=node)
+    total = children_qs.count()
+    offset = (page - 1) * page_size
+    children = list(
+        children_qs.only(*REFERRAL_NODE_FIELDS)
+        .order_by(*REFERRAL_CHILDREN_SORTS[sort], 'pk')[offset:offset + page_size]
+    )
 
-        try:
-            MonthlyReport.objects.update_or_create(
-                user=user,
-                year=year,
-                month=month,
-                defaults={
-                    'personal_volume':        st.get('lo', 0) or 0,
-                    'group_volume':           st.get('go', 0) or 0,
-                    'side_volume':            st.get('side_volume', 0) or 0,
-                    'points':                 st.get('points', 0) or 0,
-                    'veron':                  st.get('veron', 0) or 0,
-                    'personal_bonus':         st.get('personal_bonus', 0) or 0,
-                    'structure_bonus':        st.get('structure_bonus', 0) or 0,
-                    'mentor_bonus':           st.get('mentor_bonus', 0) or 0,
-                    'extra_bonus':            extra_bonus_value,
-                    'bonus_total':            sum(float(st.get(k, 0) or 0) for k in ('personal_bonus', 'structure_bonus', 'mentor_bonus')),
-                    'personal_money':         st.get('personal_money', 0) or 0,
-                    'group_money':            st.get('group_money', 0) or 0,
-                    'leader_money':           st.get('leader_money', 0) or 0,
-                    'side_vol_money':         st.get('side_vol_money', 0) or 0,
-                    'total_money':            st.get('total_money', 0) or 0,
-                    'total_income':           st.get('total_income', 0) or 0,
-                    'partner_level':          st.get('qualification', '') or '',
-                    'new_referrals':          new_referrals,
-                    'active_referrals_count': user.active_referrals,
-                    'purchases_count':        purchases_agg['count'] or 0,
-                    'purchases_amount':       purchases_agg['amount'] or 0,
-                }
-            )
-            saved += 1
-        except Exception as e:
-            logger.error(f"Ошибка сохранения отчёта для {user.username}: {e}")
-            errors += 1
+    statuses = status_cache.get_statuses([child.user_id for child in children]) if children else {}
+
+    def serialize(member, status=None):
+        status = status or {}
+        return {
+            'id':              member.user_id,
+            'label':           get_short_name(member),
+            'title':           get_full_name(member),
+            'level':           member.referral_depth - user.referral_depth,
+            'active':          member.is_active,
+            'user_type':       member.user_type,
+            'descendants':     member.referral_downline_count,
+            'personal_volume': float(status.get('lo', 0) or 0),
+            'group_volume':    float(status.get('go', 0) or 0),
+            'qualification':   status.get('qualification', ''),
+            'partner_level':   status.get('qualification', member.partner_level),
+        }
 
-    logger.info(f"MonthlyReport: сохранено {saved}, ошибок {errors} ({month}/{year})")
+    return JsonResponse({
+        'node':      serialize(node),
+        'children':  [serialize(child, statuses.get(child.user_id)) for child in children],
+        'page':      page,
+        'page_size': page_size,
+        'total':     total,
+        'has_next':  offset + len(children) < total,
+        'sort':      sort,
+        'lazy':      node.referral_downline_count > settings.REFERRAL_TREE_LAZY_THRESHOLD,
+    })
 
-    def reset_user_data(user):
-        try:
-            resp = requests.post(
-                f"{FASTAPI_SERVICE_URL}/user/users/{user.username}/reset",
-                timeout=5
-            )
-            if resp.status_code == 200:
-                payload = resp.json()
-                if not payload.get('error'):
-                    return user.pk, True
-        except Exception as e:
-            logger.warning(f"Не удалось сбросить данные для {user.username}: {e}")
-        return user.pk, False
-
-    reset_ok     = 0
-    reset_errors = 0
-
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        reset_futures = {executor.submit(reset_user_data, u): u for u in all_users}
-        for future in as_completed(reset_futures):
-            _pk, success = future.result()
-            if success:
-                reset_ok += 1
-            else:
-                reset_errors += 1
 
-    logger.info(f"FastAPI reset: успешно {reset_ok}, ошибок {reset_errors} ({month}/{year})")
+@login_required
+def generate_monthly_report(request):
+    """
+    Запускает фоновое сохранение отчёта за текущий месяц и сразу
+    возвращает id задачи; прогресс — в monthly_report_progress
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Метод не поддерживается'}, status=405)
+
+    job, _dispatched = monthly_report.start_job(request.user)
 
     return JsonResponse({
         'success':      True,
-        'saved':        saved,
-        'errors':       errors,
-        'month':        month,
-        'year':         year,
-        'reset_ok':     reset_ok,
-        'reset_errors': reset_errors,
-    })
+        'job_id':       job.pk,
+        'status':       job.status,
+        'month':        job.month,
+        'year':         job.year,
+        'progress_url': reverse('cabinet:monthly_report_progress', args=[job.pk]),
+    }, status=202)
 
 
+@login_required
+def monthly_report_progress(request, job_id):
+    """Прогресс задачи месячного отчёта для опроса со страницы структуры"""
+    job = get_object_or_404(MonthlyReportJob, pk=job_id, owner=request.user)
+    return JsonResponse(monthly_report.job_progress(job))
+
+
+@login_required
 def get_referral_details(request, user_id):
     """Получение детальной информации о реферале"""
     try:
         # Проверяем, что пользователь существует
         db_user = CustomUser.objects.get(user_id=user_id)
+
+        # Проверяем, что это участник структуры текущего пользователя
+        if db_user != request.user and not db_user.is_referral_descendant_of(request.user):
+            return JsonResponse({'error': True, 'message': 'Доступ запрещен'}, status=403)
         
-        # # Проверяем, что это реферал текущего пользователя
-        # if db_user.referrer != request.user:
-        #     return JsonResponse({'error': True, 'message': 'Доступ запрещен'}, status=403)
-        
-        # Получаем данные из API
-        try:
-            response = requests.get(
-                f"{FASTAPI_SERVICE_URL}/user/users/{user_id}/status",
-                timeout=5
-            )
-            if response.status_code == 200:
-                api_data = response.json()
-                lo_amount = api_data.get('lo', 0)
-            else:
-                lo_amount = 0
-        except:
-            lo_amount = 0
+        # Данные из FastAPI — через кеш статусов
+        lo_amount = status_cache.get_statuses([user_id])[user_id].get('lo', 0) or 0
         
         data = {
             'id': db_user.user_id,
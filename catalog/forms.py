@@ -1,6 +1,6 @@
 from django import forms
-from django.db.models import Min, Max
-from .models import Attribute, AttributeValue, Category
+from .models import Category
+from .services import facets
 
 
 class ProductFilterForm(forms.Form):
@@ -61,6 +61,10 @@ class ProductFilterForm(forms.Form):
         widget=forms.Select(attrs={'class': 'form-control'})
     )
 
+    def selected_attributes(self):
+        """{id атрибута: [id значений]} — на главной атрибутов нет"""
+        return {}
+
 
 class CategoryFilterForm(ProductFilterForm):
     """Форма фильтрации для страницы категории (с атрибутами)"""
@@ -73,36 +77,43 @@ class CategoryFilterForm(ProductFilterForm):
         self.fields.pop('category', None)
 
         # Динамически добавляем поля для атрибутов
+        self.attribute_facets = {}
         if self.category:
             self.add_attribute_fields()
 
     def add_attribute_fields(self):
-        """Добавление полей для атрибутов категории"""
-        from .models import Product
-
-        # Получаем товары этой категории и подкатегорий
-        descendants = self.category.get_descendants(include_self=True)
-        products = Product.objects.filter(category__in=descendants, is_active=True)
-
-        # Атрибуты с множественным выбором
-        multi_attrs = Attribute.objects.filter(
-            filter_type='multi',
-            values__products__in=products
-        ).distinct()
-
-        for attr in multi_attrs:
-            values = AttributeValue.objects.filter(
-                attribute=attr,
-                products__in=products
-            ).distinct().order_by('order', 'value')
-
-            if values.exists():
-                self.fields[f'attr_{attr.code}'] = forms.MultipleChoiceField(
-                    choices=[(v.id, v.value) for v in values],
-                    required=False,
-                    widget=forms.CheckboxSelectMultiple(attrs={
-                        'class': 'form-check-input attribute-filter',
-                        'data-attribute': attr.code
-                    }),
-                    label=attr.name
-                )
\ No newline at end of file
+        """Поля атрибутов категории из фасетов (один запрос, кеш по версии категории)"""
+        for facet in facets.for_category(self.category):
+            name = f'attr_{facet["code"]}'
+            self.attribute_facets[name] = facet
+            self.fields[name] = forms.MultipleChoiceField(
+                choices=self.facet_choices(facet['values']),
+                required=False,
+                widget=forms.CheckboxSelectMultiple(attrs={
+                    'class': 'form-check-input attribute-filter',
+                    'data-attribute': facet['code']
+                }),
+                label=facet['name']
+            )
+
+    @staticmethod
+    def facet_choices(values, counts=None):
+        """Варианты значений с числом товаров в подписи"""
+        return [
+            (v['id'], f"{v['value']} ({v['count'] if counts is None else counts.get(v['id'], 0)})")
+            for v in values
+        ]
+
+    def selected_attributes(self):
+        """{id атрибута: [id значений]} отмеченных в валидной форме"""
+        return {
+            facet['id']: [int(value_id) for value_id in self.cleaned_data[name]]
+            for name, facet in self.attribute_facets.items()
+            if self.cleaned_data.get(name)
+        }
+
+    def apply_facets(self, facet_list):
+        """Обновляет числа в подписях по фасетам с учётом активных фильтров"""
+        counts = {v['id']: v['count'] for facet in facet_list for v in facet['values']}
+        for name, facet in self.attribute_facets.items():
+            self.fields[name].choices = self.facet_choices(facet['values'], counts)
@@ -3,6 +3,8 @@ from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 from django.utils.text import slugify
 from django.core.exceptions import ValidationError
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
 from mptt.models import MPTTModel, TreeForeignKey  # Импортируем MPTT
 
 
@@ -396,3 +398,77 @@ class Product(models.Model):
         if self.has_discount:
             return int((1 - self.price / self.old_price) * 100)
         return 0
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_membership(sender, instance, **kwargs):
+    """Прежние категория и активность товара: при переносе меняются оба поддерева"""
+    instance._previous_membership = Product.objects.filter(pk=instance.pk).values_list(
+        'category_id', 'is_active'
+    ).first() if instance.pk else None
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    from catalog.services import product_index, versions
+
+    previous = getattr(instance, '_previous_membership', None)
+    scopes = [versions.product(instance.pk)]
+    if previous != (instance.category_id, instance.is_active):
+        scopes += [versions.members(pk) for pk in {instance.category_id, previous and previous[0]} if pk]
+
+    version = versions.bump_categories({instance.category_id, previous and previous[0]}, *scopes)
+    product_index.index.product_saved(instance, version)
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    from catalog.services import product_index, versions
+
+    version = versions.bump_categories(
+        {instance.category_id}, versions.product(instance.pk), versions.members(instance.category_id),
+    )
+    product_index.index.product_deleted(instance.pk, version)
+
+
+@receiver(m2m_changed, sender=Product.attributes.through)
+def product_attributes_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    from catalog.services import product_index, versions
+
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse and action == 'post_clear':
+        # Со стороны значения атрибута: затронутые товары после clear неизвестны
+        versions.bump(versions.SCHEMA)
+        product_index.index.invalidate()
+        return
+
+    if reverse:
+        product_ids, value_ids = pk_set, {instance.pk}
+        category_ids = set(Product.objects.filter(pk__in=pk_set).values_list('category_id', flat=True))
+    else:
+        product_ids, value_ids = {instance.pk}, pk_set or set()
+        category_ids = {instance.category_id}
+
+    version = versions.bump_categories(category_ids, *(versions.product(pk) for pk in product_ids))
+    product_index.index.values_changed(
+        version,
+        product_ids,
+        added=value_ids if action == 'post_add' else (),
+        removed=value_ids if action == 'post_remove' else (),
+        clear=action == 'post_clear',
+    )
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Attribute)
+@receiver(post_delete, sender=Attribute)
+@receiver(post_save, sender=AttributeValue)
+@receiver(post_delete, sender=AttributeValue)
+def catalog_schema_changed(sender, instance, **kwargs):
+    """Категории и атрибуты меняют поддеревья и подписи фасетов везде"""
+    from catalog.services import product_index, versions
+
+    versions.bump(versions.SCHEMA)
+    product_index.index.invalidate()
@@ -0,0 +1,129 @@
+"""
+Фасеты фильтра категории: значения атрибутов с числом товаров.
+
+Все тройки (атрибут, значение, число товаров) поддерева категории
+считаются одним GROUP BY по связям товар—значение. Подсчёт дизъюнктивный:
+число у значения атрибута A учитывает цену, наличие и отмеченные значения
+всех остальных атрибутов, но не отметки самого A — так видно, сколько
+товаров добавит ещё одна галочка в той же группе.
+
+Фасеты без фильтров кешируются по версии поддерева категории
+(см. versions): изменение товара поднимает её и ключ меняется.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Exists, OuterRef, Q
+
+from catalog.models import Product
+
+from . import versions
+
+Through = Product.attributes.through
+
+
+def product_filters(category, min_price=None, max_price=None, in_stock=False, prefix=''):
+    """
+    Условия на активные товары поддерева category. Поддерево — по границам
+    MPTT, без подзапроса на потомков.
+    """
+    filters = {
+        'is_active': True,
+        'category__tree_id': category.tree_id,
+        'category__lft__gte': category.lft,
+        'category__rght__lte': category.rght,
+    }
+    if min_price:
+        filters['price__gte'] = min_price
+    if max_price:
+        filters['price__lte'] = max_price
+    if in_stock:
+        filters['in_stock'] = True
+    return {f'{prefix}{name}': value for name, value in filters.items()}
+
+
+def _has_any(value_ids):
+    return Exists(Through.objects.filter(
+        product_id=OuterRef('product_id'),
+        attributevalue_id__in=value_ids,
+    ))
+
+
+def _count(conditions):
+    if not conditions:
+        return Count('product_id')
+    condition = Q()
+    for item in conditions:
+        condition &= Q(item)
+    return Count('product_id', filter=condition)
+
+
+def compute(category, min_price=None, max_price=None, in_stock=False, selected=None):
+    """
+    Фасеты атрибутов с множественным выбором:
+    [{'id', 'code', 'name', 'values': [{'id', 'value', 'count'}]}].
+    selected — {attribute_id: [id значений]} отмеченных в фильтре.
+    """
+    selected = {attr_id: ids for attr_id, ids in (selected or {}).items() if ids}
+    conditions = {attr_id: _has_any(ids) for attr_id, ids in selected.items()}
+
+    counts = {'count': _count(list(conditions.values()))}
+    for attr_id in selected:
+        counts[f'count_{attr_id}'] = _count([c for a, c in conditions.items() if a != attr_id])
+
+    rows = (
+        Through.objects
+        .filter(
+            attributevalue__attribute__filter_type='multi',
+            **product_filters(category, min_price, max_price, in_stock, prefix='product__'),
+        )
+        .values(
+            'attributevalue_id',
+            'attributevalue__value',
+            'attributevalue__attribute_id',
+            'attributevalue__attribute__code',
+            'attributevalue__attribute__name',
+        )
+        .annotate(**counts)
+        .order_by(
+            'attributevalue__attribute__order',
+            'attributevalue__attribute__name',
+            'attributevalue__order',
+            'attributevalue__value',
+        )
+    )
+
+    facets = {}
+    for row in rows:
+        attr_id = row['attributevalue__attribute_id']
+        facet = facets.get(attr_id)
+        if facet is None:
+            facet = facets[attr_id] = {
+                'id':     attr_id,
+                'code':   row['attributevalue__attribute__code'],
+                'name':   row['attributevalue__attribute__name'],
+                'values': [],
+            }
+        facet['values'].append({
+            'id':    row['attributevalue_id'],
+            'value': row['attributevalue__value'],
+            'count': row[f'count_{attr_id}'] if attr_id in selected else row['count'],
+        })
+    return list(facets.values())
+
+
+def facets_key(category):
+    schema, version = versions.get(versions.SCHEMA, versions.category(category.pk))
+    return f'catalog:facets:{category.pk}:{schema}:{version}'
+
+
+def for_category(category, min_price=None, max_price=None, in_stock=False, selected=None):
+    """Фасеты категории; без активных фильтров — из кеша"""
+    if min_price or max_price or in_stock or any((selected or {}).values()):
+        return compute(category, min_price, max_price, in_stock, selected)
+
+    key = facets_key(category)
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute(category)
+        cache.set(key, facets, timeout=settings.CATALOG_FACETS_TTL)
+    return facets
@@ -0,0 +1,114 @@
+"""
+Кеш готовых страниц каталога для анонимных посетителей.
+
+Страница помечается тегами — версиями того, что на ней показано (см.
+versions): товар, его похожие товары и состав категории на странице
+товара, поддерево категории на странице категории. В записи хранятся
+HTML и версии тегов на момент рендера. Запись отдаётся, только пока все
+версии совпадают с текущими. Сохранение одного товара поднимает лишь его
+теги, так что сбрасываются только страницы, где он был (или мог появиться).
+
+Для тех же страниц отдаются ETag (хеш адреса и версий тегов) и
+Last-Modified (самый поздний updated_at показанного), браузер получает
+304 без тела. Авторизованные пользователи, POST и страницы с
+непоказанными сообщениями идут мимо кеша.
+"""
+import hashlib
+import json
+import logging
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from . import versions
+
+logger = logging.getLogger(__name__)
+
+
+def page_key(path):
+    return f"catalog:page:{hashlib.blake2b(path.encode(), digest_size=16).hexdigest()}"
+
+
+def tag(request, scopes, updated=()):
+    """
+    Отмечает страницу для кеша: scopes — версии показанного,
+    updated — updated_at показанных объектов
+    """
+    timestamps = [int(value.timestamp()) for value in updated if value]
+    request._page_cache = (sorted(set(scopes)), max(timestamps) if timestamps else None)
+
+
+def _cacheable_request(request):
+    return (
+        request.method in ('GET', 'HEAD')
+        and not request.user.is_authenticated
+        and not len(messages.get_messages(request))
+    )
+
+
+def _etag(path, tags):
+    raw = json.dumps([path, tags], separators=(',', ':'))
+    return f'"{hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()}"'
+
+
+def _finish(request, response, etag, last_modified):
+    response.headers['ETag'] = etag
+    if last_modified:
+        response.headers['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, max_age=0, must_revalidate=True)
+    patch_vary_headers(response, ['Cookie'])
+    return get_conditional_response(request, etag=etag, last_modified=last_modified, response=response)
+
+
+def cache_anonymous_page(view):
+    """Декоратор view каталога: кеш страницы, ETag и Last-Modified для анонимов"""
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not _cacheable_request(request):
+            return view(request, *args, **kwargs)
+
+        path = request.get_full_path()
+        key = page_key(path)
+        try:
+            entry = cache.get(key)
+            if entry and list(versions.get(*entry['tags'])) == entry['versions']:
+                response = HttpResponse(entry['content'], content_type=entry['content_type'])
+                tags = dict(zip(entry['tags'], entry['versions']))
+                return _finish(request, response, _etag(path, tags), entry['last_modified'])
+            catalog_version, = versions.get(versions.CATALOG)
+        except Exception as e:
+            logger.warning(f"Кеш страниц каталога недоступен: {e}")
+            return view(request, *args, **kwargs)
+
+        response = view(request, *args, **kwargs)
+        marked = getattr(request, '_page_cache', None)
+        if response.status_code != 200 or marked is None or response.streaming or response.cookies:
+            return response
+
+        scopes, last_modified = marked
+        try:
+            current = versions.get(versions.CATALOG, *scopes)
+            if current[0] != catalog_version:
+                # Каталог менялся во время рендера — страница может быть устаревшей
+                return response
+            entry = {
+                'tags':          scopes,
+                'versions':      list(current[1:]),
+                'content':       response.content,
+                'content_type':  response['Content-Type'],
+                'last_modified': last_modified,
+            }
+            cache.set(key, entry, timeout=settings.CATALOG_PAGE_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"Страница каталога {path} не сохранена в кеш: {e}")
+            return response
+
+        return _finish(request, response, _etag(path, dict(zip(scopes, entry['versions']))), last_modified)
+
+    return wrapper
@@ -0,0 +1,40 @@
+"""
+Постраничная выдача каталога: размер страницы и курсоры.
+
+Курсор — непрозрачная строка с сортировкой и ключом последнего товара
+страницы (значение ключа сортировки, pk). Следующая страница начинается
+строго после этого ключа, поэтому ни глубина, ни вставки и удаления
+товаров между запросами не сдвигают выдачу и не требуют OFFSET и COUNT.
+"""
+import base64
+import binascii
+import json
+
+from django.conf import settings
+
+
+def page_size(value, default=None):
+    """Размер страницы из запроса в пределах 1..CATALOG_MAX_PAGE_SIZE"""
+    default = default or settings.ITEMS_PER_PAGE
+    try:
+        size = int(value) if value not in (None, '') else default
+    except (TypeError, ValueError):
+        size = default
+    return min(max(size, 1), settings.CATALOG_MAX_PAGE_SIZE)
+
+
+def encode_cursor(sort_by, key, pk):
+    raw = json.dumps([sort_by, key, pk], ensure_ascii=False, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token, sort_by):
+    """(ключ, pk) из курсора; ValueError — курсор испорчен или от другой сортировки"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        cursor_sort, key, pk = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError) as e:
+        raise ValueError(f'Некорректный курсор: {e}') from e
+    if cursor_sort != sort_by or not isinstance(pk, int) or not isinstance(key, (int, float, str)):
+        raise ValueError('Курсор от другой сортировки')
+    return key, pk
@@ -0,0 +1,381 @@
+"""
+Битовый индекс активных товаров в памяти процесса.
+
+Каждому активному товару выдаётся позиция (номер бита), множества товаров
+хранятся целыми Python как битовые строки:
+
+    values[id значения атрибута] — товары с этим значением
+    subtree[id категории]        — товары категории и её подкатегорий
+    in_stock                     — товары в наличии
+
+Фильтр каталога — пересечения (&) и объединения (|) множеств, цена —
+отрезок отсортированного массива цен в сотых. Порядок выдачи — заранее
+отсортированные массивы позиций, равные ключи упорядочены по id. База
+нужна только для загрузки товаров итоговой страницы (hydrate).
+
+Индекс обновляется по сигналам Product (save, delete, m2m attributes)
+в процессе, где была запись. Остальные процессы видят чужую запись по
+версии каталога (versions.CATALOG) и пересобирают индекс при следующем
+запросе. Изменения в обход сигналов (update(), bulk_create) становятся
+видны после versions.bump().
+"""
+import logging
+import threading
+from decimal import Decimal
+
+import numpy as np
+
+from catalog.models import Category, Product
+
+from . import versions
+
+logger = logging.getLogger(__name__)
+
+Through = Product.attributes.through
+
+# sort_by формы фильтров → (столбец ключа, по убыванию); равные ключи — по pk
+# в ту же сторону, '' — порядок модели (сначала новые)
+SORTS = {
+    '':           ('created', True),
+    'newest':     ('created', True),
+    'price_asc':  ('cents', False),
+    'price_desc': ('cents', True),
+    'name_asc':   ('names', False),
+    'name_desc':  ('names', True),
+}
+
+
+def to_cents(price):
+    return int(Decimal(str(price)) * 100)
+
+
+def from_cents(cents):
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def bits_from_mask(mask):
+    return int.from_bytes(np.packbits(mask, bitorder='little').tobytes(), 'little')
+
+
+def mask_from_bits(bits, size):
+    raw = np.frombuffer(bits.to_bytes((size + 7) // 8, 'little'), dtype=np.uint8)
+    return np.unpackbits(raw, bitorder='little')[:size].astype(bool)
+
+
+def bits_from_positions(positions, size):
+    mask = np.zeros(size, dtype=bool)
+    mask[positions] = True
+    return bits_from_mask(mask)
+
+
+class ProductIndex:
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.version = None
+        self.stale = True
+        self._clear()
+
+    def _clear(self):
+        self.slots = {}         # pk → позиция
+        self.free = []          # освободившиеся позиции
+        self.pks = []           # по позициям; у свободных 0
+        self.cents = []
+        self.names = []
+        self.created = []
+        self.category_of = []
+        self.values_of = []
+        self.active = 0
+        self.in_stock = 0
+        self.values = {}
+        self.subtree = {}
+        self.ancestors = {}     # id категории → (она сама, ..., корень)
+        self._arrays = None
+
+    def __len__(self):
+        return len(self.slots)
+
+    def _chain(self, category_id):
+        return self.ancestors.get(category_id, (category_id,))
+
+    def invalidate(self):
+        """Пересобрать при следующем запросе (изменились категории или атрибуты)"""
+        with self.lock:
+            self.stale = True
+
+    def rebuild(self, version=None):
+        with self.lock:
+            self._clear()
+
+            parents = dict(Category.objects.values_list('pk', 'parent_id'))
+            for pk in parents:
+                chain = []
+                node = pk
+                while node is not None:
+                    chain.append(node)
+                    node = parents.get(node)
+                self.ancestors[pk] = tuple(chain)
+
+            product_values = {}
+            for product_id, value_id in Through.objects.filter(product__is_active=True).values_list(
+                'product_id', 'attributevalue_id',
+            ):
+                product_values.setdefault(product_id, []).append(value_id)
+
+            rows = Product.objects.filter(is_active=True).values_list(
+                'pk', 'category_id', 'price', 'in_stock', 'name', 'created_at',
+            )
+            in_stock, values, subtree = [], {}, {}
+            for pos, (pk, category_id, price, stock, name, created_at) in enumerate(rows.iterator()):
+                value_ids = frozenset(product_values.get(pk, ()))
+                self.slots[pk] = pos
+                self.pks.append(pk)
+                self.cents.append(to_cents(price))
+                self.names.append(name)
+                self.created.append(created_at.timestamp())
+                self.category_of.append(category_id)
+                self.values_of.append(value_ids)
+                if stock:
+                    in_stock.append(pos)
+                for value_id in value_ids:
+                    values.setdefault(value_id, []).append(pos)
+                for ancestor in self._chain(category_id):
+                    subtree.setdefault(ancestor, []).append(pos)
+
+            # Большие множества собираются маской numpy, а не побитно
+            size = len(self.pks)
+            self.active = (1 << size) - 1
+            self.in_stock = bits_from_positions(in_stock, size)
+            self.values = {key: bits_from_positions(p, size) for key, p in values.items()}
+            self.subtree = {key: bits_from_positions(p, size) for key, p in subtree.items()}
+            self.version = version
+            self.stale = False
+            logger.info(f"Индекс товаров пересобран: {size} товаров, версия {version}")
+
+    # Изменения одного товара
+
+    def _unset(self, pos):
+        clear = ~(1 << pos)
+        self.active &= clear
+        self.in_stock &= clear
+        for value_id in self.values_of[pos]:
+            self.values[value_id] &= clear
+        for ancestor in self._chain(self.category_of[pos]):
+            self.subtree[ancestor] &= clear
+
+    def _set(self, pos):
+        bit = 1 << pos
+        self.active |= bit
+        for value_id in self.values_of[pos]:
+            self.values[value_id] = self.values.get(value_id, 0) | bit
+        for ancestor in self._chain(self.category_of[pos]):
+            self.subtree[ancestor] = self.subtree.get(ancestor, 0) | bit
+
+    def _put(self, pk, category_id, price, in_stock, name, created_at, value_ids):
+        pos = self.slots.get(pk)
+        if pos is not None:
+            self._unset(pos)
+        else:
+            if self.free:
+                pos = self.free.pop()
+            else:
+                pos = len(self.pks)
+                for column in (self.pks, self.cents, self.names, self.created, self.category_of, self.values_of):
+                    column.append(None)
+            self.slots[pk] = pos
+
+        self.pks[pos] = pk
+        self.cents[pos] = to_cents(price)
+        self.names[pos] = name
+        self.created[pos] = created_at.timestamp()
+        self.category_of[pos] = category_id
+        self.values_of[pos] = frozenset(value_ids)
+        self._set(pos)
+        if in_stock:
+            self.in_stock |= 1 << pos
+
+    def _remove(self, pk):
+        pos = self.slots.pop(pk, None)
+        if pos is None:
+            return
+        self._unset(pos)
+        self.pks[pos] = 0
+        self.cents[pos] = 0
+        self.names[pos] = ''
+        self.created[pos] = 0
+        self.values_of[pos] = frozenset()
+        self.free.append(pos)
+
+    def _apply(self, version, change):
+        """
+        Применяет запись этого процесса, если она единственная с прошлой
+        версии; иначе была чужая запись — индекс пересоберётся
+        """
+        with self.lock:
+            if self.stale or version is None or self.version is None or version != self.version + 1:
+                self.stale = True
+                return False
+            change()
+            self.version = version
+            self._arrays = None
+            return True
+
+    def product_saved(self, product, version):
+        def change():
+            if not product.is_active:
+                self._remove(product.pk)
+                return
+            pos = self.slots.get(product.pk)
+            if pos is not None:
+                value_ids = self.values_of[pos]
+            else:
+                value_ids = Through.objects.filter(product_id=product.pk).values_list('attributevalue_id', flat=True)
+            self._put(
+                product.pk, product.category_id, product.price, product.in_stock,
+                product.name, product.created_at, value_ids,
+            )
+        return self._apply(version, change)
+
+    def product_deleted(self, pk, version):
+        return self._apply(version, lambda: self._remove(pk))
+
+    def values_changed(self, version, product_ids, added=(), removed=(), clear=False):
+        def change():
+            for pk in product_ids:
+                pos = self.slots.get(pk)
+                if pos is None:
+                    continue
+                bit = 1 << pos
+                current = self.values_of[pos]
+                value_ids = frozenset() if clear else (current | set(added)) - set(removed)
+                for value_id in current - value_ids:
+                    self.values[value_id] &= ~bit
+                for value_id in value_ids - current:
+                    self.values[value_id] = self.values.get(value_id, 0) | bit
+                self.values_of[pos] = value_ids
+        return self._apply(version, change)
+
+    # Запросы
+
+    def _ensure_arrays(self):
+        if self._arrays is None:
+            pks = np.array(self.pks, dtype=np.int64)
+            columns = {
+                'cents':   np.array(self.cents, dtype=np.int64),
+                'names':   np.array(self.names, dtype=str),
+                'created': np.array(self.created, dtype=np.float64),
+            }
+            ascending = {column: np.lexsort((pks, values)) for column, values in columns.items()}
+            self._arrays = {
+                'pks':          pks,
+                **columns,
+                'sorted_cents': columns['cents'][ascending['cents']],
+                'orders': {
+                    sort_by: ascending[column][::-1] if descending else ascending[column]
+                    for sort_by, (column, descending) in SORTS.items()
+                },
+            }
+        return self._arrays
+
+    def _price_bits(self, min_price, max_price):
+        arrays = self._ensure_arrays()
+        by_price = arrays['orders']['price_asc']
+        sorted_cents = arrays['sorted_cents']
+        lo = np.searchsorted(sorted_cents, to_cents(min_price), 'left') if min_price else 0
+        hi = np.searchsorted(sorted_cents, to_cents(max_price), 'right') if max_price else len(by_price)
+        return bits_from_positions(by_price[lo:hi], len(self.pks))
+
+    def match(self, category_id=None, min_price=None, max_price=None, in_stock=False, selected=None):
+        """
+        Множество товаров по фильтрам каталога. selected — {id атрибута:
+        [id значений]}: внутри атрибута — любое значение, между атрибутами — все.
+        """
+        with self.lock:
+            bits = self.active
+            if category_id is not None:
+                bits &= self.subtree.get(category_id, 0)
+            if in_stock:
+                bits &= self.in_stock
+            for value_ids in (selected or {}).values():
+                if value_ids:
+                    group = 0
+                    for value_id in value_ids:
+                        group |= self.values.get(int(value_id), 0)
+                    bits &= group
+            if bits and (min_price or max_price):
+                bits &= self._price_bits(min_price, max_price)
+            return bits
+
+    def _price_range(self, mask):
+        if not mask.any():
+            return {'min_price': None, 'max_price': None}
+        cents = self._ensure_arrays()['cents'][mask]
+        return {'min_price': from_cents(cents.min()), 'max_price': from_cents(cents.max())}
+
+    def _ordered(self, mask, sort_by):
+        """Позиции множества в порядке sort_by"""
+        order = self._ensure_arrays()['orders'][sort_by if sort_by in SORTS else '']
+        return order[mask[order]]
+
+    def select(self, bits, sort_by=''):
+        """(pk в порядке sort_by, {'min_price', 'max_price'}) для множества bits"""
+        with self.lock:
+            arrays = self._ensure_arrays()
+            mask = mask_from_bits(bits, len(self.pks))
+            return arrays['pks'][self._ordered(mask, sort_by)].tolist(), self._price_range(mask)
+
+    def seek(self, bits, sort_by='', after=None, limit=20, with_totals=False):
+        """
+        Страница по ключу: до limit pk множества bits в порядке sort_by строго
+        после after = (значение ключа сортировки, pk). Возвращает словарь
+        ids и next — ключ последнего товара, если дальше ещё есть товары;
+        with_totals добавляет count и price_range того же множества.
+        """
+        sort_by = sort_by if sort_by in SORTS else ''
+        column, descending = SORTS[sort_by]
+        with self.lock:
+            arrays = self._ensure_arrays()
+            mask = mask_from_bits(bits, len(self.pks))
+            positions = self._ordered(mask, sort_by)
+
+            if after is not None:
+                key, pk = after
+                keys, pks = arrays[column][positions], arrays['pks'][positions]
+                if descending:
+                    later = (keys < key) | ((keys == key) & (pks < pk))
+                else:
+                    later = (keys > key) | ((keys == key) & (pks > pk))
+                positions = positions[later]
+
+            page = positions[:limit]
+            result = {
+                'ids':  arrays['pks'][page].tolist(),
+                'next': (arrays[column][page[-1]].item(), int(arrays['pks'][page[-1]]))
+                        if len(positions) > limit else None,
+            }
+            if with_totals:
+                result['count'] = bits.bit_count()
+                result['price_range'] = self._price_range(mask)
+            return result
+
+
+index = ProductIndex()
+
+
+def get_index():
+    """Индекс процесса, пересобранный, если каталог менялся в другом процессе"""
+    try:
+        version, = versions.get(versions.CATALOG)
+    except Exception as e:
+        logger.warning(f"Версия каталога недоступна, индекс товаров не проверен: {e}")
+        version = index.version
+    with index.lock:
+        if index.stale or version != index.version:
+            index.rebuild(version)
+    return index
+
+
+def hydrate(ids):
+    """Товары по списку pk в том же порядке (удалённые с тех пор пропускаются)"""
+    products = Product.objects.select_related('category').prefetch_related('attributes').in_bulk(ids)
+    return [products[pk] for pk in ids if pk in products]
@@ -0,0 +1,73 @@
+"""
+Кеш результатов фильтра каталога.
+
+Очищенные данные формы фильтров приводятся к каноническому виду: пустые
+значения отбрасываются, цены нормализуются (100 и 100.00 — одно и то же),
+категория заменяется на pk, отмеченные значения атрибутов сортируются.
+Страница и её размер в ключ не входят. Поэтому одни и те же фильтры в
+другом порядке параметров, на другой странице или с другим page_size
+попадают в одну запись.
+
+В записи — упорядоченный список pk подходящих товаров и диапазон цен.
+Любая страница — срез списка, загруженный из базы через in_bulk. Ключ
+включает версию каталога (versions.CATALOG): запись товара или категории
+поднимает её, и старые результаты больше не читаются.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import product_index, versions
+
+
+def canonical_filters(filters, category=None, selected=None):
+    """Фильтры в каноническом виде (сериализуемый словарь)"""
+    canonical = {}
+    category = category or filters.get('category')
+    if category:
+        canonical['category'] = category.pk
+    for name in ('min_price', 'max_price'):
+        if filters.get(name):
+            canonical[name] = format(filters[name].normalize(), 'f')
+    if filters.get('in_stock'):
+        canonical['in_stock'] = True
+    attributes = {
+        str(attr_id): sorted({int(value_id) for value_id in value_ids})
+        for attr_id, value_ids in (selected or {}).items()
+        if value_ids
+    }
+    if attributes:
+        canonical['attributes'] = attributes
+    if filters.get('sort_by'):
+        canonical['sort_by'] = filters['sort_by']
+    return canonical
+
+
+def results_key(canonical):
+    version, = versions.get(versions.CATALOG)
+    raw = json.dumps(canonical, sort_keys=True, separators=(',', ':'))
+    digest = hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+    return f'catalog:results:{version}:{digest}'
+
+
+def get_results(filters, category=None, selected=None):
+    """(pk товаров в порядке сортировки, {'min_price', 'max_price'})"""
+    canonical = canonical_filters(filters, category, selected)
+    key = results_key(canonical)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    products_index = product_index.get_index()
+    matched = products_index.match(
+        category_id=canonical.get('category'),
+        min_price=filters.get('min_price'),
+        max_price=filters.get('max_price'),
+        in_stock=canonical.get('in_stock', False),
+        selected=selected,
+    )
+    result = products_index.select(matched, canonical.get('sort_by', ''))
+    cache.set(key, result, timeout=settings.CATALOG_RESULTS_TTL)
+    return result
@@ -0,0 +1,87 @@
+"""
+Счётчики версий каталога для инвалидации кешей.
+
+Вместо удаления ключей кеши каталога включают версию в свой ключ: запись
+меняет версию, и старые записи просто перестают читаться (и вытесняются
+по TTL). Версии:
+
+    CATALOG        — любая запись товара, категории или атрибута
+    SCHEMA         — структура: категории, атрибуты и их значения
+    category(pk)   — товары поддерева категории pk
+    members(pk)    — состав товаров самой категории pk (добавлен, удалён,
+                     перенесён, скрыт), но не их поля
+    product(pk)    — сам товар и его атрибуты
+
+Изменение товара поднимает версии его категории и всех её предков: их
+поддеревья содержат товар. Счётчики начинаются с текущего времени, чтобы
+после потери кеша номера не повторились.
+"""
+import logging
+import time
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+CATALOG = 'catalog'
+SCHEMA = 'schema'
+
+
+def category(pk):
+    return f'category:{pk}'
+
+
+def members(pk):
+    return f'members:{pk}'
+
+
+def product(pk):
+    return f'product:{pk}'
+
+
+def version_key(scope):
+    return f'catalog:version:{scope}'
+
+
+def get(*scopes):
+    """Текущие версии scopes в том же порядке"""
+    keys = [version_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        start = int(time.time() * 1000)
+        for key in missing:
+            cache.add(key, start, timeout=None)
+        found.update(cache.get_many(missing))
+    return tuple(found[key] for key in keys)
+
+
+def bump(*scopes):
+    """
+    Поднимает версии scopes (CATALOG — всегда) и возвращает новую версию
+    CATALOG. Ошибка кеша только логируется (возвращается None): сохранение
+    товара в админке из-за неё не падает.
+    """
+    scopes = {CATALOG, *scopes}
+    try:
+        get(*scopes)
+        return {scope: cache.incr(version_key(scope)) for scope in scopes}[CATALOG]
+    except Exception as e:
+        logger.warning(f"Не удалось обновить версии каталога {sorted(scopes)}: {e}")
+        return None
+
+
+def bump_categories(category_ids, *scopes):
+    """
+    Версии категорий category_ids и всех их предков (и scopes);
+    возвращает версию CATALOG
+    """
+    from catalog.models import Category
+
+    nodes = Category.objects.filter(pk__in=[pk for pk in category_ids if pk])
+    scopes = set(scopes)
+    for node in nodes:
+        scopes.update(
+            category(pk) for pk in node.get_ancestors(include_self=True).values_list('pk', flat=True)
+        )
+    return bump(*scopes)
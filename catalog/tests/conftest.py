@@ -0,0 +1,23 @@
+import pytest
+from django.core.cache import cache
+
+from catalog.services import product_index
+
+
+@pytest.fixture(autouse=True)
+def locmem_cache(settings):
+    """Кеш в памяти вместо Redis"""
+    settings.CACHES = {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+    }
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def reset_product_index():
+    """Индекс процесса переживает откат транзакции теста"""
+    product_index.index.invalidate()
+    yield
+    product_index.index.invalidate()
@@ -0,0 +1,111 @@
+from decimal import Decimal
+
+import pytest
+from django.test import override_settings
+from django.urls import reverse
+
+from catalog.models import Category, Product
+from catalog.services import pagination, product_index
+
+ORDERINGS = {
+    '':           ('-created_at', '-id'),
+    'newest':     ('-created_at', '-id'),
+    'price_asc':  ('price', 'id'),
+    'price_desc': ('-price', '-id'),
+    'name_asc':   ('name', 'id'),
+    'name_desc':  ('-name', '-id'),
+}
+
+
+@pytest.fixture
+def products():
+    """17 товаров с повторяющимися ценами и названиями"""
+    category = Category.objects.create(name='Тест', slug='test')
+    Category.objects.create(name='Пусто', slug='empty')
+    return [
+        Product.objects.create(
+            name=f'Товар {i % 4}', slug=f'p{i}', category=category,
+            price=Decimal('99.90') + i % 3, quantity=i % 2,
+        )
+        for i in range(17)
+    ]
+
+
+def walk(client, url, params):
+    ids, cursor, pages = [], None, []
+    while True:
+        data = client.get(url, {**params, **({'cursor': cursor} if cursor else {})}).json()
+        pages.append(data)
+        ids.extend(item['id'] for item in data['results'])
+        cursor = data['next_cursor']
+        if not cursor:
+            return ids, pages
+
+
+@pytest.mark.django_db
+def test_cursor_walk_follows_every_ordering(client, products):
+    url = reverse('catalog:category_products_api', args=['test'])
+    for sort_by, ordering in ORDERINGS.items():
+        ids, pages = walk(client, url, {'sort_by': sort_by, 'page_size': 4})
+
+        assert ids == list(Product.objects.order_by(*ordering).values_list('pk', flat=True)), sort_by
+        assert [len(page['results']) for page in pages] == [4, 4, 4, 4, 1]
+        assert pages[0]['count'] == 17
+        assert pages[0]['price_range'] == {'min_price': '99.90', 'max_price': '101.90'}
+        assert all('count' not in page for page in pages[1:])
+
+
+@pytest.mark.django_db
+def test_cursor_is_stable_under_inserts(client, products):
+    url = reverse('catalog:products_api')
+    first = client.get(url, {'sort_by': 'price_asc', 'page_size': 5, 'in_stock': 'on'}).json()
+
+    # Новый товар встаёт до курсора — следующая страница не сдвигается
+    Product.objects.create(name='Дешёвый', slug='cheap', category=products[0].category, price=1, quantity=1)
+    second = client.get(url, {
+        'sort_by': 'price_asc', 'page_size': 5, 'in_stock': 'on', 'cursor': first['next_cursor'],
+    }).json()
+
+    expected = list(
+        Product.objects.filter(in_stock=True).exclude(slug='cheap')
+        .order_by('price', 'id').values_list('pk', flat=True)
+    )
+    assert [item['id'] for item in first['results'] + second['results']] == expected[:10]
+
+
+@pytest.mark.django_db
+def test_first_page_in_one_round_trip(client, products, django_assert_num_queries):
+    product_index.get_index()
+
+    # Товары страницы и prefetch атрибутов; число и цены — из индекса
+    with django_assert_num_queries(2):
+        data = client.get(reverse('catalog:products_api'), {'page_size': 3}).json()
+
+    assert data['count'] == 17
+    assert len(data['results']) == 3
+
+
+@pytest.mark.django_db
+def test_bad_cursor_and_filters(client, products):
+    url = reverse('catalog:products_api')
+    cursor = client.get(url, {'sort_by': 'name_asc', 'page_size': 2}).json()['next_cursor']
+
+    assert client.get(url, {'sort_by': 'price_asc', 'cursor': cursor}).status_code == 400
+    assert client.get(url, {'cursor': 'not-a-cursor'}).status_code == 400
+    assert client.get(url, {'min_price': 'дорого'}).status_code == 400
+    assert client.get(reverse('catalog:category_products_api', args=['empty'])).json()['results'] == []
+
+    with pytest.raises(ValueError):
+        pagination.decode_cursor(pagination.encode_cursor('name_asc', 'Товар', 'x'), 'name_asc')
+
+
+@pytest.mark.django_db
+@override_settings(CATALOG_MAX_PAGE_SIZE=5)
+def test_page_size_is_capped(client, products):
+    data = client.get(reverse('catalog:products_api'), {'page_size': 100000}).json()
+    assert (data['page_size'], len(data['results'])) == (5, 5)
+
+    response = client.get(reverse('catalog:index'), {'page_size': 'много'})
+    assert response.context['page_size'] == 5
+    response = client.get(reverse('catalog:index'), {'page_size': '-3'})
+    assert response.context['page_size'] == 1
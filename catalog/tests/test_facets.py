@@ -0,0 +1,123 @@
+import pytest
+from django.urls import reverse
+
+from catalog.models import Attribute, AttributeValue, Category, Product
+from catalog.services import facets
+
+
+def counts(facet_list):
+    return {facet['code']: {v['value']: v['count'] for v in facet['values']} for facet in facet_list}
+
+
+@pytest.fixture
+def catalog_data():
+    """
+    Одежда → Футболки
+    p1 Футболки: красный, S, в наличии; p2 Футболки: синий, M, нет в наличии;
+    p3 Одежда: красный, M; p4 — неактивен
+    """
+    clothes = Category.objects.create(name='Одежда', slug='clothes')
+    shirts = Category.objects.create(name='Футболки', slug='shirts', parent=clothes)
+
+    color = Attribute.objects.create(name='Цвет', code='color', order=1)
+    size = Attribute.objects.create(name='Размер', code='size', order=2)
+    Attribute.objects.create(name='Вес', code='weight', filter_type='range')
+    red = AttributeValue.objects.create(attribute=color, value='Красный', code='red')
+    blue = AttributeValue.objects.create(attribute=color, value='Синий', code='blue')
+    small = AttributeValue.objects.create(attribute=size, value='S', code='s', order=1)
+    medium = AttributeValue.objects.create(attribute=size, value='M', code='m', order=2)
+
+    def product(slug, category, price, quantity, *values, is_active=True):
+        item = Product.objects.create(
+            name=slug, slug=slug, category=category, price=price, quantity=quantity, is_active=is_active,
+        )
+        item.attributes.set(values)
+        return item
+
+    product('p1', shirts, 100, 5, red, small)
+    product('p2', shirts, 200, 0, blue, medium)
+    product('p3', clothes, 300, 1, red, medium)
+    product('p4', shirts, 400, 1, red, small, is_active=False)
+
+    return {
+        'clothes': Category.objects.get(pk=clothes.pk),
+        'shirts': Category.objects.get(pk=shirts.pk),
+        'color': color, 'size': size, 'red': red, 'blue': blue, 'small': small, 'medium': medium,
+    }
+
+
+@pytest.mark.django_db
+def test_subtree_facets_in_one_query(catalog_data, django_assert_num_queries):
+    with django_assert_num_queries(1):
+        result = facets.compute(catalog_data['clothes'])
+
+    assert [facet['code'] for facet in result] == ['color', 'size']
+    assert counts(result) == {
+        'color': {'Красный': 2, 'Синий': 1},
+        'size': {'S': 1, 'M': 2},
+    }
+    assert counts(facets.compute(catalog_data['shirts'])) == {
+        'color': {'Красный': 1, 'Синий': 1},
+        'size': {'S': 1, 'M': 1},
+    }
+
+
+@pytest.mark.django_db
+def test_counts_are_disjunctive(catalog_data):
+    color, red = catalog_data['color'], catalog_data['red']
+
+    result = facets.compute(catalog_data['clothes'], selected={color.id: [red.id]})
+    # Своя группа считается без своих отметок, остальные — с ними
+    assert counts(result) == {
+        'color': {'Красный': 2, 'Синий': 1},
+        'size': {'S': 1, 'M': 1},
+    }
+
+    result = facets.compute(
+        catalog_data['clothes'], in_stock=True, max_price=250,
+        selected={color.id: [red.id], catalog_data['size'].id: [catalog_data['medium'].id]},
+    )
+    assert counts(result) == {
+        'color': {'Красный': 0},
+        'size': {'S': 1},
+    }
+
+
+@pytest.mark.django_db
+def test_unfiltered_facets_cached_per_category_version(catalog_data, django_assert_num_queries):
+    clothes, shirts = catalog_data['clothes'], catalog_data['shirts']
+    facets.for_category(clothes)
+    facets.for_category(shirts)
+
+    with django_assert_num_queries(0):
+        facets.for_category(clothes)
+
+    # Товар в корне не меняет поддерево Футболок
+    Product.objects.get(slug='p3').attributes.add(catalog_data['small'])
+
+    with django_assert_num_queries(0):
+        facets.for_category(shirts)
+    assert counts(facets.for_category(clothes))['size'] == {'S': 2, 'M': 2}
+
+    # Товар в Футболках меняет и Футболки, и предка
+    item = Product.objects.get(slug='p2')
+    item.is_active = False
+    item.save()
+
+    assert counts(facets.for_category(shirts))['color'] == {'Красный': 1}
+    assert counts(facets.for_category(clothes))['color'] == {'Красный': 2}
+
+
+@pytest.mark.django_db
+def test_category_page_shows_counts(client, catalog_data):
+    response = client.get(
+        reverse('catalog:category_detail', args=['clothes']),
+        {'attr_color': catalog_data['red'].id},
+    )
+
+    assert response.status_code == 200
+    assert response.context['products'].paginator.count == 2
+    form = response.context['filter_form']
+    assert [label for _id, label in form.fields['attr_color'].choices] == ['Красный (2)', 'Синий (1)']
+    assert [label for _id, label in form.fields['attr_size'].choices] == ['S (1)', 'M (1)']
+    assert 'attr_weight' not in form.fields
@@ -0,0 +1,82 @@
+from decimal import Decimal
+from unittest.mock import patch
+
+import pytest
+from django.urls import reverse
+
+from catalog.models import Attribute, AttributeValue, Category, Product
+from catalog.services import product_index, results
+
+
+@pytest.fixture
+def catalog_data():
+    clothes = Category.objects.create(name='Одежда', slug='clothes')
+    color = Attribute.objects.create(name='Цвет', code='color')
+    red = AttributeValue.objects.create(attribute=color, value='Красный', code='red')
+    blue = AttributeValue.objects.create(attribute=color, value='Синий', code='blue')
+    for i in range(20):
+        item = Product.objects.create(
+            name=f'Товар {i}', slug=f'p{i}', category=clothes, price=100 + i * 10, quantity=i % 3,
+        )
+        item.attributes.set([red] if i % 2 else [blue])
+    return {'clothes': clothes, 'color': color, 'red': red, 'blue': blue}
+
+
+def page_ids(response):
+    return [product.pk for product in response.context['products']]
+
+
+@pytest.mark.django_db
+def test_canonical_key_ignores_order_format_and_page(catalog_data):
+    red, blue, color = catalog_data['red'], catalog_data['blue'], catalog_data['color']
+    a = results.canonical_filters(
+        {'min_price': Decimal('100.00'), 'max_price': None, 'in_stock': False, 'sort_by': '', 'category': None},
+        catalog_data['clothes'], {color.id: ['%d' % red.id, blue.id]},
+    )
+    b = results.canonical_filters(
+        {'sort_by': '', 'min_price': Decimal('100')},
+        catalog_data['clothes'], {color.id: [blue.id, red.id]},
+    )
+
+    assert a == b == {
+        'category': catalog_data['clothes'].pk,
+        'min_price': '100',
+        'attributes': {str(color.id): sorted([red.id, blue.id])},
+    }
+    assert results.results_key(a) == results.results_key(b)
+
+
+@pytest.mark.django_db
+def test_same_filters_reuse_cached_ids(client, catalog_data):
+    url = reverse('catalog:category_detail', args=['clothes'])
+    red = catalog_data['red'].id
+    first = client.get(f'{url}?attr_color={red}&min_price=150&sort_by=price_desc&page_size=3')
+
+    # Другой порядок параметров, другая страница и размер — без обращения к индексу
+    with patch.object(product_index, 'get_index', side_effect=AssertionError('кеш не сработал')):
+        second = client.get(f'{url}?sort_by=price_desc&page=2&min_price=150.00&page_size=4&attr_color={red}')
+
+    expected = list(
+        Product.objects.filter(attributes=red, price__gte=150).order_by('-price', '-id').values_list('pk', flat=True)
+    )
+    assert page_ids(first) == expected[:3]
+    assert page_ids(second) == expected[4:8]
+    assert second.context['paginator'].count == len(expected)
+    assert second.context['price_range'] == {'min_price': Decimal('150'), 'max_price': Decimal('290')}
+
+
+@pytest.mark.django_db
+def test_catalog_writes_invalidate_results(client, catalog_data):
+    url = reverse('catalog:index')
+    assert client.get(url, {'in_stock': 'on'}).context['paginator'].count == 13
+
+    item = Product.objects.get(slug='p0')
+    item.quantity = 5
+    item.save()
+    assert client.get(url, {'in_stock': 'on'}).context['paginator'].count == 14
+
+    catalog_data['clothes'].is_active = True
+    catalog_data['clothes'].save()
+    with patch.object(product_index, 'get_index', side_effect=AssertionError('запись категории')):
+        with pytest.raises(AssertionError):
+            client.get(url, {'in_stock': 'on'})
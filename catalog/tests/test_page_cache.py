@@ -0,0 +1,107 @@
+from decimal import Decimal
+
+import pytest
+from django.urls import reverse
+
+from catalog.models import Category, Product
+
+
+@pytest.fixture
+def catalog_data():
+    """Одежда: a, b; Обувь: d"""
+    clothes = Category.objects.create(name='Одежда', slug='clothes')
+    shoes = Category.objects.create(name='Обувь', slug='shoes')
+
+    def product(slug, category):
+        return Product.objects.create(name=slug, slug=slug, category=category, price=100, quantity=1)
+
+    return {
+        'clothes': clothes, 'shoes': shoes,
+        'a': product('a', clothes), 'b': product('b', clothes), 'd': product('d', shoes),
+    }
+
+
+def product_url(slug):
+    return reverse('catalog:product_detail', args=[slug])
+
+
+def is_hit(client, url):
+    """Ответ из кеша страниц: view не вызывался, контекста нет"""
+    response = client.get(url)
+    assert response.status_code == 200
+    return response.context is None
+
+
+@pytest.mark.django_db
+def test_anonymous_page_served_from_cache(client, catalog_data, django_assert_num_queries):
+    url = product_url('a')
+    first = client.get(url)
+    assert first.context is not None
+
+    with django_assert_num_queries(0):
+        second = client.get(url)
+
+    assert second.content == first.content
+    assert second['ETag'] == first['ETag']
+    assert second['Last-Modified'] == first['Last-Modified']
+
+
+@pytest.mark.django_db
+def test_conditional_requests(client, catalog_data):
+    url = reverse('catalog:category_detail', args=['clothes'])
+    response = client.get(url)
+
+    assert client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code == 304
+    assert client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code == 304
+
+    item = catalog_data['b']
+    item.price = Decimal('90')
+    item.save()
+    changed = client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+    assert changed.status_code == 200
+    assert changed['ETag'] != response['ETag']
+
+
+@pytest.mark.django_db
+def test_product_save_invalidates_only_pages_showing_it(client, catalog_data):
+    urls = {
+        'a': product_url('a'),
+        'd': product_url('d'),
+        'shoes': reverse('catalog:category_detail', args=['shoes']),
+        'clothes': reverse('catalog:category_detail', args=['clothes']),
+    }
+    for url in urls.values():
+        client.get(url)
+
+    item = catalog_data['d']
+    item.price = Decimal('150')
+    item.save()
+
+    assert not is_hit(client, urls['d'])
+    assert not is_hit(client, urls['shoes'])
+    assert is_hit(client, urls['a'])
+    assert is_hit(client, urls['clothes'])
+
+    # b показан на странице a среди похожих
+    item = catalog_data['b']
+    item.name = 'b2'
+    item.save()
+    assert not is_hit(client, urls['a'])
+    assert is_hit(client, urls['d'])
+
+    # Новый товар в Одежде может попасть в похожие у a
+    Product.objects.create(name='c', slug='c', category=catalog_data['clothes'], price=1)
+    assert not is_hit(client, urls['a'])
+    assert is_hit(client, urls['d'])
+
+
+@pytest.mark.django_db
+def test_authenticated_users_bypass_cache(client, catalog_data, create_partner):
+    url = product_url('a')
+    client.get(url)
+
+    client.force_login(create_partner())
+    response = client.get(url)
+
+    assert response.context is not None
+    assert not response.has_header('ETag')
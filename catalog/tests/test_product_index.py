@@ -0,0 +1,147 @@
+from decimal import Decimal
+
+import pytest
+from django.urls import reverse
+
+from catalog.models import Attribute, AttributeValue, Category, Product
+from catalog.services import product_index, versions
+
+
+@pytest.fixture
+def catalog_data():
+    """Одежда → (Футболки, Куртки); цвет и размер у части товаров"""
+    clothes = Category.objects.create(name='Одежда', slug='clothes')
+    shirts = Category.objects.create(name='Футболки', slug='shirts', parent=clothes)
+    jackets = Category.objects.create(name='Куртки', slug='jackets', parent=clothes)
+
+    color = Attribute.objects.create(name='Цвет', code='color')
+    size = Attribute.objects.create(name='Размер', code='size')
+    red = AttributeValue.objects.create(attribute=color, value='Красный', code='red')
+    blue = AttributeValue.objects.create(attribute=color, value='Синий', code='blue')
+    small = AttributeValue.objects.create(attribute=size, value='S', code='s')
+
+    categories = [shirts, jackets, clothes]
+    for i in range(30):
+        item = Product.objects.create(
+            name=f'Товар {i % 7}', slug=f'p{i}', category=categories[i % 3],
+            price=Decimal('10.50') * (i % 5 + 1), quantity=i % 4, is_active=i % 10 != 9,
+        )
+        item.attributes.set([[red], [blue], [red, small], []][i % 4])
+
+    return {'clothes': clothes, 'shirts': shirts, 'jackets': jackets,
+            'color': color, 'size': size, 'red': red, 'blue': blue, 'small': small}
+
+
+ORDERINGS = {
+    '':           ('-created_at', '-id'),
+    'price_asc':  ('price', 'id'),
+    'price_desc': ('-price', '-id'),
+    'name_asc':   ('name', 'id'),
+    'name_desc':  ('-name', '-id'),
+}
+
+
+def expected(category=None, min_price=None, max_price=None, in_stock=False, selected=None, sort_by=''):
+    products = Product.objects.filter(is_active=True)
+    if category:
+        products = products.filter(category__in=category.get_descendants(include_self=True))
+    if min_price:
+        products = products.filter(price__gte=min_price)
+    if max_price:
+        products = products.filter(price__lte=max_price)
+    if in_stock:
+        products = products.filter(in_stock=True)
+    for value_ids in (selected or {}).values():
+        products = products.filter(attributes__id__in=value_ids)
+    return list(products.distinct().order_by(*ORDERINGS[sort_by]).values_list('pk', flat=True))
+
+
+def found(category=None, sort_by='', **filters):
+    index = product_index.get_index()
+    bits = index.match(category_id=category.pk if category else None, **filters)
+    return index.select(bits, sort_by)[0]
+
+
+@pytest.mark.django_db
+def test_index_matches_database(catalog_data):
+    red, blue, small = catalog_data['red'], catalog_data['blue'], catalog_data['small']
+    color, size = catalog_data['color'], catalog_data['size']
+    cases = [
+        {},
+        {'category': catalog_data['clothes']},
+        {'category': catalog_data['shirts'], 'in_stock': True},
+        {'min_price': Decimal('21.00'), 'max_price': Decimal('42.00')},
+        {'selected': {color.id: [red.id, blue.id]}},
+        {'category': catalog_data['jackets'], 'selected': {color.id: [red.id], size.id: [small.id]}},
+        {'max_price': Decimal('10.50'), 'in_stock': True, 'selected': {color.id: [blue.id]}},
+    ]
+    for filters in cases:
+        for sort_by in ORDERINGS:
+            assert found(sort_by=sort_by, **filters) == expected(sort_by=sort_by, **filters), (filters, sort_by)
+
+    index = product_index.get_index()
+    _ids, price_range = index.select(index.match(category_id=catalog_data['shirts'].pk))
+    assert price_range == {'min_price': Decimal('10.50'), 'max_price': Decimal('52.50')}
+
+
+@pytest.mark.django_db
+def test_signals_update_index_incrementally(catalog_data):
+    index = product_index.get_index()
+    built_at = index.version
+    color, red = catalog_data['color'], catalog_data['red']
+
+    item = Product.objects.get(slug='p1')
+    item.price = Decimal('999.99')
+    item.category = catalog_data['shirts']
+    item.save()
+    Product.objects.get(slug='p2').attributes.remove(red)
+    catalog_data['red'].products.add(Product.objects.get(slug='p5'))
+    Product.objects.get(slug='p3').attributes.clear()
+    hidden = Product.objects.get(slug='p4')
+    hidden.is_active = False
+    hidden.save()
+    Product.objects.get(slug='p6').delete()
+    new = Product.objects.create(name='Новый', slug='new', category=catalog_data['jackets'], price=1, quantity=1)
+    new.attributes.add(red)
+
+    assert product_index.get_index() is index
+    assert index.version == built_at + 8 and not index.stale
+
+    for filters in [{}, {'category': catalog_data['shirts']}, {'selected': {color.id: [red.id]}},
+                    {'min_price': Decimal('500')}, {'category': catalog_data['jackets'], 'in_stock': True}]:
+        for sort_by in ORDERINGS:
+            assert found(sort_by=sort_by, **filters) == expected(sort_by=sort_by, **filters), (filters, sort_by)
+
+
+@pytest.mark.django_db
+def test_foreign_write_triggers_rebuild(catalog_data, django_assert_num_queries):
+    index = product_index.get_index()
+    Product.objects.filter(slug='p0').update(is_active=False)
+
+    with django_assert_num_queries(0):
+        assert product_index.get_index().version == index.version
+
+    # Другой процесс изменил каталог — версия разошлась
+    versions.bump()
+    product_index.get_index()
+    assert found() == expected()
+
+
+@pytest.mark.django_db
+def test_category_page_filters_by_index(client, catalog_data):
+    color, size = catalog_data['color'], catalog_data['size']
+    product_index.get_index()
+    params = {
+        'attr_color': [catalog_data['red'].id, catalog_data['blue'].id],
+        'attr_size': catalog_data['small'].id,
+        'sort_by': 'price_desc',
+        'page_size': 2,
+    }
+
+    response = client.get(reverse('catalog:category_detail', args=['clothes']), params)
+
+    selected = {color.id: [catalog_data['red'].id, catalog_data['blue'].id], size.id: [catalog_data['small'].id]}
+    ids = expected(category=catalog_data['clothes'], selected=selected, sort_by='price_desc')
+    page = response.context['products']
+    assert page.paginator.count == len(ids)
+    assert [product.pk for product in page] == ids[:2]
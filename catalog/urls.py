@@ -12,4 +12,8 @@ urlpatterns = [
 
     # Страница товара
     path('product/<slug:slug>/', views.product_detail, name='product_detail'),
+
+    # Товары по курсору для бесконечной прокрутки и API
+    path('api/products/', views.products_api, name='products_api'),
+    path('api/category/<slug:slug>/products/', views.category_products_api, name='category_products_api'),
 ]
\ No newline at end of file
@@ -1,54 +1,48 @@
 # catalog/views.py
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, render
-from django.db.models import Q, Min, Max
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from .forms import ProductFilterForm, CategoryFilterForm  # Добавьте этот импорт
 from .models import Category, Product
+from .services import facets, page_cache, pagination, product_index, results, versions
+
+
+def _match(filter_form, category=None):
+    """
+    Множество товаров по форме фильтров — из индекса товаров в памяти.
+    Невалидная форма — без фильтров. Возвращает (индекс, множество, cleaned_data).
+    """
+    filters = filter_form.cleaned_data if filter_form.is_valid() else {}
+    category = category or filters.get('category')
+
+    products_index = product_index.get_index()
+    matched = products_index.match(
+        category_id=category.pk if category else None,
+        min_price=filters.get('min_price'),
+        max_price=filters.get('max_price'),
+        in_stock=filters.get('in_stock'),
+        selected=filter_form.selected_attributes() if filters else {},
+    )
+    return products_index, matched, filters
+
+
+def _filtered(filter_form, category=None):
+    """
+    Товары по форме фильтров через кеш результатов: одинаковые фильтры с
+    любой страницы и в любом порядке параметров берут один список pk.
+    Возвращает (pk по порядку, диапазон цен, cleaned_data).
+    """
+    filters = filter_form.cleaned_data if filter_form.is_valid() else {}
+    product_ids, price_range = results.get_results(
+        filters, category, filter_form.selected_attributes() if filters else {},
+    )
+    return product_ids, price_range, filters
 
 
-def index(request):
-    """Главная страница каталога со всеми товарами"""
-    products = Product.objects.filter(is_active=True).select_related('category')
-
-    # Форма фильтрации
-    filter_form = ProductFilterForm(request.GET)
-
-    if filter_form.is_valid():
-        # Фильтр по категории
-        category = filter_form.cleaned_data.get('category')
-        if category:
-            descendants = category.get_descendants(include_self=True)
-            products = products.filter(category__in=descendants)
-
-        # Фильтр по цене
-        min_price = filter_form.cleaned_data.get('min_price')
-        max_price = filter_form.cleaned_data.get('max_price')
-
-        if min_price:
-            products = products.filter(price__gte=min_price)
-        if max_price:
-            products = products.filter(price__lte=max_price)
-
-        # Фильтр по наличию
-        if filter_form.cleaned_data.get('in_stock'):
-            products = products.filter(in_stock=True)
-
-        # Сортировка
-        sort_by = filter_form.cleaned_data.get('sort_by')
-        if sort_by == 'price_asc':
-            products = products.order_by('price')
-        elif sort_by == 'price_desc':
-            products = products.order_by('-price')
-        elif sort_by == 'name_asc':
-            products = products.order_by('name')
-        elif sort_by == 'name_desc':
-            products = products.order_by('-name')
-        elif sort_by == 'newest':
-            products = products.order_by('-created_at')
-
-    # Пагинация
-    page_size = request.GET.get('page_size', 12)
-    paginator = Paginator(products, page_size)
+def _paginate(request, product_ids):
+    """Номерная страница — срез списка pk, из базы загружается только она сама"""
+    page_size = pagination.page_size(request.GET.get('page_size'))
+    paginator = Paginator(product_ids, page_size)
     page = request.GET.get('page')
 
     try:
@@ -58,10 +52,25 @@ def index(request):
     except EmptyPage:
         products_page = paginator.page(paginator.num_pages)
 
-    # Диапазон цен для отображения
-    price_range = products.aggregate(
-        min_price=Min('price'),
-        max_price=Max('price')
+    products_page.object_list = product_index.hydrate(products_page.object_list)
+    return products_page, paginator, page_size
+
+
+@page_cache.cache_anonymous_page
+def index(request):
+    """Главная страница каталога со всеми товарами"""
+    # Форма фильтрации
+    filter_form = ProductFilterForm(request.GET)
+    product_ids, price_range, filters = _filtered(filter_form)
+
+    # Пагинация
+    products_page, paginator, page_size = _paginate(request, product_ids)
+
+    category = filters.get('category')
+    page_cache.tag(
+        request,
+        [versions.SCHEMA, versions.category(category.pk) if category else versions.CATALOG],
+        [product.updated_at for product in products_page] + [category.updated_at if category else None],
     )
 
     context = {
@@ -69,74 +78,40 @@ def index(request):
         'products': products_page,
         'filter_form': filter_form,
         'price_range': price_range,
-        'page_size': int(page_size),
+        'page_size': page_size,
         'paginator': paginator,
     }
     return render(request, 'catalog/index.html', context)
 
 
+@page_cache.cache_anonymous_page
 def category_detail(request, slug):
     """Детальная страница категории"""
     category = get_object_or_404(Category, slug=slug)
 
-    # Получаем товары категории и подкатегорий
-    descendants = category.get_descendants(include_self=True)
-    products = Product.objects.filter(
-        category__in=descendants,
-        is_active=True
-    ).select_related('category').prefetch_related('attributes')
-
     # Форма фильтрации для категории
     filter_form = CategoryFilterForm(request.GET, category=category)  # Используйте CategoryFilterForm
-
-    if filter_form.is_valid():
-        # Фильтр по цене
-        min_price = filter_form.cleaned_data.get('min_price')
-        max_price = filter_form.cleaned_data.get('max_price')
-
-        if min_price:
-            products = products.filter(price__gte=min_price)
-        if max_price:
-            products = products.filter(price__lte=max_price)
-
-        # Фильтр по наличию
-        if filter_form.cleaned_data.get('in_stock'):
-            products = products.filter(in_stock=True)
-
-        # Фильтр по атрибутам
-        for field_name, value in filter_form.cleaned_data.items():
-            if field_name.startswith('attr_') and value:
-                products = products.filter(attributes__id__in=value).distinct()
-
-        # Сортировка
-        sort_by = filter_form.cleaned_data.get('sort_by')
-        if sort_by == 'price_asc':
-            products = products.order_by('price')
-        elif sort_by == 'price_desc':
-            products = products.order_by('-price')
-        elif sort_by == 'name_asc':
-            products = products.order_by('name')
-        elif sort_by == 'name_desc':
-            products = products.order_by('-name')
-        elif sort_by == 'newest':
-            products = products.order_by('-created_at')
+    product_ids, price_range, filters = _filtered(filter_form, category)
+
+    if filters:
+        # Числа у значений атрибутов с учётом остальных фильтров
+        filter_form.apply_facets(facets.for_category(
+            category,
+            min_price=filters.get('min_price'),
+            max_price=filters.get('max_price'),
+            in_stock=filters.get('in_stock'),
+            selected=filter_form.selected_attributes(),
+        ))
 
     # Пагинация
-    page_size = request.GET.get('page_size', 12)
-    paginator = Paginator(products, page_size)
-    page = request.GET.get('page')
-
-    try:
-        products_page = paginator.page(page)
-    except PageNotAnInteger:
-        products_page = paginator.page(1)
-    except EmptyPage:
-        products_page = paginator.page(paginator.num_pages)
-
-    # Диапазон цен для отображения
-    price_range = products.aggregate(
-        min_price=Min('price'),
-        max_price=Max('price')
+    products_page, paginator, page_size = _paginate(request, product_ids)
+    subcategories = list(category.get_children().filter(is_active=True))
+
+    page_cache.tag(
+        request,
+        [versions.SCHEMA, versions.category(category.pk)],
+        [category.updated_at, *(child.updated_at for child in subcategories),
+         *(product.updated_at for product in products_page)],
     )
 
     context = {
@@ -144,13 +119,76 @@ def category_detail(request, slug):
         'products': products_page,
         'filter_form': filter_form,
         'price_range': price_range,
-        'page_size': int(page_size),
+        'page_size': page_size,
         'paginator': paginator,
-        'subcategories': category.get_children().filter(is_active=True),
+        'subcategories': subcategories,
     }
     return render(request, 'catalog/category_detail.html', context)
 
 
+def _product_json(product):
+    return {
+        'id':                product.pk,
+        'name':              product.name,
+        'slug':              product.slug,
+        'url':               product.get_absolute_url(),
+        'category':          product.category.slug,
+        'price':             str(product.price),
+        'old_price':         str(product.old_price) if product.has_discount else None,
+        'in_stock':          product.in_stock,
+        'short_description': product.short_description,
+    }
+
+
+def _cursor_page(request, filter_form, category=None):
+    """
+    Страница по курсору для бесконечной прокрутки и API: ?cursor= из
+    next_cursor прошлого ответа. Первая страница (без курсора) сразу
+    содержит count и price_range — всё за один проход по индексу.
+    """
+    if not filter_form.is_valid():
+        return JsonResponse({'error': True, 'message': 'Некорректные фильтры', 'errors': filter_form.errors}, status=400)
+
+    products_index, matched, filters = _match(filter_form, category)
+    sort_by = filters.get('sort_by') or ''
+    page_size = pagination.page_size(request.GET.get('page_size'))
+
+    after = None
+    token = request.GET.get('cursor')
+    if token:
+        try:
+            after = pagination.decode_cursor(token, sort_by)
+        except ValueError:
+            return JsonResponse({'error': True, 'message': 'Некорректный курсор'}, status=400)
+
+    page = products_index.seek(matched, sort_by, after=after, limit=page_size, with_totals=after is None)
+    payload = {
+        'results':     [_product_json(product) for product in product_index.hydrate(page['ids'])],
+        'next_cursor': pagination.encode_cursor(sort_by, *page['next']) if page['next'] else None,
+        'page_size':   page_size,
+        'sort_by':     sort_by,
+    }
+    if after is None:
+        payload['count'] = page['count']
+        payload['price_range'] = {
+            name: str(value) if value is not None else None
+            for name, value in page['price_range'].items()
+        }
+    return JsonResponse(payload)
+
+
+def products_api(request):
+    """Товары каталога по курсору (фильтры — как на главной)"""
+    return _cursor_page(request, ProductFilterForm(request.GET))
+
+
+def category_products_api(request, slug):
+    """Товары категории по курсору (фильтры — как на странице категории)"""
+    category = get_object_or_404(Category, slug=slug)
+    return _cursor_page(request, CategoryFilterForm(request.GET, category=category), category)
+
+
+@page_cache.cache_anonymous_page
 def product_detail(request, slug):
     """Детальная страница товара"""
     product = get_object_or_404(
@@ -165,6 +203,14 @@ def product_detail(request, slug):
         is_active=True
     ).exclude(id=product.id)[:4]
 
+    # Страница меняется с самим товаром, показанными похожими и составом категории
+    page_cache.tag(
+        request,
+        [versions.SCHEMA, versions.members(product.category_id), versions.product(product.pk),
+         *(versions.product(related.pk) for related in related_products)],
+        [product.updated_at, product.category.updated_at, *(related.updated_at for related in related_products)],
+    )
+
     context = {
         'product': product,
         'related_products': related_products,
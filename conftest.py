@@ -0,0 +1,39 @@
+import pytest
+from django.conf import settings
+
+from accounts.models import CustomUser
+
+
+def pytest_configure(config):
+    """Задачи Celery в тестах выполняются сразу, в процессе теста"""
+    settings.CELERY_TASK_ALWAYS_EAGER = True
+
+
+@pytest.fixture
+def create_partner(db):
+    """Фабрика партнёров: create_partner(referrer=None, **поля)"""
+    def create(referrer=None, **fields):
+        return CustomUser.objects.create(
+            phone='+998901234567',
+            country='Узбекистан',
+            referrer=referrer,
+            **fields,
+        )
+
+    return create
+
+
+@pytest.fixture
+def reload():
+    """Свежая копия пользователя из базы"""
+    return lambda user: CustomUser.objects.get(pk=user.pk)
+
+
+@pytest.fixture
+def network(create_partner):
+    """root → (a → c, b)"""
+    root = create_partner()
+    a = create_partner(referrer=root)
+    b = create_partner(referrer=root)
+    c = create_partner(referrer=a)
+    return {'root': root, 'a': a, 'b': b, 'c': c}
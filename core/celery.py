@@ -1,6 +1,7 @@
 import os
 from celery import Celery
 from celery.schedules import crontab
+from django.conf import settings
 
 # Устанавливаем переменную окружения для настроек Django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
@@ -24,6 +25,14 @@ app.conf.beat_schedule = {
         'task': 'accounts.tasks.send_daily_stats',
         'schedule': crontab(hour=9, minute=0),  # Каждый день в 9:00
     },
+    'reconcile-structure-with-fastapi': {
+        'task': 'cabinet.tasks.reconcile_structure',
+        'schedule': crontab(hour=4, minute=0),  # Каждый день в 4:00
+    },
+    'refresh-referral-forest-snapshot': {
+        'task': 'cabinet.tasks.refresh_referral_forest_snapshot',
+        'schedule': settings.REFERRAL_FOREST_SNAPSHOT_INTERVAL,  # Общий снимок структуры
+    },
 }
 
 @app.task(bind=True)
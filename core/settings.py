@@ -154,7 +154,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'accounts.CustomUser'
 
 # Celery настройки
-CELERY_BROKER_URL = 'redis://localhost:6379/0'
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = 'django-db'  # Используем базу данных Django для хранения результатов
 CELERY_CACHE_BACKEND = 'default'
 CELERY_ACCEPT_CONTENT = ['json']
@@ -182,6 +182,41 @@ DEFAULT_FROM_EMAIL = 'noreply@everon.ru'
 
 ITEMS_PER_PAGE = 12
 
+# Ограничения загрузки дерева рефералов (cabinet.services.referral_tree)
+REFERRAL_TREE_MAX_DEPTH = 50
+REFERRAL_TREE_MAX_NODES = 50000
+
+# Ленивое раскрытие графа структуры (cabinet.views.referral_children_api):
+# размер страницы прямых рефералов и с какого размера структуры граф
+# грузится по клику, а не целиком
+REFERRAL_CHILDREN_PAGE_SIZE = 50
+REFERRAL_CHILDREN_MAX_PAGE_SIZE = 200
+REFERRAL_TREE_LAZY_THRESHOLD = 1000
+
+# Серверная раскладка графа (cabinet.services.tree_layout): поддеревья
+# больше порога сворачиваются в кластер, раскладка кешируется по форме дерева
+REFERRAL_TREE_CLUSTER_THRESHOLD = 200
+REFERRAL_LAYOUT_CACHE_TTL = 60 * 60
+
+# Снимки отданных версий дерева для ответов ?since= (cabinet.services.tree_version)
+REFERRAL_TREE_SNAPSHOT_TTL = 15 * 60
+
+# Общий снимок леса структуры в файле, отображаемом в память всеми процессами
+# (cabinet.services.forest_snapshot): пересобирается задачей Celery раз в
+# REFERRAL_FOREST_SNAPSHOT_INTERVAL секунд, процессы проверяют замену файла
+# не чаще раза в REFERRAL_FOREST_SNAPSHOT_CHECK секунд
+REFERRAL_FOREST_SNAPSHOT_PATH = os.environ.get(
+    'REFERRAL_FOREST_SNAPSHOT_PATH', str(BASE_DIR / 'var' / 'referral_forest.snap')
+)
+REFERRAL_FOREST_SNAPSHOT_INTERVAL = 5 * 60
+REFERRAL_FOREST_SNAPSHOT_CHECK = 5
+
+# Лента событий структуры (cabinet.services.activity_feed): длина списка
+# на партнёра, срок жизни и на сколько уровней вверх расходится событие
+ACTIVITY_FEED_SIZE = 50
+ACTIVITY_FEED_TTL = 30 * 24 * 60 * 60
+ACTIVITY_FEED_MAX_UPLINE = REFERRAL_TREE_MAX_DEPTH
+
 
 CACHES = {
     'default': {
@@ -198,7 +233,76 @@ CACHES = {
 # URL FastAPI сервиса
 FASTAPI_SERVICE_URL = os.environ.get('FASTAPI_URL', "http://45.130.148.146:8001")
 
+FASTAPI_TIMEOUT = 5
+# Быстрый отказ при недоступном upstream: короткий connect-таймаут
+# и немного повторов с маленькой паузой вместо 3 повторов с backoff=1
+FASTAPI_CONNECT_TIMEOUT = 1
+FASTAPI_RETRIES = 1
+FASTAPI_RETRY_BACKOFF = 0.2
+
+# Circuit breaker (cabinet.services.circuit_breaker): после N ошибок за окно
+# запросы к FastAPI не отправляются RECOVERY_TIMEOUT секунд
+FASTAPI_CIRCUIT_FAILURE_THRESHOLD = 5
+FASTAPI_CIRCUIT_FAILURE_WINDOW = 30
+FASTAPI_CIRCUIT_RECOVERY_TIMEOUT = 30
+
+# Single-flight (cabinet.services.single_flight): блокировка ключа на время
+# запроса к FastAPI, сколько ждать чужой запрос и сколько хранить его результат
+FASTAPI_SINGLE_FLIGHT_LOCK = 10
+FASTAPI_SINGLE_FLIGHT_WAIT = 6
+FASTAPI_SINGLE_FLIGHT_RESULT_TTL = 5
+
+# Общий httpx.AsyncClient асинхронных прокси-views (на каждый ASGI-воркер)
+FASTAPI_ASYNC_MAX_CONNECTIONS = 200
+FASTAPI_ASYNC_MAX_KEEPALIVE = 50
+
+# Массовое получение статусов (FastAPIService.get_users_status_bulk)
+FASTAPI_STATUS_BATCH_SIZE = 200
+FASTAPI_STATUS_CONCURRENCY = 10
+# Сколько секунд помнить, что upstream не поддерживает пакетный /status/batch
+FASTAPI_BATCH_SUPPORT_TTL = 10 * 60
+
+# Обход глубоких уровней структуры (cabinet.services.structure_bfs):
+# параллельных запросов /structure, бюджет узлов и секунд на ответ
+REFERRALS_BFS_CONCURRENCY = 20
+REFERRALS_BFS_REQUEST_TIMEOUT = 3
+REFERRALS_BFS_MAX_NODES = 5000
+REFERRALS_BFS_TIME_BUDGET = 10
+
+# Кеш статусов (cabinet.services.status_cache): свежесть, срок хранения
+# последнего известного значения и блокировка повторного фонового обновления
+USER_STATUS_CACHE_SOFT_TTL = 60
+USER_STATUS_CACHE_TTL = 60 * 60 * 24 * 7
+USER_STATUS_CACHE_REFRESH_LOCK = 30
+
+# Фоновое сохранение месячного отчёта (cabinet.services.monthly_report):
+# размер пачки, попыток на пользователя, время одной задачи до перезапуска
+# и через сколько секунд без прогресса задачу можно перезапустить
+MONTHLY_REPORT_CHUNK_SIZE = 200
+MONTHLY_REPORT_MAX_ATTEMPTS = 3
+MONTHLY_REPORT_TASK_BUDGET = 60
+MONTHLY_REPORT_JOB_STALE = 5 * 60
+
+# Фасеты фильтра категории без фильтров (catalog.services.facets): ключ
+# меняется вместе с версией поддерева, TTL лишь вытесняет старые версии
+CATALOG_FACETS_TTL = 60 * 60 * 24
+
+# Предел ?page_size= страниц каталога (по умолчанию — ITEMS_PER_PAGE)
+CATALOG_MAX_PAGE_SIZE = 100
+
+# Кеш результатов фильтра каталога (catalog.services.results): ключ меняется
+# с версией каталога, TTL лишь вытесняет старые версии и редкие фильтры
+CATALOG_RESULTS_TTL = 10 * 60
+
+# Кеш страниц каталога для анонимов (catalog.services.page_cache): запись
+# сверяется с версиями тегов при каждом чтении, TTL лишь вытесняет старые
+CATALOG_PAGE_CACHE_TTL = 60 * 60
+
 CELERY_TASK_MAX_RETRIES = 3
-CELERY_TASK_ALWAYS_EAGER = True
+# Синхронное выполнение задач в процессе запроса — только по переменной
+# окружения (отладка без воркера); тесты включают его в conftest.py.
+# Иначе фоновые задачи (месячный отчёт, обновление статусов) выполнялись
+# бы внутри запроса, который их поставил
+CELERY_TASK_ALWAYS_EAGER = os.environ.get('CELERY_TASK_ALWAYS_EAGER') == '1'
 
 FASTAPI_BASE_URL="http://45.130.148.146:8001"
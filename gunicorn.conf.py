@@ -1,4 +1,7 @@
 bind = "0.0.0.0:8000"
 workers = 3
+# ASGI (core.asgi): async-views кабинета держат upstream-запросы к FastAPI
+# без блокировки воркера
+worker_class = "uvicorn_worker.UvicornWorker"
 timeout = 120
 keepalive = 5